@@ -1,9 +1,22 @@
-from flask import Blueprint, json
+import click
+from flask import Blueprint, json, current_app
 from flask_restful import Api
+from sqlalchemy import inspect, text
 from werkzeug.exceptions import HTTPException
 
 from api.controllers import Patients, PatientAction, Doctors, DoctorAction, Services, ServiceAction, Records, \
-    RecordAction, UserSignUp, UserLogIn, Main, UserLogOut
+    RecordAction, UserSignUp, UserLogIn, Main, UserLogOut, PatientsBatch, DoctorsBatch, ServicesBatch, RecordsBatch, \
+    ServiceRecords, ServicesRevenue, PatientRecords, DoctorRecords, HealthReports, StatsCases, StatsRevenue, \
+    StatsUnpaid, StatsHealth, Jobs, JobAction, JobResult, Export, Import, \
+    Locations, LocationAction, Neighbours, Search, Trends, TrendSeries
+from api.cache import response_cache
+from api.imports import IMPORTS, READERS, detect_format, import_file
+from api.jobs import recover_jobs, run_workers
+from api.records import migrate_used_services
+from api.search import create_search_index
+from api.writebehind import recover_log
+from api.stats import rebuild_stats
+from extensions import db
 
 api_bp = Blueprint("api", __name__, template_folder='templates', static_folder='static')
 api_urls = Api(api_bp)
@@ -15,16 +28,162 @@ api_urls.add_resource(Main, "")
 api_urls.add_resource(UserSignUp, "/signup")
 api_urls.add_resource(UserLogIn, "/login")
 api_urls.add_resource(Patients, "/patients")
+api_urls.add_resource(PatientsBatch, "/patients:batch")
 api_urls.add_resource(PatientAction, "/patients/<uuid:patient_uuid>",
                       endpoint="patient_info")
+api_urls.add_resource(PatientRecords, "/patients/<uuid:patient_uuid>/records")
 api_urls.add_resource(Doctors, "/doctors")
+api_urls.add_resource(DoctorsBatch, "/doctors:batch")
 api_urls.add_resource(DoctorAction, "/doctors/<uuid:doctor_uuid>",
                       endpoint="doctor_info")
+api_urls.add_resource(DoctorRecords, "/doctors/<uuid:doctor_uuid>/records")
 api_urls.add_resource(Services, "/services")
+api_urls.add_resource(ServicesBatch, "/services:batch")
+api_urls.add_resource(ServicesRevenue, "/services/revenue")
 api_urls.add_resource(ServiceAction, "/services/<uuid:service_uuid>")
+api_urls.add_resource(ServiceRecords, "/services/<uuid:service_uuid>/records")
 api_urls.add_resource(Records, "/records")
+api_urls.add_resource(RecordsBatch, "/records:batch")
 api_urls.add_resource(RecordAction, "/records/<uuid:record_uuid>",
                       endpoint="record_info")
+api_urls.add_resource(HealthReports, "/health")
+api_urls.add_resource(StatsCases, "/stats/cases")
+api_urls.add_resource(StatsRevenue, "/stats/revenue")
+api_urls.add_resource(StatsUnpaid, "/stats/unpaid")
+api_urls.add_resource(StatsHealth, "/stats/health")
+api_urls.add_resource(Trends, "/trends")
+api_urls.add_resource(TrendSeries, "/trends/series")
+api_urls.add_resource(Jobs, "/jobs")
+api_urls.add_resource(JobAction, "/jobs/<uuid:job_uuid>", endpoint="job_info")
+api_urls.add_resource(JobResult, "/jobs/<uuid:job_uuid>/result")
+api_urls.add_resource(Export, "/export/<string:resource>")
+api_urls.add_resource(Import, "/import/<string:resource>")
+api_urls.add_resource(Locations, "/locations")
+api_urls.add_resource(LocationAction, "/locations/<uuid:location_uuid>",
+                      endpoint="location_info")
+api_urls.add_resource(Neighbours, "/neighbours")
+api_urls.add_resource(Search, "/search")
+
+
+
+@api_bp.cli.command("migrate-used-services")
+@click.option("--recompute-sums", is_flag=True, help="Пересчитать Record.sum по ценам услуг")
+def migrate_used_services_command(recompute_sums):
+    """Перенести Record.used_services в таблицу record_services"""
+    db.create_all()
+    processed, unresolved = migrate_used_services(recompute_sums=recompute_sums)
+    click.echo("Migrated {} records".format(processed))
+    for record_uuid, missing in unresolved:
+        click.echo("Record {}: unknown services {}".format(record_uuid, ", ".join(missing)))
+    if recompute_sums:
+        rebuild_stats()
+    response_cache.invalidate("records", "services", "stats")
+
+
+@api_bp.cli.command("rebuild-stats")
+def rebuild_stats_command():
+    """Пересчитать агрегаты статистики по всей базе"""
+    db.create_all()
+    rebuild_stats()
+    response_cache.invalidate("stats")
+    click.echo("Statistics rebuilt")
+
+
+@api_bp.cli.command("add-version-columns")
+def add_version_columns_command():
+    """Добавить колонку version в таблицы существующей базы"""
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if "version" not in table.c or not inspector.has_table(table.name):
+            continue
+        if "version" in {column["name"] for column in inspector.get_columns(table.name)}:
+            continue
+        db.session.execute(text("ALTER TABLE {} ADD COLUMN version INTEGER NOT NULL DEFAULT 1"
+                                .format(table.name)))
+        click.echo("Added {}.version".format(table.name))
+    db.session.commit()
+
+
+@api_bp.cli.command("add-region-column")
+def add_region_column_command():
+    """Добавить колонку record.region в существующую базу и пересчитать ряды"""
+    db.create_all()
+    if "region" not in {column["name"] for column in inspect(db.engine).get_columns("record")}:
+        db.session.execute(text("ALTER TABLE record ADD COLUMN region VARCHAR(100)"))
+        db.session.commit()
+        click.echo("Added record.region")
+    rebuild_stats()
+    response_cache.invalidate("stats")
+    click.echo("Statistics rebuilt")
+
+
+@api_bp.cli.command("create-indexes")
+def create_indexes_command():
+    """Создать недостающие индексы в существующей базе"""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+    click.echo("Indexes are up to date")
+
+
+@api_bp.cli.command("create-search-index")
+def create_search_index_command():
+    """Создать индекс полнотекстового поиска FTS5 и проиндексировать все строки"""
+    db.create_all()
+    with db.engine.begin() as connection:
+        created = create_search_index(connection, rebuild=True)
+    if created:
+        click.echo("Search index is up to date")
+    else:
+        click.echo("FTS5 is not available, /search falls back to LIKE")
+
+
+@api_bp.cli.command("recover-health-log")
+def recover_health_log_command():
+    """Записать в базу отметки из журнала отложенной записи завершившихся процессов"""
+    db.create_all()
+    recovered = recover_log(current_app.config["HEALTH_LOG_DIR"])
+    click.echo("Recovered {} health reports".format(recovered))
+
+
+@api_bp.cli.command("import")
+@click.argument("resource", type=click.Choice(sorted(IMPORTS)))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "name", type=click.Choice(sorted(READERS)),
+              help="Формат файла (по умолчанию по расширению)")
+@click.option("--rejected", type=click.Path(dir_okay=False),
+              help="Записать отклоненные строки в этот файл (NDJSON)")
+def import_command(resource, path, name, rejected):
+    """Загрузить CSV/NDJSON файл в таблицу"""
+    name = name or detect_format(path)
+    if name is None:
+        raise click.UsageError("Cannot detect the format of {}, use --format".format(path))
+    db.create_all()
+    report = import_file(resource, path, name,
+                         progress=lambda done, total: click.echo(
+                             "\r{:.0%}".format(done / total if total else 1), nl=False))
+    click.echo("\nRead {read}, imported {imported}, rejected {rejected}".format(**report))
+    if rejected:
+        with open(rejected, "w") as output:
+            for row in report["rejected_rows"]:
+                output.write(json.dumps(row) + "\n")
+    if report["rejected"] > len(report["rejected_rows"]):
+        click.echo("Only the first {} rejected rows are reported".format(
+            len(report["rejected_rows"])))
+
+
+@api_bp.cli.command("jobs-worker")
+@click.option("--processes", type=int, help="Число процессов (по умолчанию JOBS_WORKERS)")
+@click.option("--once", is_flag=True, help="Выполнить задачи из очереди и выйти")
+def jobs_worker_command(processes, once):
+    """Запустить воркеры фоновых задач"""
+    db.create_all()
+    for job_uuid in recover_jobs():
+        click.echo("Job {} failed: its worker is gone".format(job_uuid))
+    processes = processes or current_app.config["JOBS_WORKERS"]
+    click.echo("Starting {} job workers".format(processes))
+    run_workers(current_app.config["CONFIG_NAME"], processes, once=once)
+
 
 # JSON format for error
 @api_bp.errorhandler(HTTPException)
@@ -35,6 +194,6 @@ def handle_exception(e):
         "code": e.code,
         "name": e.name,
         "description": e.description,
-    })
+    }, separators=(",", ":"))
     response.content_type = "application/json"
     return response
@@ -0,0 +1,205 @@
+import hashlib
+import math
+import threading
+import time
+
+from flask import request, current_app, g
+from flask_login import current_user
+
+from api.cache import LRUCache
+from api.utils import make_data_response
+
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+# Заголовки, которые сохраняются для повтора ответа по Idempotency-Key
+REPLAY_HEADERS = ("Content-Type", "Location", "ETag")
+
+
+class TokenBucket(object):
+    __slots__ = ("tokens", "stamp")
+
+    def __init__(self, tokens, stamp):
+        self.tokens = tokens
+        self.stamp = stamp
+
+
+def too_many(retry_after, message):
+    response = make_data_response(429, message=message)
+    response.headers["Retry-After"] = str(max(1, int(math.ceil(retry_after))))
+    return response
+
+
+def client_id():
+    if current_user.is_authenticated:
+        return "user:{}".format(current_user.get_id())
+    return "ip:{}".format(request.remote_addr)
+
+
+class WriteAdmission(object):
+    """Защита пути записи: Idempotency-Key, лимит запросов клиента и очередь записи
+
+    Для POST/PUT/PATCH/DELETE по порядку:
+
+    - token bucket на клиента (пользователь или адрес): RATE_LIMIT_RATE
+      запросов в секунду с запасом RATE_LIMIT_BURST, сверх - 429;
+    - Idempotency-Key: ответ на первый запрос с ключом хранится
+      IDEMPOTENCY_TTL секунд и отдается повторам без выполнения. Тот же
+      ключ с другим запросом - 422, пока первый еще выполняется - 409.
+      Записи лежат в общем кэше (RESPONSE_CACHE_BACKEND), если он задан;
+    - не больше WRITE_CONCURRENCY одновременных записей в процессе:
+      остальные ждут свободного места до WRITE_QUEUE_TIMEOUT секунд, затем
+      получают 429. SQLite пишет в один поток, и лишние писатели только
+      ждут блокировку базы, держа соединения.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.rate_limit = config.get("RATE_LIMIT_ENABLED", False)
+        self.rate = config.get("RATE_LIMIT_RATE", 5.0)
+        self.burst = config.get("RATE_LIMIT_BURST", 20)
+        self.buckets = LRUCache(max_entries=config.get("RATE_LIMIT_MAX_CLIENTS", 100000),
+                                ttl=float("inf"))
+        self.buckets_lock = threading.Lock()
+        self.ttl = config.get("IDEMPOTENCY_TTL", 24 * 3600)
+        self.lock_ttl = config.get("IDEMPOTENCY_LOCK_TTL", 60)
+        self.local = LRUCache(max_entries=config.get("IDEMPOTENCY_MAX_ENTRIES", 100000),
+                              max_bytes=config.get("IDEMPOTENCY_MAX_BYTES", 64 * 1024 * 1024),
+                              ttl=self.ttl)
+        concurrency = config.get("WRITE_CONCURRENCY", 0)
+        self.slots = threading.BoundedSemaphore(concurrency) if concurrency else None
+        self.queue_timeout = config.get("WRITE_QUEUE_TIMEOUT", 2.0)
+        app.extensions["write_admission"] = self
+        app.before_request(self.admit)
+        app.after_request(self.remember)
+        app.teardown_request(self.release)
+
+    @property
+    def shared(self):
+        return current_app.extensions["response_cache"].shared
+
+    def store_get(self, key):
+        if self.shared is not None:
+            return self.shared.get(key)
+        return self.local.get(key)
+
+    def store_set(self, key, value, ttl, size=1):
+        if self.shared is not None:
+            self.shared.set(key, value, ttl)
+        else:
+            self.local.set(key, value, ttl=ttl, size=size)
+
+    def store_add(self, key, value, ttl):
+        """Атомарно занять ключ: True, если его еще не было"""
+        if self.shared is not None:
+            return self.shared.add(key, value, ttl)
+        return self.local.add(key, value, ttl=ttl)
+
+    def store_delete(self, key):
+        if self.shared is not None:
+            self.shared.delete(key)
+        else:
+            self.local.delete(key)
+
+    def take(self, client):
+        """0, если токен взят, иначе сколько секунд ждать следующего"""
+        now = time.monotonic()
+        with self.buckets_lock:
+            bucket = self.buckets.get(client)
+            if bucket is None:
+                bucket = TokenBucket(self.burst, now)
+                self.buckets.set(client, bucket)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.stamp) * self.rate)
+            bucket.stamp = now
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return 0
+            return (1 - bucket.tokens) / self.rate
+
+    @staticmethod
+    def fingerprint():
+        """Метод, путь и тело JSON; тело загрузок не читается, чтобы не съесть поток"""
+        digest = hashlib.sha1("{} {}".format(request.method, request.full_path).encode("utf-8"))
+        if request.is_json:
+            digest.update(request.get_data(cache=True))
+        return digest.hexdigest()
+
+    def admit(self):
+        if request.method not in WRITE_METHODS:
+            return None
+        client = client_id()
+        if self.rate_limit:
+            wait = self.take(client)
+            if wait:
+                return too_many(wait, "Rate limit exceeded")
+
+        key = request.headers.get("Idempotency-Key")
+        if key is not None:
+            if not 0 < len(key) <= 255:
+                return make_data_response(400, message="Idempotency-Key must be 1-255 characters")
+            store_key = "idem:{}:{}".format(client, key)
+            fingerprint = self.fingerprint()
+            # Метка "выполняется" ставится атомарно, чтобы два одновременных
+            # запроса с ключом не выполнились оба; живет недолго: упавший
+            # запрос не держит ключ
+            if not self.store_add(store_key, (fingerprint, None), self.lock_ttl):
+                entry = self.store_get(store_key)
+                if entry is not None and entry[0] != fingerprint:
+                    return make_data_response(
+                        422, message="Idempotency-Key was already used for another request")
+                # Пусто - первый запрос только что упал и снял метку: тоже повторить
+                if entry is None or entry[1] is None:
+                    return self.in_progress()
+                return self.replay(entry)
+            g.idempotency_key = (store_key, fingerprint)
+
+        if self.slots is not None:
+            if not self.slots.acquire(timeout=self.queue_timeout):
+                self.forget()
+                return too_many(self.queue_timeout, "Too many concurrent writes")
+            g.write_slot = True
+        return None
+
+    @staticmethod
+    def in_progress():
+        response = make_data_response(409, message="A request with this Idempotency-Key "
+                                                   "is in progress")
+        response.headers["Retry-After"] = "1"
+        return response
+
+    @staticmethod
+    def replay(entry):
+        _, status, headers, body = entry
+        response = current_app.response_class(body, status=status, headers=headers)
+        response.headers["Idempotent-Replayed"] = "true"
+        return response
+
+    def remember(self, response):
+        stored = g.pop("idempotency_key", None)
+        if stored is None:
+            return response
+        store_key, fingerprint = stored
+        if response.status_code >= 500 or response.is_streamed:
+            self.store_delete(store_key)
+            return response
+        headers = [(name, value) for name, value in response.headers if name in REPLAY_HEADERS]
+        body = response.get_data()
+        self.store_set(store_key, (fingerprint, response.status_code, headers, body), self.ttl,
+                       size=len(body))
+        return response
+
+    def forget(self):
+        stored = g.pop("idempotency_key", None)
+        if stored is not None:
+            self.store_delete(stored[0])
+
+    def release(self, error=None):
+        # Запрос закончился без ответа (исключение): ключ можно повторить
+        self.forget()
+        if g.pop("write_slot", False):
+            self.slots.release()
+
+
+write_admission = WriteAdmission()
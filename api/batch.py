@@ -0,0 +1,202 @@
+from uuid import uuid4
+
+from flask import request, current_app
+from marshmallow import ValidationError
+from sqlalchemy import exc, bindparam
+from sqlalchemy.dialects import postgresql, sqlite
+
+from api.utils import make_data_response
+from extensions import db
+
+# Диалекты с INSERT ... ON CONFLICT: имя -> конструктор insert
+UPSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def dialect_name(session, statement):
+    """Диалект базы, в которую сессия отправит statement (запись - всегда в основную)"""
+    return session.connection(bind_arguments={"clause": statement}).dialect.name
+
+
+def existing_keys(column, keys):
+    """Множество ключей из keys, которые есть в таблице (один IN-запрос на чанк)"""
+    found = set()
+    for chunk in chunked(list(set(keys)), current_app.config["BATCH_CHUNK_SIZE"]):
+        found.update(key for key, in db.session.query(column).filter(column.in_(chunk)))
+    return found
+
+
+def update_rows(model, mappings):
+    """UPDATE по uuid для списка словарей с увеличением version
+
+    Строки с одинаковым набором полей уходят одним executemany.
+    """
+    table = model.__table__
+    groups = {}
+    for mapping in mappings:
+        groups.setdefault(tuple(sorted(key for key in mapping if key != "uuid")), []) \
+            .append(mapping)
+    for keys, rows in groups.items():
+        values = {key: bindparam("new_" + key) for key in keys}
+        values["version"] = table.c.version + 1
+        statement = table.update().where(table.c.uuid == bindparam("key_uuid")).values(values)
+        db.session.execute(statement, [dict({"new_" + key: row[key] for key in keys},
+                                            key_uuid=row["uuid"]) for row in rows])
+
+
+def batch_items():
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        return None
+    if len(items) > current_app.config["BATCH_MAX_ITEMS"]:
+        return None
+    return items
+
+
+def load_batch(schema, items, partial=False):
+    """Провалидировать все элементы одним проходом; вернуть (строки, ошибки)"""
+    rows, results = [], []
+    for index, item in enumerate(items):
+        try:
+            args = schema.load(item, partial=partial)
+        except ValidationError as error:
+            results.append({"index": index, "status": 400, "errors": error.messages})
+            continue
+        rows.append((index, item, args))
+    return rows, results
+
+
+def commit_batch(statements):
+    try:
+        for statement in statements:
+            statement()
+        db.session.commit()
+    except exc.SQLAlchemyError:
+        db.session.rollback()
+        return False
+    return True
+
+
+def finish(results, ok):
+    if not ok:
+        return make_data_response(500, message="Database commit error")
+    results.sort(key=lambda result: result["index"])
+    return make_data_response(200, results=results)
+
+
+def apply_prepare(prepare, pending, results):
+    """Вызвать prepare(pending) -> (операции, {index: ошибки}) и отбросить ошибочные"""
+    if prepare is None:
+        return pending, []
+    statements, errors = prepare(pending)
+    results.extend({"index": index, "status": 400, "errors": errors[index]}
+                   for index in sorted(errors))
+    return [(index, args) for index, args in pending if index not in errors], statements
+
+
+def prepare_create(model, schema, items, references=None, prepare=None, keep_uuid=False):
+    """Провалидировать элементы для создания; вернуть (результаты, операции)
+
+    references: {поле: колонка} - внешние ключи, которые берутся из элемента
+    и проверяются пакетно.
+    prepare: дополнительная пакетная обработка, см. apply_prepare.
+    keep_uuid: взять uuid из элемента, если он задан (повторная загрузка выгрузки).
+    """
+    references = references or {}
+    rows, results = load_batch(schema, items)
+
+    known = {field: existing_keys(column, [str(item.get(field)) for _, item, _ in rows])
+             for field, column in references.items()}
+    taken = existing_keys(model.uuid, [str(item["uuid"]) for _, item, _ in rows
+                                       if item.get("uuid")]) if keep_uuid else set()
+    pending = []
+    for index, item, args in rows:
+        missing = [field for field in references if str(item.get(field)) not in known[field]]
+        if missing:
+            results.append({"index": index, "status": 404,
+                            "errors": {field: ["Not found"] for field in missing}})
+            continue
+        uuid = str(item["uuid"]) if keep_uuid and item.get("uuid") else str(uuid4())
+        if uuid in taken:
+            results.append({"index": index, "status": 409, "uuid": uuid})
+            continue
+        taken.add(uuid)
+        for field in references:
+            args[field] = str(item[field])
+        args["uuid"] = uuid
+        pending.append((index, args))
+
+    pending, extra = apply_prepare(prepare, pending, results)
+    results.extend({"index": index, "status": 201, "uuid": args["uuid"]}
+                   for index, args in pending)
+
+    chunk_size = current_app.config["BATCH_CHUNK_SIZE"]
+    mappings = [args for _, args in pending]
+    statements = [lambda chunk=chunk: db.session.bulk_insert_mappings(model, chunk)
+                  for chunk in chunked(mappings, chunk_size)]
+    return results, statements + extra
+
+
+def bulk_create(model, schema, references=None, prepare=None):
+    """Создать записи из массива одной транзакцией (см. prepare_create)"""
+    items = batch_items()
+    if items is None:
+        return make_data_response(400, message="Bad JSON format")
+    results, statements = prepare_create(model, schema, items, references, prepare)
+    return finish(results, commit_batch(statements))
+
+
+def bulk_update(model, schema, prepare=None):
+    """Обновить записи из массива [{"uuid": ..., поля...}] одной транзакцией"""
+    items = batch_items()
+    if items is None or not all(isinstance(item, dict) for item in items):
+        return make_data_response(400, message="Bad JSON format")
+    rows, results = load_batch(schema, items, partial=True)
+
+    known = existing_keys(model.uuid, [str(item.get("uuid")) for _, item, _ in rows])
+    pending = []
+    for index, item, args in rows:
+        uuid = str(item.get("uuid"))
+        if uuid not in known:
+            results.append({"index": index, "status": 404, "uuid": uuid})
+            continue
+        args["uuid"] = uuid
+        pending.append((index, args))
+
+    pending, extra = apply_prepare(prepare, pending, results)
+    results.extend({"index": index, "status": 200, "uuid": args["uuid"]}
+                   for index, args in pending)
+
+    chunk_size = current_app.config["BATCH_CHUNK_SIZE"]
+    mappings = [args for _, args in pending]
+    statements = [lambda chunk=chunk: update_rows(model, chunk)
+                  for chunk in chunked(mappings, chunk_size)]
+    return finish(results, commit_batch(statements + extra))
+
+
+def bulk_delete(model, prepare=None):
+    """Удалить записи по массиву uuid одной транзакцией
+
+    prepare(uuids) может вернуть операции, которые выполняются до удаления.
+    """
+    items = batch_items()
+    if items is None:
+        return make_data_response(400, message="Bad JSON format")
+    uuids = [str(item) for item in items]
+
+    known = existing_keys(model.uuid, uuids)
+    results = [{"index": index, "status": 200 if uuid in known else 404, "uuid": uuid}
+               for index, uuid in enumerate(uuids)]
+
+    chunk_size = current_app.config["BATCH_CHUNK_SIZE"]
+    uuids = sorted(known)
+    statements = prepare(uuids) if prepare else []
+    statements.extend(
+        lambda chunk=chunk: db.session.query(model).filter(model.uuid.in_(chunk))
+        .delete(synchronize_session=False)
+        for chunk in chunked(uuids, chunk_size))
+    return finish(results, commit_batch(statements))
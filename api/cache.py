@@ -0,0 +1,193 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from uuid import uuid4
+
+from flask import request, current_app
+from werkzeug.utils import import_string
+
+
+class LRUCache(object):
+    """Потокобезопасный LRU-кэш в памяти процесса с TTL и ограничением по размеру"""
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=60):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, size, expires = item
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None, size=1):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self._remove(key)
+            self._insert(key, value, ttl, size)
+
+    def add(self, key, value, ttl=None, size=1):
+        """Записать, только если ключа нет (или он истек); True, если записано"""
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                if item[2] >= time.monotonic():
+                    return False
+                self._remove(key)
+            self._insert(key, value, ttl, size)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._items:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+    def _insert(self, key, value, ttl, size):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._items[key] = (value, size, expires)
+        self.size += size
+        while len(self._items) > self.max_entries or self.size > self.max_bytes:
+            self._remove(next(iter(self._items)))
+
+    def _remove(self, key):
+        _, size, _ = self._items.pop(key)
+        self.size -= size
+
+
+class ResponseCache(object):
+    """Кэш сериализованных GET-ответов с инвалидацией по пространствам имен
+
+    Ключ ответа включает поколение каждого пространства имен, от которого
+    зависит ресурс; запись в ресурс меняет поколение, и старые ответы больше
+    не находятся. Общий кэш (RESPONSE_CACHE_BACKEND) - любой объект с
+    методами get(key), set(key, value, ttl), delete(key) и add(key, value, ttl) -
+    атомарная запись только при отсутствии ключа с результатом True/False
+    (add в memcached, SET NX в Redis); его фабрика получает приложение. Без общего кэша поколения живут в памяти процесса,
+    и в других воркерах устаревший ответ живет не дольше RESPONSE_CACHE_TTL.
+    """
+
+    def __init__(self, app=None):
+        self.local = None
+        self.shared = None
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get("RESPONSE_CACHE_ENABLED", False)
+        self.ttl = config.get("RESPONSE_CACHE_TTL", 60)
+        self.local = LRUCache(config.get("RESPONSE_CACHE_MAX_ENTRIES", 1024),
+                              config.get("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024),
+                              self.ttl)
+        backend = config.get("RESPONSE_CACHE_BACKEND")
+        self.shared = import_string(backend)(app) if backend else None
+        self._generations = {}
+        app.extensions["response_cache"] = self
+
+    def generation(self, namespace):
+        key = "gen:" + namespace
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is None:
+                value = uuid4().hex
+                self.shared.set(key, value, None)
+            return value
+        return self._generations.setdefault(namespace, uuid4().hex)
+
+    def invalidate(self, *namespaces):
+        for namespace in namespaces:
+            if self.shared is not None:
+                self.shared.set("gen:" + namespace, uuid4().hex, None)
+            else:
+                self._generations[namespace] = uuid4().hex
+
+    def key(self, namespaces):
+        generations = ":".join(self.generation(namespace) for namespace in namespaces)
+        return "resp:{}:{}".format(generations, request.full_path)
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value, size=len(value[0]))
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value, size=len(value[0]))
+        if self.shared is not None:
+            self.shared.set(key, value, self.ttl)
+
+
+def with_etag(response):
+    """Сильный ETag по телу ответа и 304 на совпавший If-None-Match"""
+    if response.status_code == 200 and not response.is_streamed:
+        if response.get_etag() == (None, None):
+            response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+        response.make_conditional(request)
+    return response
+
+
+def cached(*namespaces):
+    """Кэшировать GET-ответ ресурса, зависящего от пространств имен namespaces"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            cache = current_app.extensions["response_cache"]
+            if not cache.enabled:
+                return with_etag(func(*args, **kwargs))
+
+            key = cache.key(namespaces)
+            hit = cache.get(key)
+            if hit is not None:
+                body, status, headers = hit
+                return with_etag(current_app.response_class(body, status=status, headers=headers))
+
+            response = func(*args, **kwargs)
+            if response.status_code == 200 and not response.is_streamed:
+                if response.get_etag() == (None, None):
+                    response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+                headers = [(name, value) for name, value in response.headers
+                           if name in ("Content-Type", "ETag")]
+                cache.set(key, (response.get_data(), 200, headers))
+            return with_etag(response)
+        return wrapper
+    return decorator
+
+
+def invalidates(*namespaces):
+    """После успешной записи сбросить кэш пространств имен namespaces"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            response = func(*args, **kwargs)
+            if response.status_code < 400:
+                current_app.extensions["response_cache"].invalidate(*namespaces)
+            return response
+        return wrapper
+    return decorator
+
+
+response_cache = ResponseCache()
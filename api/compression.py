@@ -0,0 +1,109 @@
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ("application/json", "application/x-ndjson", "text/csv", "text/plain",
+                "text/html")
+
+
+class GzipEncoder(object):
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def process(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliEncoder(object):
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=min(level, 11))
+
+    def process(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+ENCODERS = {"gzip": GzipEncoder, "br": BrotliEncoder}
+
+
+class Compression(object):
+    """Сжатие ответов gzip или brotli по Accept-Encoding
+
+    Включается COMPRESSION_ENABLED. Сжимаются текстовые ответы от
+    COMPRESSION_MIN_SIZE байт; потоковые ответы сжимаются по частям, каждая
+    часть сразу уходит клиенту. brotli используется, если установлен пакет
+    brotli. Сильный ETag сжатого ответа становится слабым, как в nginx.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("COMPRESSION_ENABLED", False)
+        if not self.enabled:
+            return
+        self.min_size = app.config.get("COMPRESSION_MIN_SIZE", 1024)
+        self.level = app.config.get("COMPRESSION_LEVEL", 6)
+        self.codings = ["br", "gzip"] if brotli is not None else ["gzip"]
+        app.after_request(self.compress)
+
+    def compress(self, response):
+        if response.status_code < 200 or response.status_code in (204, 304) \
+                or response.direct_passthrough or "Content-Encoding" in response.headers \
+                or response.mimetype not in COMPRESSIBLE:
+            return response
+        response.vary.add("Accept-Encoding")
+        coding = request.accept_encodings.best_match(self.codings)
+        if coding is None:
+            return response
+
+        encoder = ENCODERS[coding](self.level)
+        if response.is_streamed:
+            response.response = self.stream(encoder, response.response)
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            response.set_data(encoder.process(data) + encoder.finish())
+        response.headers["Content-Encoding"] = coding
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    @staticmethod
+    def stream(encoder, chunks):
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode("utf-8")
+                data = encoder.process(chunk) + encoder.flush()
+                if data:
+                    yield data
+            yield encoder.finish()
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+
+
+compression = Compression()
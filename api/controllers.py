@@ -1,17 +1,40 @@
-from flask import request, render_template, make_response, flash, redirect
-from flask_restful import Resource, abort, url_for
+from datetime import datetime
+
+from flask import request, render_template, make_response, flash, redirect, json, current_app
+from flask_restful import Resource, url_for
 from marshmallow import ValidationError
-from werkzeug.security import generate_password_hash
 
 from api.fields import patients_info_schema, doctors_info_schema, services_info_schema, records_info_schema, \
-    record_info_schema, patient_info_schema, doctor_info_schema
+    record_info_schema, patient_info_schema, doctor_info_schema, jobs_info_schema, job_info_schema, \
+    location_info_schema
 from api.forms import LoginForm
-from api.models import Patient, Record, Doctor, Service, User
-from api.parsers import PatientSchema, RecordSchema, DoctorSchema, ServiceSchema, UserSchema
-from api.utils import make_empty, make_data_response
+from api.models import Patient, Record, Doctor, Service, User, record_services, HealthReport, DoctorStat, Job, \
+    Location, hash_password, forget_user
+from api.batch import bulk_create, bulk_update, bulk_delete
+from api.cache import cached, invalidates
+from api.export import make_export_response
+from api.geo import location_index
+from api.imports import IMPORTS, READERS, import_rows
+from api.jobs import FINISHED, check_params, submit, cancel
+from api.pagination import make_list_response
+from api.search import search
+from api.timeseries import trend, series_list
+from api.writebehind import health_buffer
+from api.records import attach_services, prepare_records, prepare_records_delete, service_revenue, \
+    filter_records
+from api.stats import cases_by_period, health_percentages, RECORD_FIELDS
+from api.parsers import PatientSchema, RecordSchema, DoctorSchema, ServiceSchema, UserSchema, HealthReportSchema, \
+    JobSchema, LocationSchema
+from api.versions import load_patch, patch_columns, claim_version, with_version
+from api.utils import make_empty, make_data_response, get_or_404, bool_arg, float_arg, datetime_arg, \
+    save_upload, remove_upload
 from extensions import db
-from sqlalchemy import exc
-from flask_login import login_user, login_required, logout_user
+from sqlalchemy import exc, func
+from flask_login import login_user, login_required, logout_user, current_user
+
+# Изменения этих полей записи идут через ORM (агрегаты, связи с услугами)
+ORM_RECORD_FIELDS = set(RECORD_FIELDS) | {"used_services"}
+
 
 class Main(Resource):
     @staticmethod
@@ -24,6 +47,7 @@ class UserLogOut(Resource):
     @staticmethod
     @login_required
     def get():
+        forget_user(current_user.get_id())
         logout_user()
         flash("You have been log out")
         return redirect('/api/v1')
@@ -37,7 +61,7 @@ class UserSignUp(Resource):
             args = UserSchema().load(request.json)
         except ValidationError as error:
             return make_data_response(400, message="Bad JSON format")
-        args['password'] = generate_password_hash(str(args['password']))
+        args['password'] = hash_password(str(args['password']))
         user = User(**args)
         try:
             db.session.add(user)
@@ -47,6 +71,9 @@ class UserSignUp(Resource):
 
         try:
             db.session.commit()
+        except exc.IntegrityError:
+            db.session.rollback()
+            return make_data_response(409, message="Username is already taken")
         except exc.SQLAlchemyError:
             db.session.rollback()
             return make_data_response(500, message="Database commit error")
@@ -67,7 +94,7 @@ class UserLogIn(Resource):
         "Вход пользователя в систему"
         form = LoginForm()
         if form.validate_on_submit():
-            user = db.session.query(User).filter(User.username.like(form.username.data)).first()
+            user = db.session.query(User).filter(User.username == form.username.data).first()
             if user and user.check_password(form.password.data):
                 login_user(user, remember=form.remember_me.data)
                 return redirect('/api/v1')
@@ -79,6 +106,7 @@ class Patients(Resource):
     @staticmethod
     # разкомментируй внизу чтобы заработало проверка доступа
     # @login_required
+    @invalidates("patients")
     def post():
         """Создать нового пациента"""
         try:
@@ -104,35 +132,65 @@ class Patients(Resource):
 
     @staticmethod
     # @login_required
+    @cached("patients")
     def get():
         """Получить список всех пациентов"""
-        patients = db.session.query(Patient).all()
-        return make_data_response(200, patients=patients_info_schema.dump(patients))
+        return make_list_response(db.session.query(Patient), [Patient.uuid],
+                                  patients_info_schema, "patients")
+
+
+
+class PatientRecords(Resource):
+    @staticmethod
+    # @login_required
+    @cached("patients", "records")
+    def get(patient_uuid):
+        """Получить историю записей пациента"""
+        patient = get_or_404(Patient, patient_uuid)
+        query = filter_records(db.session.query(Record)).filter(Record.patient_uuid == patient.uuid)
+        return make_list_response(query, [Record.date, Record.uuid],
+                                  records_info_schema, "records")
+
+
+class PatientsBatch(Resource):
+    @staticmethod
+    # @login_required
+    @invalidates("patients")
+    def post():
+        """Создать пациентов пакетом"""
+        return bulk_create(Patient, PatientSchema())
 
+    @staticmethod
+    # @login_required
+    @invalidates("patients")
+    def patch():
+        """Обновить пациентов пакетом"""
+        return bulk_update(Patient, PatientSchema())
+
+    @staticmethod
+    # @login_required
+    @invalidates("patients")
+    def delete():
+        """Удалить пациентов пакетом"""
+        return bulk_delete(Patient)
 
 
 class PatientAction(Resource):
     @staticmethod
     def get(patient_uuid):
         """Получить информамацию об одном пациенте"""
-        patient_info = db.session.query(Patient).filter(Patient.uuid.like(str(patient_uuid)))\
-                .one_or_none()
-        if patient_info is None or patient_info.uuid is None:
-            abort(404, message="Patient with uuid={} not found"
-                  .format(patient_uuid))
-        return make_data_response(200, **patient_info_schema.dump(patient_info))
+        patient_info = get_or_404(Patient, patient_uuid)
+        return with_version(make_data_response(200, **patient_info_schema.dump(patient_info)),
+                            patient_info.version)
 
 
     @staticmethod
     # @login_required
+    @invalidates("patients")
     def delete(patient_uuid):
         """Удалить пациента по uuid"""
-        if db.session.query(Patient).filter(Patient.uuid.like(str(patient_uuid)))\
-                .one_or_none() is None:
-            abort(404, message="Patient with uuid={} not found"
-                  .format(patient_uuid))
+        patient = get_or_404(Patient, patient_uuid)
 
-        patient = db.session.query(Patient).filter(Patient.uuid.like(str(patient_uuid))).one()
         try:
             db.session.delete(patient)
         except exc.SQLAlchemyError:
@@ -149,44 +207,29 @@ class PatientAction(Resource):
 
     @staticmethod
     # @login_required
+    @invalidates("patients")
     def patch(patient_uuid):
         """Обновить информацию о пациенте по uuid"""
-        if db.session.query(Patient).filter(Patient.uuid.like(str(patient_uuid))) \
-                .one_or_none() is None:
-            abort(404, message="Patient with uuid={} not found"
-                  .format(patient_uuid))
-        try:
-            args = request.json
-        except ValidationError as error:
-            return make_data_response(400, message="Bad JSON format")
-
-        patient = db.session.query(Patient).filter(Patient.uuid.like(str(patient_uuid))).one()
-        for key in args:
-            if args[key] is not None:
-                setattr(patient, key, args[key])
-        try:
-            db.session.commit()
-        except exc.SQLAlchemyError:
-            db.session.rollback()
-            return make_data_response(500, message="Database commit error")
-
-        return make_empty(200)
+        values, versions, status = load_patch(PatientSchema())
+        return patch_columns(Patient, patient_uuid, values, versions, status)
 
     @staticmethod
     # @login_required
+    @invalidates("records", "services", "stats")
     def post(patient_uuid):
         "Создать запись для пациента"
-        if db.session.query(Patient).filter(Patient.uuid.like(str(patient_uuid))) \
-                .one_or_none() is None:
-            abort(404, message="Patient with uuid={} not found"
-                  .format(patient_uuid))
+        patient = get_or_404(Patient, patient_uuid)
         try:
             args = RecordSchema().load(request.json)
-            args['patient_uuid'] = str(patient_uuid)
-            # print(args['used_services'])
+            args['patient_uuid'] = patient.uuid
         except ValidationError as error:
             return make_data_response(400, message="Bad JSON format")
+        used_services = args.pop('used_services')
         record = Record(**args)
+        missing = attach_services(record, used_services)
+        if missing:
+            return make_data_response(400, message="Unknown services: {}"
+                                      .format(", ".join(missing)))
         try:
             db.session.add(record)
         except exc.SQLAlchemyError:
@@ -208,6 +251,7 @@ class PatientAction(Resource):
 class Doctors(Resource):
     @staticmethod
     # @login_required
+    @invalidates("doctors", "stats")
     def post():
         """Создать нового врача"""
         try:
@@ -234,33 +278,63 @@ class Doctors(Resource):
 
     @staticmethod
     # @login_required
+    @cached("doctors")
     def get():
         """Получить список всех врачей"""
-        doctors = db.session.query(Doctor).all()
-        return make_data_response(200, doctor=doctors_info_schema.dump(doctors))
+        return make_list_response(db.session.query(Doctor), [Doctor.uuid],
+                                  doctors_info_schema, "doctor")
+
+
+class DoctorRecords(Resource):
+    @staticmethod
+    # @login_required
+    @cached("doctors", "records")
+    def get(doctor_uuid):
+        """Получить записи пациентов у врача"""
+        doctor = get_or_404(Doctor, doctor_uuid)
+        query = filter_records(db.session.query(Record)).filter(Record.doctor_uuid == doctor.uuid)
+        return make_list_response(query, [Record.date, Record.uuid],
+                                  records_info_schema, "records")
+
+
+class DoctorsBatch(Resource):
+    @staticmethod
+    # @login_required
+    @invalidates("doctors", "stats")
+    def post():
+        """Создать врачей пакетом"""
+        return bulk_create(Doctor, DoctorSchema())
+
+    @staticmethod
+    # @login_required
+    @invalidates("doctors", "stats")
+    def patch():
+        """Обновить врачей пакетом"""
+        return bulk_update(Doctor, DoctorSchema())
+
+    @staticmethod
+    # @login_required
+    @invalidates("doctors", "stats")
+    def delete():
+        """Удалить врачей пакетом"""
+        return bulk_delete(Doctor)
 
 
 class DoctorAction(Resource):
     @staticmethod
     def get(doctor_uuid):
         """Получить информамацию об одном враче"""
-        doctor_info = db.session.query(Doctor).filter(Doctor.uuid.like(str(doctor_uuid))) \
-            .one_or_none()
-        if doctor_info is None or doctor_info.uuid is None:
-            abort(404, message="Patient with uuid={} not found"
-                  .format(doctor_uuid))
-        return make_data_response(200, **doctor_info_schema.dump(doctor_info))
+        doctor_info = get_or_404(Doctor, doctor_uuid)
+        return with_version(make_data_response(200, **doctor_info_schema.dump(doctor_info)),
+                            doctor_info.version)
 
     @staticmethod
     # @login_required
+    @invalidates("doctors", "stats")
     def delete(doctor_uuid):
         """Удалить врача по uuid"""
-        if db.session.query(Doctor).filter(Doctor.uuid.like(str(doctor_uuid)))\
-                .one_or_none() is None:
-            abort(404, message="Doctor with uuid={} not found"
-                  .format(doctor_uuid))
+        doctor = get_or_404(Doctor, doctor_uuid)
 
-        doctor = db.session.query(Doctor).filter(Doctor.uuid.like(str(doctor_uuid))).one()
         try:
             db.session.delete(doctor)
         except exc.SQLAlchemyError:
@@ -277,33 +351,17 @@ class DoctorAction(Resource):
 
     @staticmethod
     # @login_required
+    @invalidates("doctors", "stats")
     def patch(doctor_uuid):
         """Обновить информацию о враче по uuid"""
-        if db.session.query(Doctor).filter(Doctor.uuid.like(str(doctor_uuid))) \
-                .one_or_none() is None:
-            abort(404, message="Doctor with uuid={} not found"
-                  .format(doctor_uuid))
-        try:
-            args = request.json
-        except ValidationError as error:
-            return make_data_response(400, message="Bad JSON format")
-
-        doctor = db.session.query(Doctor).filter(Doctor.uuid.like(str(doctor_uuid))).one()
-        for key in args:
-            if args[key] is not None:
-                setattr(doctor, key, args[key])
-        try:
-            db.session.commit()
-        except exc.SQLAlchemyError:
-            db.session.rollback()
-            return make_data_response(500, message="Database commit error")
-
-        return make_empty(200)
+        values, versions, status = load_patch(DoctorSchema())
+        return patch_columns(Doctor, doctor_uuid, values, versions, status)
 
 
 class Services(Resource):
     @staticmethod
     # @login_required
+    @invalidates("services")
     def post():
         """Создать новую услугу"""
         try:
@@ -327,23 +385,44 @@ class Services(Resource):
 
     @staticmethod
     # @login_required
+    @cached("services")
     def get():
         """Получить список всех услуг"""
-        services = db.session.query(Service).all()
-        return make_data_response(200, service=services_info_schema.dump(services))
+        return make_list_response(db.session.query(Service), [Service.uuid],
+                                  services_info_schema, "service")
+
+
+class ServicesBatch(Resource):
+    @staticmethod
+    # @login_required
+    @invalidates("services")
+    def post():
+        """Создать услуги пакетом"""
+        return bulk_create(Service, ServiceSchema())
+
+    @staticmethod
+    # @login_required
+    @invalidates("services")
+    def patch():
+        """Обновить услуги пакетом"""
+        return bulk_update(Service, ServiceSchema())
+
+    @staticmethod
+    # @login_required
+    @invalidates("services", "records")
+    def delete():
+        """Удалить услуги пакетом"""
+        return bulk_delete(Service)
 
 
 class ServiceAction(Resource):
     @staticmethod
     # @login_required
+    @invalidates("services", "records")
     def delete(service_uuid):
         """Удалить услугу по id"""
-        if db.session.query(Service).filter(Service.uuid.like(str(service_uuid)))\
-                .one_or_none() is None:
-            abort(404, message="Service with uuid={} not found"
-                  .format(service_uuid))
+        service = get_or_404(Service, service_uuid)
 
-        service = db.session.query(Service).filter(Service.uuid.like(str(service_uuid))).one()
         try:
             db.session.delete(service)
         except exc.SQLAlchemyError:
@@ -360,37 +439,73 @@ class ServiceAction(Resource):
 
     @staticmethod
     # @login_required
+    @invalidates("services")
     def patch(service_uuid):
         """Обновить информацию о услуге по id"""
-        if db.session.query(Service).filter(Service.uuid.like(str(service_uuid))) \
-                .one_or_none() is None:
-            abort(404, message="Service with uuid={} not found"
-                  .format(service_uuid))
-        try:
-            args = request.json
-        except ValidationError as error:
-            return make_data_response(400, message="Bad JSON format")
+        values, versions, status = load_patch(ServiceSchema())
+        return patch_columns(Service, service_uuid, values, versions, status)
 
-        service = db.session.query(Service).filter(Service.uuid.like(str(service_uuid))).one()
-        for key in args:
-            if args[key] is not None:
-                setattr(service, key, args[key])
-        try:
-            db.session.commit()
-        except exc.SQLAlchemyError:
-            db.session.rollback()
-            return make_data_response(500, message="Database commit error")
 
-        return make_empty(200)
+class ServiceRecords(Resource):
+    @staticmethod
+    # @login_required
+    @cached("services", "records")
+    def get(service_uuid):
+        """Получить записи, в которых использована услуга"""
+        service = get_or_404(Service, service_uuid)
+        query = db.session.query(Record) \
+            .join(record_services, record_services.c.record_uuid == Record.uuid) \
+            .filter(record_services.c.service_uuid == service.uuid)
+        return make_list_response(query, [Record.date, Record.uuid],
+                                  records_info_schema, "records")
+
+
+class ServicesRevenue(Resource):
+    @staticmethod
+    # @login_required
+    @cached("services", "records")
+    def get():
+        """Получить выручку и число записей по каждой услуге"""
+        revenue = [{"uuid": uuid, "name": name, "records": records, "revenue": total}
+                   for uuid, name, records, total in service_revenue(bool_arg("paid"))]
+        return make_data_response(200, revenue=revenue)
 
 
 class Records(Resource):
     @staticmethod
     # @login_required
+    @cached("records")
     def get():
         """Получить список всех записей пациентов у врача"""
-        records = db.session.query(Record).all()
-        return make_data_response(200, records=records_info_schema.dump(records))
+        query = filter_records(db.session.query(Record))
+        return make_list_response(query, [Record.date, Record.uuid],
+                                  records_info_schema, "records")
+
+
+class RecordsBatch(Resource):
+    @staticmethod
+    # @login_required
+    @invalidates("records", "services", "stats")
+    def post():
+        """Создать записи пакетом"""
+        return bulk_create(Record, RecordSchema(),
+                           references={"patient_uuid": Patient.uuid, "doctor_uuid": Doctor.uuid},
+                           prepare=prepare_records)
+
+    @staticmethod
+    # @login_required
+    @invalidates("records", "services", "stats")
+    def patch():
+        """Обновить записи пакетом"""
+        return bulk_update(Record, RecordSchema(),
+                           prepare=lambda pending: prepare_records(pending, replace=True))
+
+    @staticmethod
+    # @login_required
+    @invalidates("records", "services", "stats")
+    def delete():
+        """Удалить записи пакетом"""
+        return bulk_delete(Record, prepare=prepare_records_delete)
 
 
 class RecordAction(Resource):
@@ -398,23 +513,17 @@ class RecordAction(Resource):
     # @login_required
     def get(record_uuid):
         """Получить информамацию об одной записей"""
-        record_info = db.session.query(Record).filter(Record.uuid.like(str(record_uuid))) \
-            .one_or_none()
-        if record_info is None or record_info.uuid is None:
-            abort(404, message="Record with uuid={} not found"
-                  .format(record_info))
-        return make_data_response(200, **record_info_schema.dump(record_info))
+        record_info = get_or_404(Record, record_uuid)
+        return with_version(make_data_response(200, **record_info_schema.dump(record_info)),
+                            record_info.version)
 
     @staticmethod
     # @login_required
+    @invalidates("records", "services", "stats")
     def delete(record_uuid):
         """Удалить запись по uuid"""
-        if db.session.query(Record).filter(Record.uuid.like(str(record_uuid))) \
-                .one_or_none() is None:
-            abort(404, message="Service with uuid={} not found"
-                  .format(record_uuid))
+        record = get_or_404(Record, record_uuid)
 
-        record = db.session.query(Record).filter(Record.uuid.like(str(record_uuid))).one()
         try:
             db.session.delete(record)
         except exc.SQLAlchemyError:
@@ -431,25 +540,322 @@ class RecordAction(Resource):
 
     @staticmethod
     # @login_required
+    @invalidates("records", "services", "stats")
     def patch(record_uuid):
         """Обновить информацию о записи по uuid"""
-        if db.session.query(Record).filter(Record.uuid.like(str(record_uuid))) \
-                .one_or_none() is None:
-            abort(404, message="Record with uuid={} not found"
-                  .format(record_uuid))
+        values, versions, status = load_patch(RecordSchema())
+        if not ORM_RECORD_FIELDS.intersection(values):
+            return patch_columns(Record, record_uuid, values, versions, status)
+
+        # Поля агрегатов и услуги меняются через ORM, чтобы before_flush обновил статистику
+        record = get_or_404(Record, record_uuid)
+        conflict = claim_version(record, versions, status)
+        if conflict is not None:
+            return conflict
+        version = record.version + 1
+        if values.get('used_services') is not None:
+            missing = attach_services(record, values.pop('used_services'))
+            if missing:
+                db.session.rollback()
+                return make_data_response(400, message="Unknown services: {}"
+                                          .format(", ".join(missing)))
+        for key in values:
+            setattr(record, key, values[key])
         try:
-            args = request.json
+            db.session.commit()
+        except exc.SQLAlchemyError:
+            db.session.rollback()
+            return make_data_response(500, message="Database commit error")
+
+        return with_version(make_empty(200), version)
+
+
+class HealthReports(Resource):
+    @staticmethod
+    @invalidates("stats")
+    def post():
+        """Анонимно отметить свое состояние здоровья"""
+        try:
+            args = HealthReportSchema().load(request.json)
+        except ValidationError as error:
+            return make_data_response(400, message="Bad JSON format")
+        if health_buffer.enabled:
+            # Отметка попадет в базу со следующим сбросом буфера
+            health_buffer.submit(args)
+            return make_empty(202)
+        report = HealthReport(**args)
+        try:
+            db.session.add(report)
+        except exc.SQLAlchemyError:
+            db.session.rollback()
+            return make_data_response(500, message="Database add error")
+
+        try:
+            db.session.commit()
+        except exc.SQLAlchemyError:
+            db.session.rollback()
+            return make_data_response(500, message="Database commit error")
+
+        return make_empty(201)
+
+
+class StatsCases(Resource):
+    @staticmethod
+    # @login_required
+    @cached("stats")
+    def get():
+        """Получить число случаев по болезням за день или неделю"""
+        period = request.args.get("period", "day")
+        if period not in ("day", "week"):
+            return make_data_response(400, message="period must be day or week")
+        date_from = datetime_arg("date_from")
+        date_to = datetime_arg("date_to")
+        cases = cases_by_period(period, disease=request.args.get("disease"),
+                                date_from=date_from and date_from[0].date(),
+                                date_to=date_to and date_to[0].date())
+        return make_data_response(200, cases=cases)
+
+
+class StatsRevenue(Resource):
+    @staticmethod
+    # @login_required
+    @cached("stats")
+    def get():
+        """Получить выручку по врачам"""
+        rows = db.session.query(DoctorStat, Doctor.name) \
+            .outerjoin(Doctor, Doctor.uuid == DoctorStat.doctor_uuid) \
+            .filter(DoctorStat.records > 0) \
+            .order_by(DoctorStat.revenue.desc(), DoctorStat.doctor_uuid)
+        revenue = [{"doctor_uuid": stat.doctor_uuid, "name": name, "records": stat.records,
+                    "revenue": stat.revenue, "unpaid": stat.unpaid}
+                   for stat, name in rows]
+        return make_data_response(200, revenue=revenue)
+
+
+class StatsUnpaid(Resource):
+    @staticmethod
+    # @login_required
+    @cached("stats")
+    def get():
+        """Получить сумму и число неоплаченных записей"""
+        records, total = db.session.query(
+            func.coalesce(func.sum(DoctorStat.unpaid_records), 0),
+            func.coalesce(func.sum(DoctorStat.unpaid), 0)).one()
+        return make_data_response(200, records=records, unpaid=total)
+
+
+class Trends(Resource):
+    @staticmethod
+    @cached("stats")
+    def get():
+        """Ряд случаев по дням, неделям или месяцам со скользящим средним и ростом"""
+        return make_data_response(200, **trend())
+
+
+class TrendSeries(Resource):
+    @staticmethod
+    @cached("stats")
+    def get():
+        """Получить список рядов: болезни и регионы"""
+        return make_data_response(200, series=series_list())
+
+
+class StatsHealth(Resource):
+    @staticmethod
+    @cached("stats")
+    def get():
+        """Получить процент заболевших среди отметившихся"""
+        return make_data_response(200, **health_percentages())
+
+
+class Jobs(Resource):
+    @staticmethod
+    def get():
+        """Получить список фоновых задач в порядке постановки"""
+        return make_list_response(db.session.query(Job), [Job.created, Job.uuid], jobs_info_schema, "jobs")
+
+    @staticmethod
+    @login_required
+    def post():
+        """Поставить фоновую задачу в очередь"""
+        try:
+            args = JobSchema().load(request.json)
+        except ValidationError as error:
+            return make_data_response(400, message="Bad JSON format")
+        message = check_params(args["kind"], args["params"])
+        if message:
+            return make_data_response(400, message=message)
+        job = submit(args["kind"], args["params"])
+        location_url = url_for("api.job_info", job_uuid=job.uuid)
+        resp = make_data_response(202, location=location_url, **job_info_schema.dump(job))
+        resp.headers["Location"] = location_url
+        return resp
+
+
+class JobAction(Resource):
+    @staticmethod
+    def get(job_uuid):
+        """Получить состояние и прогресс задачи"""
+        job = get_or_404(Job, job_uuid)
+        return make_data_response(200, **job_info_schema.dump(job))
+
+    @staticmethod
+    @login_required
+    def delete(job_uuid):
+        """Отменить задачу"""
+        job = get_or_404(Job, job_uuid)
+        if job.status in FINISHED:
+            return make_data_response(409, message="Job is already {}".format(job.status))
+        cancel(job)
+        return make_data_response(202, **job_info_schema.dump(job))
+
+
+class JobResult(Resource):
+    @staticmethod
+    def get(job_uuid):
+        """Получить результат выполненной задачи"""
+        job = get_or_404(Job, job_uuid)
+        if job.status != "done":
+            return make_data_response(409, message="Job is {}".format(job.status),
+                                      error=job.error)
+        return make_data_response(200, result=json.loads(job.result))
+
+
+class Export(Resource):
+    @staticmethod
+    def get(resource):
+        """Выгрузить ресурс потоком в CSV, по порциям колонок или в Parquet"""
+        return make_export_response(resource)
+
+
+class Import(Resource):
+    @staticmethod
+    # @login_required
+    def post(resource):
+        """Загрузить CSV/NDJSON из тела запроса; ?background=true - фоновой задачей"""
+        if resource not in IMPORTS:
+            return make_data_response(404, message="Unknown import resource: {}".format(resource))
+        name = request.args.get("format") or \
+            ("ndjson" if "json" in (request.mimetype or "") else "csv")
+        if name not in READERS:
+            return make_data_response(400, message="format must be csv or ndjson")
+        if bool_arg("background"):
+            # Фоновая задача, как и POST /jobs, - только для вошедшего пользователя
+            if not current_user.is_authenticated:
+                return current_app.login_manager.unauthorized()
+            path = save_upload(resource, name)
+            try:
+                job = submit("import", {"resource": resource, "format": name, "path": path})
+            except exc.SQLAlchemyError:
+                db.session.rollback()
+                remove_upload(path)
+                return make_data_response(500, message="Database commit error")
+            location_url = url_for("api.job_info", job_uuid=job.uuid)
+            resp = make_data_response(202, location=location_url, **job_info_schema.dump(job))
+            resp.headers["Location"] = location_url
+            return resp
+        return make_data_response(200, **import_rows(resource, request.stream, name))
+
+
+def locate(args):
+    """Дополнить args координатами по адресу; False, если их нет и адрес не распознан"""
+    if args.get("latitude") is not None and args.get("longitude") is not None:
+        return True
+    point = location_index.geocode(args.get("address"))
+    if point is None:
+        return False
+    args["latitude"], args["longitude"] = point
+    return True
+
+
+class Locations(Resource):
+    @staticmethod
+    def post():
+        """Отметить свое место и состояние здоровья для поиска соседей"""
+        try:
+            args = LocationSchema().load(request.json)
+        except ValidationError as error:
+            return make_data_response(400, message="Bad JSON format")
+        if not locate(args):
+            return make_data_response(400, message="latitude and longitude are required")
+        location = Location(**args)
+        try:
+            db.session.add(location)
+            db.session.commit()
+        except exc.SQLAlchemyError:
+            db.session.rollback()
+            return make_data_response(500, message="Database commit error")
+        location_index.apply(location)
+        location_url = url_for("api.location_info", location_uuid=location.uuid)
+        resp = make_data_response(201, location=location_url, **location_info_schema.dump(location))
+        resp.headers["Location"] = location_url
+        return resp
+
+
+class LocationAction(Resource):
+    @staticmethod
+    def get(location_uuid):
+        location = get_or_404(Location, location_uuid)
+        if not location.active:
+            return make_data_response(404, message="Location with uuid={} not found".format(location_uuid))
+        return make_data_response(200, **location_info_schema.dump(location))
+
+    @staticmethod
+    def patch(location_uuid):
+        """Изменить место или состояние здоровья"""
+        try:
+            args = LocationSchema().load(request.json, partial=True)
         except ValidationError as error:
             return make_data_response(400, message="Bad JSON format")
+        location = get_or_404(Location, location_uuid)
+        if not location.active:
+            return make_data_response(404, message="Location with uuid={} not found".format(location_uuid))
+        if "address" in args and "latitude" not in args and "longitude" not in args \
+                and not locate(args):
+            return make_data_response(400, message="Unknown address, pass latitude and longitude")
+        for key, value in args.items():
+            setattr(location, key, value)
+        location.updated = datetime.utcnow()
+        try:
+            db.session.commit()
+        except exc.SQLAlchemyError:
+            db.session.rollback()
+            return make_data_response(500, message="Database commit error")
+        location_index.apply(location)
+        return make_data_response(200, **location_info_schema.dump(location))
 
-        record = db.session.query(Record).filter(Record.uuid.like(str(record_uuid))).one()
-        for key in args:
-            if args[key] is not None:
-                setattr(record, key, args[key])
+    @staticmethod
+    def delete(location_uuid):
+        location = get_or_404(Location, location_uuid)
+        location.active = False
+        location.updated = datetime.utcnow()
         try:
             db.session.commit()
         except exc.SQLAlchemyError:
             db.session.rollback()
             return make_data_response(500, message="Database commit error")
+        location_index.apply(location)
+        return make_empty(204)
+
 
-        return make_empty(200)
\ No newline at end of file
+class Neighbours(Resource):
+    @staticmethod
+    def get():
+        """Доля больных среди отметившихся в радиусе radius метров от точки"""
+        latitude = float_arg("lat", -90, 90)
+        longitude = float_arg("lon", -180, 180)
+        radius = float_arg("radius", 1, current_app.config["GEO_MAX_RADIUS"],
+                           default=current_app.config["GEO_DEFAULT_RADIUS"])
+        return make_data_response(200, radius=radius,
+                                  **location_index.neighbours(latitude, longitude, radius))
+
+
+class Search(Resource):
+    @staticmethod
+    @cached("records", "patients", "doctors")
+    def get():
+        """Найти записи, пациентов и врачей по словам ?q= (префиксы слов)"""
+        rows, next_cursor = search()
+        return make_data_response(200, next=next_cursor, results=[
+            {"type": name, "uuid": uuid, "score": round(score, 4), "snippet": snippet}
+            for name, uuid, score, snippet in rows])
@@ -0,0 +1,168 @@
+import csv
+import io
+import os
+from datetime import date, datetime
+from itertools import islice
+
+from flask import request, current_app, Response, stream_with_context
+from flask_restful import abort
+from sqlalchemy.orm import Session
+
+from api.fields import PatientInfoSchema, DoctorInfoSchema, ServiceInfoSchema, RecordInfoSchema
+from api.models import Patient, Doctor, Service, Record
+from api.pagination import fields_arg
+from api.records import filter_records
+from api.serializers import compile_schema, encode_json
+from api.utils import optional_module
+from extensions import db
+
+# pyarrow загружается при первой выгрузке parquet (load_pyarrow), а не при старте
+pyarrow = None
+
+# ресурс -> (модель, схема, фильтр запроса или None)
+EXPORTS = {
+    "patients": (Patient, PatientInfoSchema(), None),
+    "doctors": (Doctor, DoctorInfoSchema(), None),
+    "services": (Service, ServiceInfoSchema(), None),
+    "records": (Record, RecordInfoSchema(), filter_records),
+}
+
+# формат -> (mimetype, расширение файла)
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "columns": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def load_pyarrow():
+    """pyarrow с pyarrow.parquet или None, если он не установлен"""
+    global pyarrow
+    if pyarrow is None and optional_module("pyarrow.parquet") is not None:
+        pyarrow = optional_module("pyarrow")
+    return pyarrow
+
+
+def export_query(resource, session):
+    """(компилированная схема, запрос) по параметрам columns и фильтрам запроса"""
+    if resource not in EXPORTS:
+        abort(404, message="Unknown export resource: {}".format(resource))
+    model, schema, filters = EXPORTS[resource]
+    compiled = compile_schema(schema, model, only=fields_arg(schema, "columns"))
+    query = session.query(model)
+    if filters is not None:
+        query = filters(query)
+    return compiled, query.with_entities(*compiled.columns)
+
+
+def export_format():
+    name = request.args.get("format", "csv")
+    if name not in FORMATS:
+        abort(400, message="format must be one of: {}".format(", ".join(sorted(FORMATS))))
+    if name == "parquet" and load_pyarrow() is None:
+        abort(400, message="parquet export requires pyarrow")
+    return name
+
+
+def row_chunks(query, size):
+    """Строки запроса порциями по size с курсора, без загрузки всего результата"""
+    rows = iter(query.execution_options(stream_results=True).yield_per(size))
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def csv_chunks(compiled, chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(compiled.keys)
+    for chunk in chunks:
+        for row in chunk:
+            writer.writerow([convert(value) for convert, value in zip(compiled.converters, row)])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def columns_chunks(compiled, chunks):
+    """Каждая строка вывода - порция в виде {колонка: [значения]}"""
+    for chunk in chunks:
+        columns = zip(*chunk)
+        yield encode_json({key: [convert(value) for value in values]
+                           for key, convert, values in zip(compiled.keys, compiled.converters,
+                                                           columns)}) + b"\n"
+
+
+def arrow_type(column):
+    types = {bool: pyarrow.bool_, int: pyarrow.int64, float: pyarrow.float64,
+             date: pyarrow.date32, datetime: lambda: pyarrow.timestamp("us")}
+    return types.get(column.type.python_type, pyarrow.string)()
+
+
+def parquet_chunks(compiled, chunks):
+    """Parquet-файл потоком: каждая порция - отдельная группа строк"""
+    schema = pyarrow.schema([(key, arrow_type(column))
+                             for key, column in zip(compiled.keys, compiled.columns)])
+    buffer = io.BytesIO()
+    with pyarrow.parquet.ParquetWriter(buffer, schema) as writer:
+        for chunk in chunks:
+            writer.write_batch(pyarrow.RecordBatch.from_pylist(
+                [dict(zip(compiled.keys, row)) for row in chunk], schema=schema))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+WRITERS = {"csv": csv_chunks, "columns": columns_chunks, "parquet": parquet_chunks}
+
+
+def export_chunks(resource, name, session=None, progress=None):
+    """Байты выгрузки resource в формате name по параметрам текущего запроса"""
+    compiled, query = export_query(resource, session or db.session)
+    chunks = row_chunks(query, current_app.config["STREAM_CHUNK_SIZE"])
+    if progress is not None:
+        chunks = counted(chunks, query.order_by(None).count(), progress)
+    return WRITERS[name](compiled, chunks)
+
+
+def counted(chunks, total, progress):
+    done = 0
+    for chunk in chunks:
+        yield chunk
+        done += len(chunk)
+        progress(done, total)
+
+
+def make_export_response(resource):
+    name = export_format()
+    mimetype, extension = FORMATS[name]
+    response = Response(stream_with_context(export_chunks(resource, name)), 200,
+                        mimetype=mimetype)
+    response.headers["Content-Disposition"] = \
+        "attachment; filename={}.{}".format(resource, extension)
+    return response
+
+
+def export_to_file(resource, params, progress=None):
+    """Записать выгрузку в EXPORT_DIR; возвращает (путь, размер в байтах)
+
+    Строки читаются в отдельной сессии: progress фиксирует db.session,
+    и открытый курсор выгрузки не должен при этом закрыться.
+    """
+    with current_app.test_request_context(query_string=params), Session(db.engine) as session:
+        name = export_format()
+        directory = current_app.config["EXPORT_DIR"]
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, "{}-{}.{}".format(
+            resource, datetime.utcnow().strftime("%Y%m%d%H%M%S%f"), FORMATS[name][1]))
+        size = 0
+        with open(path, "wb") as output:
+            for data in export_chunks(resource, name, session, progress):
+                output.write(data)
+                size += len(data)
+    return path, size
@@ -7,6 +7,7 @@ class PatientInfoSchema(Schema):
     phone = fields.String(attribute="phone", required=True)
     birthday = fields.Date(attribute="birthday", format="iso8601",
                            required=True)
+    version = fields.Integer(attribute="version")
 
 
 class DoctorInfoSchema(Schema):
@@ -15,12 +16,14 @@ class DoctorInfoSchema(Schema):
     phone = fields.String(attribute="phone", required=True)
     speciality = fields.String(attribute="speciality", required=True)
     qualification = fields.String(attribute="qualification", required=True)
+    version = fields.Integer(attribute="version")
 
 
 class ServiceInfoSchema(Schema):
     uuid = fields.String(attribute="uuid")
     name = fields.String(attribute="name", required=True)
     price = fields.Integer(attribute="price", required=True)
+    version = fields.Integer(attribute="version")
 
 
 class RecordInfoSchema(Schema):
@@ -31,8 +34,31 @@ class RecordInfoSchema(Schema):
     used_services = fields.String(attribute="used_services", required=True)
     disease = fields.String(attribute="disease", required=True)
     discharge = fields.String(attribute="discharge", required=True)
+    region = fields.String(attribute="region")
     payment_status = fields.Boolean(attribute="payment_status", required=True)
     sum = fields.Integer(attribute="sum", required=True)
+    version = fields.Integer(attribute="version")
+
+
+class JobInfoSchema(Schema):
+    uuid = fields.String(attribute="uuid")
+    kind = fields.String(attribute="kind")
+    status = fields.String(attribute="status")
+    progress = fields.Float(attribute="progress")
+    message = fields.String(attribute="message")
+    error = fields.String(attribute="error")
+    created = fields.DateTime(attribute="created")
+    started = fields.DateTime(attribute="started")
+    finished = fields.DateTime(attribute="finished")
+
+
+class LocationInfoSchema(Schema):
+    uuid = fields.String(attribute="uuid")
+    address = fields.String(attribute="address")
+    latitude = fields.Float(attribute="latitude")
+    longitude = fields.Float(attribute="longitude")
+    health_status = fields.Boolean(attribute="health_status")
+    updated = fields.DateTime(attribute="updated")
 
 
 patients_info_schema = PatientInfoSchema(many=True)
@@ -41,4 +67,7 @@ doctors_info_schema = DoctorInfoSchema(many=True)
 doctor_info_schema = DoctorInfoSchema()
 services_info_schema = ServiceInfoSchema(many=True)
 records_info_schema = RecordInfoSchema(many=True)
-record_info_schema = RecordInfoSchema()
\ No newline at end of file
+record_info_schema = RecordInfoSchema()
+jobs_info_schema = JobInfoSchema(many=True)
+job_info_schema = JobInfoSchema()
+location_info_schema = LocationInfoSchema()
@@ -0,0 +1,312 @@
+import gc
+import heapq
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from werkzeug.utils import import_string
+
+from api.models import Location
+from extensions import db
+
+# Метров в градусе широты (и долготы на экваторе)
+METERS_PER_DEGREE = 6371000.0 * math.pi / 180
+
+
+# Счетчик ячейки - одно целое: всего точек + (больных << 32)
+SICK = 1 << 32
+TOTAL_MASK = SICK - 1
+
+
+def longitude_delta(longitude, center):
+    """Разница долгот в [-180, 180): точки по разные стороны от 180-го меридиана рядом"""
+    return (longitude - center + 180) % 360 - 180
+
+
+class GridIndex(object):
+    """Сетка ячеек cell_degrees x cell_degrees с точками и счетчиками
+
+    Добавление, перенос и удаление точки - O(log n). Для каждой строки сетки
+    (полосы широт) счетчики лежат в дереве Фенвика по номеру ячейки, поэтому
+    ячейки строки, целиком попавшие в круг, складываются одним запросом
+    к дереву. Точки проверяются по одной только в пограничных ячейках.
+    Расстояние - равнопромежуточная проекция у центра круга: для радиусов
+    до десятков километров ошибка меньше 0.5%. Долготы сравниваются через
+    180-й меридиан.
+    """
+
+    def __init__(self, cell_degrees=0.001):
+        self.cell_degrees = cell_degrees
+        # строка -> {колонка: {uuid: (широта, долгота, болен ли)}}
+        self.cells = {}
+        # строка -> дерево Фенвика {колонка + offset: счетчик}
+        self.rows = {}
+        # uuid -> ключ ячейки
+        self.where = {}
+        self.offset = int(math.ceil(180 / cell_degrees)) + 1
+        self.size = 2 * self.offset + 1
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.where)
+
+    def cell_count(self):
+        return sum(len(row) for row in self.cells.values())
+
+    def key(self, latitude, longitude):
+        return (math.floor(latitude / self.cell_degrees),
+                math.floor(longitude / self.cell_degrees))
+
+    def _cell(self, key):
+        row = self.cells.get(key[0])
+        if row is None:
+            row = self.cells[key[0]] = {}
+        cell = row.get(key[1])
+        if cell is None:
+            cell = row[key[1]] = {}
+        return cell
+
+    def upsert(self, uuid, latitude, longitude, infected):
+        infected = bool(infected)
+        key = self.key(latitude, longitude)
+        with self.lock:
+            self._remove(uuid)
+            self._cell(key)[uuid] = (latitude, longitude, infected)
+            self.where[uuid] = key
+            self._add(key, 1 + SICK * infected)
+
+    def load(self, points):
+        """Заполнить пустой индекс точками (uuid, широта, долгота, болен ли)
+
+        Деревья строятся за один проход по узлам, а не по точке за раз.
+        Сборщик циклов на время загрузки выключен: миллионы новых кортежей
+        иначе вызывают полные проходы по куче, и загрузка идет втрое дольше.
+        """
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            self._load(points)
+        finally:
+            if collecting:
+                gc.enable()
+
+    def _load(self, points):
+        with self.lock:
+            counts = {}
+            for uuid, latitude, longitude, infected in points:
+                infected = bool(infected)
+                key = self.key(latitude, longitude)
+                self._cell(key)[uuid] = (latitude, longitude, infected)
+                self.where[uuid] = key
+                counts[key] = counts.get(key, 0) + 1 + SICK * infected
+            for (row, column), packed in counts.items():
+                self.rows.setdefault(row, {})[column + self.offset] = packed
+            for tree in self.rows.values():
+                # Узел передает сумму родителю, когда все его дети уже учтены
+                pending = list(tree)
+                heapq.heapify(pending)
+                while pending:
+                    index = heapq.heappop(pending)
+                    parent = index + (index & -index)
+                    if parent > self.size:
+                        continue
+                    if parent not in tree:
+                        tree[parent] = 0
+                        heapq.heappush(pending, parent)
+                    tree[parent] += tree[index]
+
+    def remove(self, uuid):
+        with self.lock:
+            self._remove(uuid)
+
+    def _remove(self, uuid):
+        key = self.where.pop(uuid, None)
+        if key is None:
+            return
+        row = self.cells[key[0]]
+        cell = row[key[1]]
+        infected = cell.pop(uuid)[2]
+        if not cell:
+            del row[key[1]]
+            if not row:
+                del self.cells[key[0]]
+        self._add(key, -1 - SICK * infected)
+
+    def _add(self, key, delta):
+        tree = self.rows.get(key[0])
+        if tree is None:
+            tree = self.rows[key[0]] = {}
+        index = key[1] + self.offset
+        while index <= self.size:
+            tree[index] = tree.get(index, 0) + delta
+            index += index & -index
+
+    def _prefix(self, tree, column):
+        index = min(column + self.offset, self.size)
+        packed = 0
+        while index > 0:
+            packed += tree.get(index, 0)
+            index -= index & -index
+        return packed
+
+    def _range(self, tree, first, last):
+        return self._prefix(tree, last) - self._prefix(tree, first - 1)
+
+    def count(self, latitude, longitude, radius):
+        """(всего, больных) в радиусе radius метров от точки
+
+        Строка сетки обходится для центра и его копий на долготах ±360,
+        чтобы найти точки за 180-м меридианом. Колонки ограничены настоящими
+        (-180..180), а пограничные ячейки перебираются по колонкам или по
+        занятым ячейкам строки - чего меньше. Поэтому у полюсов, где круг
+        охватывает все долготы, запрос не дольше перебора точек строки.
+        """
+        size = self.cell_degrees
+        cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+        # Все в градусах широты: dx = Δдолготы * cos(широты центра)
+        reach = radius / METERS_PER_DEGREE
+        reach2 = reach * reach
+        limit = self.offset - 1
+        total = infected = 0
+        with self.lock:
+            for row in range(max(math.floor((latitude - reach) / size), -limit),
+                             min(math.floor((latitude + reach) / size), limit) + 1):
+                cells = self.cells.get(row)
+                if cells is None:
+                    continue
+                tree = self.rows[row]
+                low, high = row * size, (row + 1) * size
+                dy_near = 0.0 if low <= latitude <= high else min(abs(latitude - low),
+                                                                  abs(latitude - high))
+                if dy_near > reach:
+                    continue
+                dy_far = max(abs(latitude - low), abs(latitude - high))
+                # Полуширины в градусах долготы: задетые кругом ячейки и лежащие в нем целиком
+                outer = math.sqrt(reach2 - dy_near * dy_near) / cos_lat
+                inner = math.sqrt(reach2 - dy_far * dy_far) / cos_lat if dy_far <= reach else -1.0
+                if inner >= 180:
+                    packed = self._range(tree, -limit, limit)
+                    total += packed & TOTAL_MASK
+                    infected += packed >> 32
+                    continue
+
+                inners, edges = [], []
+                for center in (longitude - 360, longitude, longitude + 360):
+                    first = max(math.floor((center - outer) / size), -limit)
+                    last = min(math.floor((center + outer) / size), limit)
+                    if first > last:
+                        continue
+                    inner_first, inner_last = first, first - 1
+                    if inner >= 0:
+                        inner_first = max(math.ceil((center - inner) / size), first)
+                        inner_last = min(math.floor((center + inner) / size) - 1, last)
+                    if inner_first <= inner_last:
+                        inners.append((inner_first, inner_last))
+                        edges.extend(((first, inner_first - 1), (inner_last + 1, last)))
+                    else:
+                        edges.append((first, last))
+                for first, last in inners:
+                    packed = self._range(tree, first, last)
+                    total += packed & TOTAL_MASK
+                    infected += packed >> 32
+
+                if outer + size >= 180:
+                    # Копии круга задевают общие ячейки: пограничные - все ячейки строки вне inners
+                    touched = (cell for column, cell in cells.items()
+                               if not any(first <= column <= last for first, last in inners))
+                elif sum(last - first + 1 for first, last in edges) <= len(cells):
+                    touched = (cells.get(column) for first, last in edges
+                               for column in range(first, last + 1))
+                else:
+                    touched = (cell for column, cell in cells.items()
+                               if any(first <= column <= last for first, last in edges))
+                for cell in touched:
+                    if cell is None:
+                        continue
+                    for point_latitude, point_longitude, point_infected in cell.values():
+                        dy = point_latitude - latitude
+                        dx = longitude_delta(point_longitude, longitude) * cos_lat
+                        if dx * dx + dy * dy <= reach2:
+                            total += 1
+                            infected += point_infected
+        return total, infected
+
+
+class LocationIndex(object):
+    """Индекс мест процесса, догоняющий базу по Location.updated
+
+    Первый запрос загружает все активные места, следующие (не чаще раза
+    в GEO_REFRESH_SECONDS) - только измененные с прошлой загрузки, с запасом
+    GEO_REFRESH_MARGIN секунд на транзакции, зафиксированные с опозданием.
+    Повторное применение строки ничего не меняет. Изменения из этого
+    процесса попадают в индекс сразу (apply).
+    """
+
+    def __init__(self, app=None):
+        self.grid = None
+        self.geocoder = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.grid = GridIndex(config.get("GEO_CELL_DEGREES", 0.001))
+        self.refresh_seconds = config.get("GEO_REFRESH_SECONDS", 1.0)
+        self.margin = timedelta(seconds=config.get("GEO_REFRESH_MARGIN", 5))
+        geocoder = config.get("GEOCODER")
+        self.geocoder = import_string(geocoder)(app) if geocoder else None
+        self.loaded_until = None
+        self.next_refresh = 0.0
+        self.refresh_lock = threading.Lock()
+
+    def refresh(self):
+        if time.monotonic() < self.next_refresh:
+            return
+        with self.refresh_lock:
+            if time.monotonic() < self.next_refresh:
+                return
+            started = datetime.utcnow()
+            chunk_size = current_app.config["STREAM_CHUNK_SIZE"]
+            if self.loaded_until is None:
+                self.grid.load(db.session.query(Location.uuid, Location.latitude,
+                                                Location.longitude, Location.health_status)
+                               .filter(Location.active).yield_per(chunk_size))
+            else:
+                changed = db.session.query(Location.uuid, Location.latitude, Location.longitude,
+                                           Location.health_status, Location.active) \
+                    .filter(Location.updated >= self.loaded_until - self.margin)
+                for uuid, latitude, longitude, health_status, active in \
+                        changed.yield_per(chunk_size):
+                    if active:
+                        self.grid.upsert(uuid, latitude, longitude, health_status)
+                    else:
+                        self.grid.remove(uuid)
+            self.loaded_until = started
+            self.next_refresh = time.monotonic() + self.refresh_seconds
+
+    def apply(self, location):
+        if self.loaded_until is None:
+            # Индекс еще не загружен: строка придет из базы вместе с остальными
+            return
+        if location.active:
+            self.grid.upsert(location.uuid, location.latitude, location.longitude,
+                             location.health_status)
+        else:
+            self.grid.remove(location.uuid)
+
+    def geocode(self, address):
+        """(широта, долгота) адреса через GEOCODER или None"""
+        if self.geocoder is None or not address:
+            return None
+        return self.geocoder(address)
+
+    def neighbours(self, latitude, longitude, radius):
+        self.refresh()
+        total, infected = self.grid.count(latitude, longitude, radius)
+        return {"total": total, "infected": infected,
+                "percentage": round(100.0 * infected / total, 2) if total else 0.0}
+
+
+location_index = LocationIndex()
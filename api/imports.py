@@ -0,0 +1,125 @@
+import csv
+import io
+import os
+from itertools import islice
+
+from flask import current_app, json
+
+from api.batch import prepare_create, commit_batch
+from api.cache import response_cache
+from api.models import Patient, Doctor, Service, Record
+from api.parsers import PatientSchema, DoctorSchema, ServiceSchema, RecordSchema
+from api.records import prepare_records
+
+# ресурс -> (модель, схема, внешние ключи, prepare, пространства имен кэша)
+IMPORTS = {
+    "patients": (Patient, PatientSchema, None, None, ("patients",)),
+    "doctors": (Doctor, DoctorSchema, None, None, ("doctors",)),
+    "services": (Service, ServiceSchema, None, None, ("services",)),
+    "records": (Record, RecordSchema, {"patient_uuid": Patient.uuid, "doctor_uuid": Doctor.uuid},
+                prepare_records, ("records", "services", "stats")),
+}
+
+EXTENSIONS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+
+
+def read_csv(stream):
+    """(номер строки, словарь или None, ошибка или None) для каждой строки CSV
+
+    Пустые значения отбрасываются, чтобы их проверяла схема как отсутствующие.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    reader = csv.DictReader(text)
+    try:
+        for row in reader:
+            yield reader.line_num, {key: value for key, value in row.items()
+                                    if key is not None and value not in ("", None)}, None
+    except (csv.Error, UnicodeDecodeError) as error:
+        yield reader.line_num, None, str(error)
+    finally:
+        # Иначе обертка закроет исходный поток вместе с собой
+        text.detach()
+
+
+def read_ndjson(stream):
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line), None
+        except ValueError as error:
+            yield number, None, str(error)
+
+
+READERS = {"csv": read_csv, "ndjson": read_ndjson}
+
+
+def detect_format(path):
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def import_rows(resource, stream, name, progress=None):
+    """Загрузить строки из бинарного потока stream в формате name
+
+    Строки проверяются и вставляются порциями по IMPORT_CHUNK_SIZE, каждая
+    порция - одна транзакция. Ошибочные строки пропускаются и попадают
+    в отчет (не больше IMPORT_MAX_REJECTED подробно). Строка с uuid, который
+    уже есть в базе, отклоняется с 409, поэтому повторная загрузка той же
+    выгрузки ничего не дублирует. progress() вызывается после каждой порции.
+    """
+    model, schema_class, references, prepare, namespaces = IMPORTS[resource]
+    schema = schema_class()
+    chunk_size = current_app.config["IMPORT_CHUNK_SIZE"]
+    max_rejected = current_app.config["IMPORT_MAX_REJECTED"]
+    report = {"read": 0, "imported": 0, "rejected": 0, "rejected_rows": []}
+
+    def reject(line, status, errors):
+        # Только номер строки и ошибки: содержимое файла в отчет не копируется
+        report["rejected"] += 1
+        if len(report["rejected_rows"]) < max_rejected:
+            report["rejected_rows"].append({"line": line, "status": status, "errors": errors})
+
+    rows = READERS[name](stream)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        lines, items = [], []
+        for line, item, error in chunk:
+            report["read"] += 1
+            if error is not None:
+                reject(line, 400, {"_schema": [error]})
+                continue
+            lines.append(line)
+            items.append(item)
+
+        results, statements = prepare_create(model, schema, items, references, prepare,
+                                             keep_uuid=True)
+        ok = commit_batch(statements)
+        for result in sorted(results, key=lambda result: result["index"]):
+            index = result["index"]
+            if result["status"] == 201 and ok:
+                report["imported"] += 1
+            elif result["status"] == 201:
+                reject(lines[index], 500, {"_schema": ["Database commit error"]})
+            elif result["status"] == 409:
+                reject(lines[index], 409, {"uuid": ["Already exists"]})
+            else:
+                reject(lines[index], result["status"], result["errors"])
+        if progress is not None:
+            progress()
+
+    if report["imported"]:
+        response_cache.invalidate(*namespaces)
+    return report
+
+
+def import_file(resource, path, name=None, progress=None):
+    """Загрузить файл; формат по расширению, если не указан"""
+    name = name or detect_format(path)
+    if name not in READERS:
+        raise ValueError("Unknown import format for {}".format(path))
+    size = os.path.getsize(path)
+    with open(path, "rb") as stream:
+        return import_rows(resource, stream, name,
+                           progress=progress and (lambda: progress(stream.tell(), size)))
@@ -0,0 +1,180 @@
+import cProfile
+import heapq
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import g, request, has_request_context, current_app
+from sqlalchemy import event
+
+from extensions import db
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class EndpointStats(object):
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.db = 0.0
+        self.serialization = 0.0
+        self.queries = 0
+        self.buckets = [0] * len(BUCKETS)
+
+    def add(self, total, db_time, serialization, queries):
+        self.count += 1
+        self.total += total
+        self.db += db_time
+        self.serialization += serialization
+        self.queries += queries
+        for i, bound in enumerate(BUCKETS):
+            if total <= bound:
+                self.buckets[i] += 1
+
+
+class Instrumentation(object):
+    """Метрики запросов: общее время, время в БД, время сериализации
+
+    Включается INSTRUMENTATION_ENABLED. Агрегаты отдаются в текстовом формате
+    Prometheus по METRICS_URL (на процесс; при нескольких воркерах каждый
+    воркер считает свое). Профилирование: доля PROFILE_SAMPLE_RATE запросов
+    или запрос с заголовком X-Profile: 1 (если PROFILE_ON_DEMAND)
+    записываются в PROFILE_DIR как cProfile-дампы.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.endpoints = defaultdict(EndpointStats)
+        self.slow_queries = []
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("INSTRUMENTATION_ENABLED", False)
+        if not self.enabled:
+            return
+        self.slow_query_count = app.config.get("SLOW_QUERY_COUNT", 10)
+        self.sample_rate = app.config.get("PROFILE_SAMPLE_RATE", 0.0)
+        self.on_demand = app.config.get("PROFILE_ON_DEMAND", False)
+        self.profile_dir = app.config.get("PROFILE_DIR", "profiles")
+
+        for bind in [None] + app.extensions.get("db_replicas", []):
+            engine = db.get_engine(app, bind=bind)
+            event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", self.after_cursor_execute)
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.add_url_rule(app.config.get("METRICS_URL", "/metrics"), "metrics", self.metrics)
+        app.extensions["instrumentation"] = self
+
+    def start_request(self):
+        g.instrumentation = {"started": time.perf_counter(), "db": 0.0,
+                             "serialization": 0.0, "queries": 0, "profiler": None}
+        if (self.on_demand and request.headers.get("X-Profile") == "1") or \
+                (self.sample_rate and random.random() < self.sample_rate):
+            profiler = g.instrumentation["profiler"] = cProfile.Profile()
+            profiler.enable()
+
+    def finish_request(self, response):
+        state = g.pop("instrumentation", None)
+        if state is None or request.url_rule is None:
+            return response
+        total = time.perf_counter() - state["started"]
+        key = (request.url_rule.rule, request.method)
+        with self.lock:
+            self.endpoints[key].add(total, state["db"], state["serialization"], state["queries"])
+
+        profiler = state["profiler"]
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(self.profile_dir, exist_ok=True)
+            name = "{}-{}-{}.prof".format(int(time.time() * 1000), request.method,
+                                          request.url_rule.endpoint)
+            profiler.dump_stats(os.path.join(self.profile_dir, name))
+        response.headers["Server-Timing"] = \
+            "db;dur={:.2f}, serialize;dur={:.2f}, total;dur={:.2f}".format(
+                state["db"] * 1000, state["serialization"] * 1000, total * 1000)
+        return response
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        state = g.get("instrumentation") if has_request_context() else None
+        if state is not None:
+            state["db"] += elapsed
+            state["queries"] += 1
+        with self.lock:
+            item = (elapsed, " ".join(statement.split()))
+            if len(self.slow_queries) < self.slow_query_count:
+                heapq.heappush(self.slow_queries, item)
+            elif item > self.slow_queries[0]:
+                heapq.heapreplace(self.slow_queries, item)
+
+    def metrics(self):
+        lines = []
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            slow_queries = sorted(self.slow_queries, reverse=True)
+
+        def labels(rule, method, **extra):
+            pairs = [("endpoint", rule), ("method", method)] + sorted(extra.items())
+            return ",".join('{}="{}"'.format(name, escape(value)) for name, value in pairs)
+
+        lines.append("# HELP monicovid_request_duration_seconds Request duration")
+        lines.append("# TYPE monicovid_request_duration_seconds histogram")
+        for (rule, method), stats in endpoints:
+            for bound, count in zip(BUCKETS, stats.buckets):
+                lines.append("monicovid_request_duration_seconds_bucket{{{}}} {}"
+                             .format(labels(rule, method, le=str(bound)), count))
+            lines.append("monicovid_request_duration_seconds_bucket{{{}}} {}"
+                         .format(labels(rule, method, le="+Inf"), stats.count))
+            lines.append("monicovid_request_duration_seconds_sum{{{}}} {:.6f}"
+                         .format(labels(rule, method), stats.total))
+            lines.append("monicovid_request_duration_seconds_count{{{}}} {}"
+                         .format(labels(rule, method), stats.count))
+
+        for name, attribute, help_text in (
+                ("monicovid_request_db_seconds_total", "db", "Time spent in SQL"),
+                ("monicovid_request_serialization_seconds_total", "serialization",
+                 "Time spent serializing responses"),
+                ("monicovid_request_queries_total", "queries", "SQL statements executed")):
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} counter".format(name))
+            for (rule, method), stats in endpoints:
+                lines.append("{}{{{}}} {}".format(name, labels(rule, method),
+                                                  round(getattr(stats, attribute), 6)))
+
+        lines.append("# HELP monicovid_slow_query_seconds Slowest SQL statements")
+        lines.append("# TYPE monicovid_slow_query_seconds gauge")
+        for rank, (elapsed, statement) in enumerate(slow_queries, 1):
+            lines.append('monicovid_slow_query_seconds{{rank="{}",statement="{}"}} {:.6f}'
+                         .format(rank, escape(statement[:200]), elapsed))
+        return current_app.response_class("\n".join(lines) + "\n",
+                                          mimetype="text/plain; version=0.0.4")
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+@contextmanager
+def serialization_timer():
+    """Учесть время блока как время сериализации текущего запроса"""
+    state = g.get("instrumentation") if has_request_context() else None
+    if state is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        state["serialization"] += time.perf_counter() - started
+
+
+instrumentation = Instrumentation()
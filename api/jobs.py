@@ -0,0 +1,268 @@
+import inspect
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import time
+import traceback
+from datetime import datetime
+
+from flask import current_app
+
+from api.cache import response_cache
+from api.export import export_to_file
+from api.imports import import_file
+from api.models import Job
+from api.records import migrate_used_services
+from api.stats import rebuild_stats
+from api.utils import pid_alive, upload_path, remove_upload
+from extensions import db
+
+FINISHED = ("done", "failed", "cancelled")
+
+# kind -> (функция, пространства имен кэша для сброса после успеха)
+JOBS = {}
+# kind -> проверка params перед постановкой в очередь: сообщение об ошибке или None
+CHECKS = {}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def job(kind, invalidates=(), check=None):
+    """Зарегистрировать функцию func(context, **params) как вид задачи kind
+
+    Возвращаемое значение должно сериализоваться в JSON - это результат задачи.
+    check(**params) вызывается в check_params до постановки в очередь.
+    """
+    def decorator(func):
+        JOBS[kind] = (func, invalidates)
+        if check is not None:
+            CHECKS[kind] = check
+        return func
+    return decorator
+
+
+class JobContext(object):
+    """Отчет о прогрессе и проверка отмены из кода задачи"""
+
+    def __init__(self, job_uuid):
+        self.job_uuid = job_uuid
+
+    def progress(self, done, total=None, message=None):
+        """Сохранить прогресс и прервать задачу, если запрошена отмена
+
+        Фиксирует транзакцию сессии: вызывать между порциями работы, когда
+        сделанное можно сохранить. Уже зафиксированные порции при отмене
+        не откатываются.
+        """
+        values = {"progress": min(1.0, float(done) / total) if total else 0.0}
+        if message is not None:
+            values["message"] = message[:200]
+        db.session.query(Job).filter(Job.uuid == self.job_uuid) \
+            .update(values, synchronize_session=False)
+        db.session.commit()
+        if db.session.query(Job.cancel_requested).filter(Job.uuid == self.job_uuid).scalar():
+            raise JobCancelled()
+
+
+def check_params(kind, params):
+    """Сообщение об ошибке, если задачу kind нельзя вызвать с params, иначе None"""
+    if kind not in JOBS:
+        return "Unknown job kind: {}".format(kind)
+    try:
+        inspect.signature(JOBS[kind][0]).bind(None, **params)
+    except TypeError as error:
+        return "Bad params: {}".format(error)
+    if kind in CHECKS:
+        return CHECKS[kind](**params)
+    return None
+
+
+def submit(kind, params):
+    new_job = Job(kind=kind, params=json.dumps(params))
+    db.session.add(new_job)
+    db.session.commit()
+    return new_job
+
+
+def cancel(instance):
+    """Отменить задачу: в очереди - сразу, выполняемую - по запросу к воркеру"""
+    if instance.status == "queued":
+        claimed = db.session.query(Job) \
+            .filter(Job.uuid == instance.uuid, Job.status == "queued") \
+            .update({"status": "cancelled", "finished": datetime.utcnow()},
+                    synchronize_session=False)
+        if claimed:
+            db.session.commit()
+            db.session.refresh(instance)
+            discard_upload(instance)
+            return
+    db.session.query(Job).filter(Job.uuid == instance.uuid, Job.status == "running") \
+        .update({"cancel_requested": True}, synchronize_session=False)
+    db.session.commit()
+    db.session.refresh(instance)
+
+
+def discard_upload(instance):
+    """Удалить файл задачи import, которая больше не будет выполняться"""
+    if instance.kind == "import":
+        remove_upload(json.loads(instance.params).get("path"))
+
+
+def claim(worker):
+    """Забрать самую старую задачу из очереди; None, если очередь пуста"""
+    while True:
+        job_uuid = db.session.query(Job.uuid).filter(Job.status == "queued") \
+            .order_by(Job.created).limit(1).scalar()
+        if job_uuid is None:
+            db.session.rollback()
+            return None
+        # Условный UPDATE: задачу получает только один из воркеров
+        claimed = db.session.query(Job) \
+            .filter(Job.uuid == job_uuid, Job.status == "queued") \
+            .update({"status": "running", "worker": worker, "started": datetime.utcnow()},
+                    synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_uuid)
+
+
+def finish(job_uuid, status, **values):
+    db.session.rollback()
+    values.update(status=status, finished=datetime.utcnow())
+    if status == "done":
+        values["progress"] = 1.0
+    db.session.query(Job).filter(Job.uuid == job_uuid).update(values, synchronize_session=False)
+    db.session.commit()
+
+
+def run_job(instance):
+    job_uuid = instance.uuid
+    registered = JOBS.get(instance.kind)
+    if registered is None:
+        finish(job_uuid, "failed", error="Unknown job kind: {}".format(instance.kind))
+        return
+    func, namespaces = registered
+    params = json.loads(instance.params)
+    try:
+        result = func(JobContext(job_uuid), **params)
+    except JobCancelled:
+        finish(job_uuid, "cancelled")
+        return
+    except Exception:
+        finish(job_uuid, "failed", error=traceback.format_exc())
+        return
+    finish(job_uuid, "done", result=json.dumps(result))
+    if namespaces:
+        response_cache.invalidate(*namespaces)
+
+
+def recover_jobs():
+    """Пометить failed задачи, чьи воркеры на этом хосте больше не работают"""
+    host = socket.gethostname()
+    lost = []
+    for instance in db.session.query(Job) \
+            .filter(Job.status == "running", Job.worker.like(host + ":%")):
+        if not pid_alive(int(instance.worker.rsplit(":", 1)[1])):
+            lost.append(instance)
+    for instance in lost:
+        finish(instance.uuid, "failed", error="Worker stopped while running the job")
+        discard_upload(instance)
+    return [instance.uuid for instance in lost]
+
+
+def work(config_name, poll_interval=None, once=False):
+    """Цикл воркера в отдельном процессе: забирать и выполнять задачи
+
+    SIGTERM дожидается окончания текущей задачи. once=True - выполнить
+    задачи, уже стоящие в очереди, и выйти.
+    """
+    from app import create_app
+
+    app = create_app(config_name)
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker = "{}:{}".format(socket.gethostname(), os.getpid())
+    with app.app_context():
+        if poll_interval is None:
+            poll_interval = current_app.config["JOBS_POLL_INTERVAL"]
+        while not stopping:
+            instance = claim(worker)
+            if instance is None:
+                if once:
+                    break
+                time.sleep(poll_interval)
+                continue
+            run_job(instance)
+            db.session.remove()
+
+
+def run_workers(config_name, processes, poll_interval=None, once=False):
+    """Запустить processes воркеров и ждать их; Ctrl+C/SIGTERM останавливает всех"""
+    workers = [multiprocessing.Process(target=work, args=(config_name, poll_interval, once),
+                                       name="job-worker-{}".format(i))
+               for i in range(processes)]
+    for process in workers:
+        process.start()
+
+    def stop(signum=None, frame=None):
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        stop()
+        for process in workers:
+            process.join()
+
+
+@job("rebuild-stats", invalidates=("stats",))
+def rebuild_stats_job(context):
+    context.progress(0, message="Rebuilding statistics")
+    rebuild_stats()
+    return {"rebuilt": True}
+
+
+@job("migrate-used-services", invalidates=("records", "services", "stats"))
+def migrate_used_services_job(context, recompute_sums=False):
+    processed, unresolved = migrate_used_services(recompute_sums=recompute_sums,
+                                                  progress=context.progress)
+    if recompute_sums:
+        rebuild_stats()
+    return {"processed": processed,
+            "unresolved": [{"record_uuid": record_uuid, "services": missing}
+                           for record_uuid, missing in unresolved]}
+
+
+@job("export")
+def export_job(context, resource, **params):
+    """params - параметры /export/<resource>: format, columns, фильтры"""
+    path, size = export_to_file(resource, params, progress=context.progress)
+    return {"path": path, "bytes": size}
+
+
+def check_import(resource, path, format=None):
+    if not isinstance(path, str) or upload_path(path) is None:
+        return "path must be a file uploaded to IMPORT_DIR"
+    return None
+
+
+@job("import", check=check_import)
+def import_job(context, resource, path, format=None):
+    """path - файл CSV/NDJSON, загруженный в IMPORT_DIR (save_upload); после задачи удаляется"""
+    real_path = upload_path(path)
+    if real_path is None:
+        # Задача могла попасть в очередь в обход check_params
+        raise ValueError("path must be a file uploaded to IMPORT_DIR")
+    try:
+        return import_file(resource, real_path, format, progress=context.progress)
+    finally:
+        remove_upload(real_path)
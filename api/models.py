@@ -1,23 +1,56 @@
+from flask import current_app
+from sqlalchemy.orm import make_transient_to_detached
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from api.cache import LRUCache
 from extensions import db, login_manager
 from uuid import uuid4
+from datetime import datetime
 from flask_login import LoginManager, UserMixin
 
+# Пользователи для user_loader вне сессии, по id (в памяти процесса)
+user_cache = LRUCache(max_entries=10000)
+
 
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.query(User).get(user_id)
+    ttl = current_app.config["USER_CACHE_TTL"]
+    cached = user_cache.get(user_id) if ttl else None
+    if cached is not None:
+        # Без запроса к базе: копия из кэша присоединяется к сессии как есть
+        return db.session.merge(cached, load=False)
+    try:
+        user = db.session.get(User, int(user_id))
+    except ValueError:
+        return None
+    if user is not None and ttl:
+        copy = User(id=user.id, username=user.username, password=user.password)
+        make_transient_to_detached(copy)
+        user_cache.set(user_id, copy, ttl=ttl)
+    return user
+
+
+def forget_user(user_id):
+    """Сбросить пользователя из кэша (выход, смена пароля)"""
+    user_cache.delete(str(user_id))
+
+
+def hash_password(password):
+    config = current_app.config
+    return generate_password_hash(password, method=config["PASSWORD_HASH_METHOD"],
+                                  salt_length=config["PASSWORD_SALT_LENGTH"])
 
 
 class User(db.Model, UserMixin):
     __tablename__ = 'users'
     id = db.Column(db.Integer(), primary_key=True)
-    username = db.Column(db.String(100), nullable=False)
+    username = db.Column(db.String(100), nullable=False, unique=True, index=True)
     password = db.Column(db.String(100), nullable=False)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password = hash_password(password)
+        if self.id is not None:
+            forget_user(self.id)
 
     def check_password(self, password):
         return check_password_hash(self.password, password)
@@ -30,6 +63,8 @@ class Patient(db.Model):
     name = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(9), nullable=False)
     birthday = db.Column(db.Date, nullable=False)
+    # Увеличивается при каждом изменении; ETag и If-Match для PATCH
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
 
     # def __repr__(self):
     #     return "<Patient: name={}, phone={}, birthday=\"{}\">\n"\
@@ -43,6 +78,8 @@ class Doctor(db.Model):
     phone = db.Column(db.String(9), nullable=False)
     speciality = db.Column(db.String(50), nullable=False)
     qualification = db.Column(db.String(50), nullable=False)
+    # Увеличивается при каждом изменении; ETag и If-Match для PATCH
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
 
 
 class Service(db.Model):
@@ -50,9 +87,28 @@ class Service(db.Model):
                      default=lambda: str(uuid4()))
     name = db.Column(db.String(100), nullable=False)
     price = db.Column(db.Integer, nullable=False, default=0)
+    # Увеличивается при каждом изменении; ETag и If-Match для PATCH
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+
+
+record_services = db.Table(
+    "record_services",
+    db.Column("record_uuid", db.String(36),
+              db.ForeignKey("record.uuid", ondelete="CASCADE"), primary_key=True),
+    db.Column("service_uuid", db.String(36),
+              db.ForeignKey("service.uuid", ondelete="CASCADE"), primary_key=True),
+    db.Index("ix_record_services_service", "service_uuid", "record_uuid"),
+)
 
 
 class Record(db.Model):
+    __table_args__ = (
+        db.Index("ix_record_patient_date", "patient_uuid", "date", "uuid"),
+        db.Index("ix_record_doctor_date", "doctor_uuid", "date", "uuid"),
+        db.Index("ix_record_payment_date", "payment_status", "date", "uuid"),
+        db.Index("ix_record_date", "date", "uuid"),
+    )
+
     uuid = db.Column(db.String(36), primary_key=True,
                      default=lambda: str(uuid4()))
     patient_uuid = db.Column(db.String, db.ForeignKey('patient.uuid'),
@@ -60,11 +116,93 @@ class Record(db.Model):
     doctor_uuid = db.Column(db.String, db.ForeignKey('doctor.uuid'),
                             nullable=False)
     date = db.Column(db.DateTime, nullable=False)
-    # used_services = db.relationship('Services', lazy='select',
-    #                                 backref=db.backref('Record', lazy='joined'))
+    services = db.relationship('Service', secondary=record_services, lazy='select',
+                               backref=db.backref('records', lazy='dynamic'))
+    # Строка uuid услуг через запятую, поддерживается вместе с record_services
     used_services = db.Column(db.String, nullable=False)
-    # used_services = db.Column(db.String, nullable=False)
     disease = db.Column(db.String(200), nullable=False)
     discharge = db.Column(db.String, nullable=False)
+    # Регион случая для рядов /trends; необязателен
+    region = db.Column(db.String(100))
     payment_status = db.Column(db.Boolean, nullable=False, default=False)
     sum = db.Column(db.Integer, nullable=False, default=0)
+    # Увеличивается при каждом изменении; ETag и If-Match для PATCH
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+
+
+class HealthReport(db.Model):
+    # Анонимная отметка пользователя о своем состоянии (health_status=True - болен)
+    uuid = db.Column(db.String(36), primary_key=True,
+                     default=lambda: str(uuid4()))
+    address = db.Column(db.String(200), nullable=False)
+    health_status = db.Column(db.Boolean, nullable=False)
+    created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow,
+                        index=True)
+
+
+class Location(db.Model):
+    # Текущее место и состояние пользователя для поиска соседей (см. api/geo.py).
+    # Строки не удаляются: active=False, чтобы индексы других процессов увидели удаление
+    uuid = db.Column(db.String(36), primary_key=True,
+                     default=lambda: str(uuid4()))
+    address = db.Column(db.String(200))
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    health_status = db.Column(db.Boolean, nullable=False)
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    updated = db.Column(db.DateTime, nullable=False, default=datetime.utcnow,
+                        onupdate=datetime.utcnow, index=True)
+
+
+# Агрегаты, которые обновляются при каждой записи (см. api/stats.py)
+
+class DiseaseDailyStat(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    disease = db.Column(db.String(200), primary_key=True)
+    cases = db.Column(db.Integer, nullable=False, default=0)
+
+
+class CaseSeries(db.Model):
+    # Случаи болезни по дням одного года: 366 чисел int32 (little-endian),
+    # элемент i - день года i + 1 (см. api/timeseries.py). region "" - не указан
+    disease = db.Column(db.String(200), primary_key=True)
+    region = db.Column(db.String(100), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    counts = db.Column(db.LargeBinary, nullable=False)
+
+
+class DoctorStat(db.Model):
+    doctor_uuid = db.Column(db.String(36), primary_key=True)
+    records = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Integer, nullable=False, default=0)
+    unpaid_records = db.Column(db.Integer, nullable=False, default=0)
+    unpaid = db.Column(db.Integer, nullable=False, default=0)
+
+
+class HealthStatusStat(db.Model):
+    health_status = db.Column(db.Boolean, primary_key=True)
+    reports = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Job(db.Model):
+    # Фоновая задача (см. api/jobs.py); params и result хранятся как JSON
+    __table_args__ = (
+        db.Index("ix_job_status_created", "status", "created"),
+    )
+
+    uuid = db.Column(db.String(36), primary_key=True,
+                     default=lambda: str(uuid4()))
+    kind = db.Column(db.String(50), nullable=False)
+    # queued, running, done, failed, cancelled
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    params = db.Column(db.Text, nullable=False, default="{}")
+    progress = db.Column(db.Float, nullable=False, default=0.0)
+    message = db.Column(db.String(200))
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    # hostname:pid воркера, выполняющего задачу
+    worker = db.Column(db.String(100))
+    created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started = db.Column(db.DateTime)
+    finished = db.Column(db.DateTime)
@@ -0,0 +1,114 @@
+import base64
+import binascii
+from datetime import date, datetime
+
+from flask import request, current_app, json, Response, stream_with_context
+from flask_restful import abort
+from sqlalchemy import and_, or_
+
+from api.instrumentation import serialization_timer
+from api.serializers import compile_schema, encode_json, make_json_response
+
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, (date, datetime)) else v
+                      for v in values])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, columns):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw.decode("utf-8"))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        abort(400, message="Bad cursor")
+    if not isinstance(values, list) or len(values) != len(columns):
+        abort(400, message="Bad cursor")
+
+    decoded = []
+    for column, value in zip(columns, values):
+        python_type = column.type.python_type
+        try:
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif python_type is date:
+                value = date.fromisoformat(value)
+        except (TypeError, ValueError):
+            abort(400, message="Bad cursor")
+        decoded.append(value)
+    return decoded
+
+
+def page_limit():
+    limit = request.args.get("limit", current_app.config["PAGE_SIZE"], type=int)
+    if limit is None or limit < 1:
+        abort(400, message="limit must be a positive integer")
+    return min(limit, current_app.config["MAX_PAGE_SIZE"])
+
+
+def after_key(columns, values):
+    """Условие keyset-пагинации: (c1, c2, ...) > (v1, v2, ...)"""
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        clauses.append(and_(*equal, column > values[i]))
+    return or_(*clauses)
+
+
+def keyset_query(query, columns):
+    cursor = request.args.get("after")
+    if cursor:
+        query = query.filter(after_key(columns, decode_cursor(cursor, columns)))
+    return query.order_by(*columns)
+
+
+def stream_ndjson(query, compiled):
+    chunk_size = current_app.config["STREAM_CHUNK_SIZE"]
+
+    def generate():
+        for row in query.yield_per(chunk_size):
+            yield encode_json(compiled.dump_row(row)) + b"\n"
+
+    return Response(stream_with_context(generate()), 200,
+                    mimetype="application/x-ndjson")
+
+
+def fields_arg(schema, name="fields"):
+    """Поля схемы из параметра name через запятую или None (все поля)"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    only = [field.strip() for field in value.split(",") if field.strip()]
+    unknown = sorted(set(only) - set(schema.dump_fields))
+    if unknown:
+        abort(400, message="Unknown {}: {}".format(name, ", ".join(unknown)))
+    return only
+
+
+def make_list_response(query, columns, schema, name):
+    """Отдать страницу списка или весь список потоком (?format=ndjson)
+
+    Выбираются только колонки схемы (или полей из ?fields=), строки
+    сериализуются без ORM-объектов.
+    """
+    model = query.column_descriptions[0]["entity"]
+    compiled = compile_schema(schema, model, only=fields_arg(schema))
+    # Ключи курсора выбираются, даже если их нет среди полей ответа
+    keys = [column.key for column in compiled.columns]
+    extra = [column for column in columns if column.key not in keys]
+    keys.extend(column.key for column in extra)
+    query = keyset_query(query, columns).with_entities(*compiled.columns, *extra)
+
+    if request.args.get("format") == "ndjson":
+        if "limit" in request.args:
+            query = query.limit(page_limit())
+        return stream_ndjson(query, compiled)
+
+    limit = page_limit()
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][keys.index(column.key)] for column in columns])
+    with serialization_timer():
+        return make_json_response(200, {"next": next_cursor, name: compiled.dump_rows(rows)})
@@ -1,4 +1,51 @@
-from marshmallow import Schema, fields
+from marshmallow import Schema, fields, validate, EXCLUDE
+
+
+class LoadSchema(Schema):
+    # Поля вне схемы (uuid, version, sum из выгрузки) отбрасываются, а не считаются ошибкой
+    class Meta:
+        unknown = EXCLUDE
+
+
+class UserSchema(LoadSchema):
+    username = fields.String(attribute="username", required=True,
+                             validate=validate.Length(min=1, max=100))
+    password = fields.String(attribute="password", required=True,
+                             validate=validate.Length(min=1))
+
+
+class PatientSchema(LoadSchema):
+    name = fields.String(attribute="name", required=True, validate=validate.Length(max=100))
+    phone = fields.String(attribute="phone", required=True, validate=validate.Length(max=9))
+    birthday = fields.Date(attribute="birthday", required=True)
+
+
+class DoctorSchema(LoadSchema):
+    name = fields.String(attribute="name", required=True, validate=validate.Length(max=100))
+    phone = fields.String(attribute="phone", required=True, validate=validate.Length(max=9))
+    speciality = fields.String(attribute="speciality", required=True,
+                               validate=validate.Length(max=50))
+    qualification = fields.String(attribute="qualification", required=True,
+                                  validate=validate.Length(max=50))
+
+
+class ServiceSchema(LoadSchema):
+    name = fields.String(attribute="name", required=True, validate=validate.Length(max=100))
+    price = fields.Integer(attribute="price", required=True, validate=validate.Range(min=0))
+
+
+class RecordSchema(LoadSchema):
+    # patient_uuid берется из адреса (/patients/<uuid>/records) или из элемента пакета
+    doctor_uuid = fields.String(attribute="doctor_uuid", required=True)
+    date = fields.DateTime(attribute="date", required=True)
+    # Список uuid или имен услуг, JSON-массив или строка через запятую (см. parse_service_refs)
+    used_services = fields.Raw(attribute="used_services", required=True)
+    disease = fields.String(attribute="disease", required=True, validate=validate.Length(max=200))
+    discharge = fields.String(attribute="discharge", required=True)
+    region = fields.String(attribute="region", allow_none=True, validate=validate.Length(max=100))
+    payment_status = fields.Boolean(attribute="payment_status", required=True)
+    # Поля sum нет: сумма считается на сервере по услугам при каждой записи,
+    # а значение клиента отбрасывается как неизвестное поле
 
 class UserDataSchema(Schema):
     name = fields.String(attribute="name", required=True)
@@ -9,3 +56,21 @@ class UserDataSchema(Schema):
     health_status = fields.Boolean(attribute="address", required=True)
     percentage = fields.Decimal(attribute="percentage", required=True)
     password = fields.String(attribute="password", required=True)
+
+
+class HealthReportSchema(Schema):
+    address = fields.String(attribute="address", required=True)
+    health_status = fields.Boolean(attribute="health_status", required=True)
+
+
+class JobSchema(Schema):
+    kind = fields.String(required=True)
+    params = fields.Dict(keys=fields.String(), load_default=dict)
+
+
+class LocationSchema(Schema):
+    # Координаты можно не передавать, если задан GEOCODER и есть адрес
+    address = fields.String(attribute="address")
+    latitude = fields.Float(attribute="latitude", validate=validate.Range(-90, 90))
+    longitude = fields.Float(attribute="longitude", validate=validate.Range(-180, 180))
+    health_status = fields.Boolean(attribute="health_status", required=True)
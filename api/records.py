@@ -0,0 +1,219 @@
+import re
+from datetime import timedelta
+
+from flask import json, current_app, request
+from sqlalchemy import func, or_, and_, case
+
+from api.batch import chunked, update_rows
+from api.models import Record, Service, record_services
+from api.stats import bulk_record_deltas
+from api.utils import bool_arg, datetime_arg
+from extensions import db
+
+SERVICE_SEPARATOR = re.compile(r"[,;]")
+
+
+def parse_service_refs(value):
+    """Разобрать used_services: список, JSON-массив или строка через запятую"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            value = json.loads(text) if text.startswith("[") else None
+        except ValueError:
+            value = None
+        if value is None:
+            value = SERVICE_SEPARATOR.split(text.strip("[]"))
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+
+    refs = []
+    for ref in value:
+        ref = str(ref).strip().strip('"\'')
+        if ref and ref not in refs:
+            refs.append(ref)
+    return refs
+
+
+def service_lookup(refs=None):
+    """Словарь {uuid или название в нижнем регистре: услуга} одним запросом"""
+    query = db.session.query(Service)
+    if refs is not None:
+        refs = list(refs)
+        if not refs:
+            return {}
+        query = query.filter(or_(Service.uuid.in_(refs),
+                                 func.lower(Service.name).in_([ref.lower() for ref in refs])))
+    lookup = {}
+    for service in query:
+        lookup.setdefault(service.name.lower(), service)
+        lookup[service.uuid] = service
+    return lookup
+
+
+def pick_services(lookup, refs):
+    services, missing = [], []
+    for ref in refs:
+        service = lookup.get(ref) or lookup.get(ref.lower())
+        if service is None:
+            missing.append(ref)
+        elif service not in services:
+            services.append(service)
+    return services, missing
+
+
+def attach_services(record, value):
+    """Связать запись с услугами и посчитать сумму на сервере; вернуть ненайденные"""
+    refs = parse_service_refs(value)
+    services, missing = pick_services(service_lookup(refs), refs)
+    if missing:
+        return missing
+    record.services = services
+    record.used_services = ",".join(service.uuid for service in services)
+    record.sum = sum(service.price for service in services)
+    return []
+
+
+def prepare_record_services(pending, replace=False):
+    """Подготовить связи с услугами для пакета записей
+
+    pending - список (index, args) с уже назначенным args["uuid"].
+    Возвращает (операции для выполнения после вставки, {index: ошибки}).
+    """
+    refs = {index: parse_service_refs(args["used_services"])
+            for index, args in pending if "used_services" in args}
+    lookup = service_lookup({ref for item_refs in refs.values() for ref in item_refs})
+
+    rows, replaced, errors = [], [], {}
+    for index, args in pending:
+        if index not in refs:
+            continue
+        services, missing = pick_services(lookup, refs[index])
+        if missing:
+            errors[index] = {"used_services": ["Unknown services: {}".format(", ".join(missing))]}
+            continue
+        args["used_services"] = ",".join(service.uuid for service in services)
+        args["sum"] = sum(service.price for service in services)
+        replaced.append(args["uuid"])
+        rows.extend({"record_uuid": args["uuid"], "service_uuid": service.uuid}
+                    for service in services)
+
+    statements = []
+    if replace:
+        statements.extend(
+            lambda chunk=chunk: db.session.execute(
+                record_services.delete().where(record_services.c.record_uuid.in_(chunk)))
+            for chunk in chunked(replaced, current_app.config["BATCH_CHUNK_SIZE"]))
+    if rows:
+        statements.append(lambda: db.session.execute(record_services.insert(), rows))
+    return statements, errors
+
+
+def filter_records(query):
+    """Фильтры списка записей: patient, doctor, service, date_from, date_to, paid"""
+    patient_uuid = request.args.get("patient")
+    if patient_uuid:
+        query = query.filter(Record.patient_uuid == patient_uuid)
+    doctor_uuid = request.args.get("doctor")
+    if doctor_uuid:
+        query = query.filter(Record.doctor_uuid == doctor_uuid)
+    service_uuid = request.args.get("service")
+    if service_uuid:
+        query = query.join(record_services, record_services.c.record_uuid == Record.uuid) \
+            .filter(record_services.c.service_uuid == service_uuid)
+
+    date_from = datetime_arg("date_from")
+    if date_from is not None:
+        query = query.filter(Record.date >= date_from[0])
+    date_to = datetime_arg("date_to")
+    if date_to is not None:
+        value, date_only = date_to
+        # Дата без времени включает весь день
+        query = query.filter(Record.date < value + timedelta(days=1) if date_only
+                             else Record.date <= value)
+
+    paid = bool_arg("paid")
+    if paid is not None:
+        query = query.filter(Record.payment_status == paid)
+    return query
+
+
+def prepare_records(pending, replace=False):
+    """prepare для пакетного создания/обновления записей: услуги, суммы и агрегаты"""
+    statements, errors = prepare_record_services(pending, replace=replace)
+    accepted = [args for index, args in pending if index not in errors]
+    if replace:
+        deltas = bulk_record_deltas(updated=accepted)
+    else:
+        deltas = bulk_record_deltas(created=accepted)
+    statements.append(lambda: deltas.apply(db.session))
+    return statements, errors
+
+
+def prepare_records_delete(uuids):
+    """prepare для пакетного удаления записей: связи с услугами и агрегаты"""
+    deltas = bulk_record_deltas(deleted=uuids)
+    statements = [lambda: deltas.apply(db.session)]
+    statements.extend(
+        lambda chunk=chunk: db.session.execute(
+            record_services.delete().where(record_services.c.record_uuid.in_(chunk)))
+        for chunk in chunked(uuids, current_app.config["BATCH_CHUNK_SIZE"]))
+    return statements
+
+
+def service_revenue(paid=None):
+    """Выручка и число записей по каждой услуге (GROUP BY в SQL)"""
+    joined = Record.uuid == record_services.c.record_uuid
+    if paid is not None:
+        joined = and_(joined, Record.payment_status == paid)
+    return db.session.query(
+        Service.uuid, Service.name,
+        func.count(Record.uuid).label("records"),
+        func.coalesce(func.sum(case((Record.uuid.isnot(None), Service.price), else_=0)), 0)
+        .label("revenue"),
+    ).outerjoin(record_services, record_services.c.service_uuid == Service.uuid) \
+        .outerjoin(Record, joined) \
+        .group_by(Service.uuid, Service.name) \
+        .order_by(func.count(Record.uuid).desc(), Service.uuid)
+
+
+def migrate_used_services(recompute_sums=False, chunk_size=1000, progress=None):
+    """Перенести строки used_services в таблицу record_services
+
+    Повторный запуск безопасен: связи записи пересоздаются.
+    progress(обработано, всего) вызывается после фиксации каждой порции.
+    Возвращает (обработано записей, список (uuid записи, ненайденные услуги)).
+    """
+    lookup = service_lookup()
+    total = db.session.query(Record).count() if progress else None
+    processed, unresolved, last = 0, [], ""
+    while True:
+        chunk = db.session.query(Record.uuid, Record.used_services) \
+            .filter(Record.uuid > last).order_by(Record.uuid).limit(chunk_size).all()
+        if not chunk:
+            break
+        last = chunk[-1].uuid
+
+        rows, sums = [], []
+        for record_uuid, used_services in chunk:
+            services, missing = pick_services(lookup, parse_service_refs(used_services))
+            if missing:
+                unresolved.append((record_uuid, missing))
+            rows.extend({"record_uuid": record_uuid, "service_uuid": service.uuid}
+                        for service in services)
+            if recompute_sums:
+                sums.append({"uuid": record_uuid,
+                             "sum": sum(service.price for service in services)})
+
+        db.session.execute(record_services.delete().where(
+            record_services.c.record_uuid.in_([row.uuid for row in chunk])))
+        if rows:
+            db.session.execute(record_services.insert(), rows)
+        if sums:
+            update_rows(Record, sums)
+        db.session.commit()
+        processed += len(chunk)
+        if progress:
+            progress(processed, total)
+    return processed, unresolved
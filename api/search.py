@@ -0,0 +1,173 @@
+import re
+
+from flask import request
+from flask_restful import abort
+from sqlalchemy import Column, Integer, and_, or_, bindparam, event, exc, literal, select, text, \
+    union_all
+
+from api.models import Patient, Doctor, Record
+from api.pagination import encode_cursor, decode_cursor, page_limit
+from extensions import db
+
+# ресурс -> (модель, колонки, веса колонок в bm25)
+SEARCHES = {
+    "records": (Record, ("disease", "discharge"), (2.0, 1.0)),
+    "patients": (Patient, ("name",), (1.0,)),
+    "doctors": (Doctor, ("name", "speciality"), (2.0, 1.0)),
+}
+
+MAX_TERMS = 10
+SNIPPET_TOKENS = 12
+# Тип значения в курсоре поиска (смещение) для decode_cursor
+OFFSET = Column("offset", Integer)
+
+
+def fts_table(model):
+    return model.__table__.name + "_fts"
+
+
+def fts_statements(model, columns):
+    """CREATE для таблицы FTS5 над model и триггеров, которые держат ее в синхронизации
+
+    Таблица внешнего содержимого: текст хранится только в самой модели,
+    в индексе - rowid строки. Триггеры ловят и массовые UPDATE/DELETE,
+    которые идут мимо событий ORM.
+    """
+    table, fts = model.__table__.name, fts_table(model)
+    names = ", ".join(columns)
+    new = ", ".join("new." + column for column in columns)
+    old = ", ".join("old." + column for column in columns)
+    insert = "INSERT INTO {fts}(rowid, {names}) VALUES (new.rowid, {new});"
+    delete = "INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.rowid, {old});"
+    statements = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, content='{table}', "
+        "content_rowid='rowid', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        "CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN " + insert + " END",
+        "CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN " + delete + " END",
+        "CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {names} ON {table} BEGIN "
+        + delete + " " + insert + " END",
+    ]
+    return [statement.format(fts=fts, table=table, names=names, new=new, old=old)
+            for statement in statements]
+
+
+def create_fts(connection, model, columns):
+    try:
+        for statement in fts_statements(model, columns):
+            connection.exec_driver_sql(statement)
+    except exc.OperationalError:
+        # SQLite без модуля fts5: поиск работает через LIKE
+        return False
+    return True
+
+
+def create_search_index(connection, rebuild=False):
+    """Создать таблицы FTS5 и триггеры; False, если SQLite собран без FTS5
+
+    rebuild=True заново индексирует уже существующие строки (после создания
+    индекса в старой базе или после VACUUM, который может сменить rowid).
+    """
+    if connection.dialect.name != "sqlite":
+        return False
+    for model, columns, _ in SEARCHES.values():
+        if not create_fts(connection, model, columns):
+            return False
+        if rebuild:
+            connection.exec_driver_sql(
+                "INSERT INTO {0}({0}) VALUES ('rebuild')".format(fts_table(model)))
+    return True
+
+
+def on_create(target, connection, **kw):
+    """После CREATE TABLE модели (db.create_all) создать и ее индекс FTS5"""
+    for model, columns, _ in SEARCHES.values():
+        if model.__table__ is target and connection.dialect.name == "sqlite":
+            create_fts(connection, model, columns)
+
+
+for _model, _, _ in SEARCHES.values():
+    event.listen(_model.__table__, "after_create", on_create)
+
+
+def search_terms():
+    """Слова запроса ?q= как запрос FTS5: все слова, каждое как префикс"""
+    terms = re.findall(r"\w+", request.args.get("q", ""))[:MAX_TERMS]
+    if not terms:
+        abort(400, message="q must contain at least one word")
+    return terms
+
+
+def search_resources():
+    value = request.args.get("in")
+    if not value:
+        return list(SEARCHES)
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = sorted(set(names) - set(SEARCHES))
+    if unknown:
+        abort(400, message="Unknown search resources: {}".format(", ".join(unknown)))
+    return names
+
+
+def indexed(names):
+    """Есть ли таблицы FTS5 для всех names в базе, из которой читает сессия"""
+    if db.session.connection().dialect.name != "sqlite":
+        return False
+    tables = [fts_table(SEARCHES[name][0]) for name in names]
+    found = db.session.execute(
+        text("SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name IN :names")
+        .bindparams(bindparam("names", expanding=True)), {"names": tables}).scalar()
+    return found == len(tables)
+
+
+def fts_select(name):
+    model, columns, weights = SEARCHES[name]
+    table, fts = model.__table__.name, fts_table(model)
+    return ("SELECT '{name}' AS type, {table}.uuid AS uuid, "
+            "-bm25({fts}, {weights}) AS score, "
+            "snippet({fts}, -1, '[', ']', '...', {tokens}) AS snippet "
+            "FROM {fts} JOIN {table} ON {table}.rowid = {fts}.rowid "
+            "WHERE {fts} MATCH :match").format(
+        name=name, table=table, fts=fts, tokens=SNIPPET_TOKENS,
+        weights=", ".join(str(weight) for weight in weights))
+
+
+def like_select(name, terms):
+    """Запасной поиск без FTS5: каждое слово - подстрока какой-нибудь колонки"""
+    model, columns, _ = SEARCHES[name]
+    columns = [getattr(model, column) for column in columns]
+    return select(literal(name).label("type"), model.uuid.label("uuid"),
+                  literal(0.0).label("score"), columns[0].label("snippet")) \
+        .where(and_(*[or_(*[column.contains(term, autoescape=True) for column in columns])
+                      for term in terms]))
+
+
+def search():
+    """Страница результатов поиска: (строки (ресурс, uuid, вес, фрагмент), курсор)
+
+    С FTS5 результаты упорядочены по bm25, иначе - по ресурсу и uuid.
+    Курсор - смещение: поиск все равно ранжирует все совпадения.
+    """
+    terms = search_terms()
+    names = search_resources()
+    limit = page_limit()
+    cursor = request.args.get("after")
+    offset = decode_cursor(cursor, [OFFSET])[0] if cursor else 0
+    if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+        abort(400, message="Bad cursor")
+
+    if indexed(names):
+        match = " ".join('"{}"*'.format(term) for term in terms)
+        query = text(" UNION ALL ".join(fts_select(name) for name in names)
+                     + " ORDER BY score DESC, uuid LIMIT :limit OFFSET :offset")
+        rows = db.session.execute(query, {"match": match, "limit": limit + 1,
+                                          "offset": offset}).all()
+    else:
+        union = union_all(*[like_select(name, terms) for name in names]).subquery()
+        rows = db.session.execute(select(union).order_by(union.c.type, union.c.uuid)
+                                  .limit(limit + 1).offset(offset)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([offset + limit])
+    return rows, next_cursor
@@ -0,0 +1,103 @@
+from flask import current_app, json
+from marshmallow import fields
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ISO_FORMATS = (None, "iso", "iso8601")
+
+
+def optional(convert):
+    return lambda value: None if value is None else convert(value)
+
+
+def isoformat(value):
+    return value.isoformat()
+
+
+def converter(field):
+    """Функция значение -> значение как в field._serialize, без лишних проверок"""
+    kind = type(field)
+    if kind is fields.String:
+        return optional(str)
+    if kind is fields.Integer and not field.as_string:
+        return optional(int)
+    if kind is fields.Boolean:
+        return optional(bool)
+    if kind in (fields.Date, fields.DateTime) and field.format in ISO_FORMATS:
+        return optional(isoformat)
+    return lambda value: field._serialize(value, None, None)
+
+
+class CompiledSchema(object):
+    """Сериализатор схемы marshmallow для кортежей колонок вместо ORM-объектов
+
+    Результат совпадает с schema.dump(objects), но не создает объекты модели
+    и не обходит поля схемы для каждой строки.
+    """
+
+    def __init__(self, schema, model, only=None):
+        self.keys, self.columns, self.converters = [], [], []
+        # Порядок объявления в схеме или порядок only
+        names = only if only is not None else schema.declared_fields
+        for name in names:
+            field = schema.dump_fields.get(name)
+            if field is None:
+                continue
+            self.keys.append(field.data_key or name)
+            self.columns.append(getattr(model, field.attribute or name))
+            self.converters.append(converter(field))
+        self.fields = list(zip(self.keys, self.converters))
+
+    def dump_row(self, row):
+        return {key: convert(value) for (key, convert), value in zip(self.fields, row)}
+
+    def dump_rows(self, rows):
+        fields_ = self.fields
+        return [{key: convert(value) for (key, convert), value in zip(fields_, row)}
+                for row in rows]
+
+
+_compiled = {}
+
+
+def compile_schema(schema, model, only=None):
+    key = (type(schema), model, tuple(only) if only is not None else None)
+    compiled = _compiled.get(key)
+    if compiled is None:
+        compiled = _compiled[key] = CompiledSchema(schema, model, only)
+    return compiled
+
+
+def encode_json(payload):
+    """JSON-байты, совпадающие с телом jsonify (без завершающего перевода строки)
+
+    orjson используется, только если результат побайтно равен json.dumps
+    с настройками Flask: компактные разделители, сортировка ключей, ASCII.
+    Вызывать только для данных из строк, целых, bool и None.
+    """
+    config = current_app.config
+    pretty = config.get("JSONIFY_PRETTYPRINT_REGULAR") or current_app.debug
+    if orjson is not None and not pretty and config.get("JSON_SORT_KEYS", True):
+        body = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+        # json.dumps(ensure_ascii=True) экранирует все вне 0x20-0x7e, orjson - нет
+        if not config.get("JSON_AS_ASCII", True) or (body.isascii() and b"\x7f" not in body):
+            return body
+    if pretty:
+        return json.dumps(payload, indent=2, separators=(", ", ": ")).encode("utf-8")
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def json_mimetype():
+    # До Flask 2.2 - JSONIFY_MIMETYPE, начиная с 2.2 - app.json.mimetype (ключ удален в 2.3)
+    provider = getattr(current_app, "json", None)
+    return getattr(provider, "mimetype", None) or \
+        current_app.config.get("JSONIFY_MIMETYPE") or "application/json"
+
+
+def make_json_response(status_code, payload):
+    response = current_app.response_class(encode_json(payload) + b"\n", mimetype=json_mimetype())
+    response.status_code = status_code
+    return response
@@ -0,0 +1,32 @@
+import gc
+
+from sqlalchemy.orm import configure_mappers
+
+from api.export import EXPORTS, load_pyarrow
+from api.fields import jobs_info_schema
+from api.models import Job
+from api.serializers import compile_schema
+from api.timeseries import load_numpy
+
+
+def warm_up(app):
+    """Подготовить приложение в мастер-процессе до fork воркеров (preload_app)
+
+    Все, что обычно делает первый запрос каждого воркера, делается один раз:
+    загрузка необязательных модулей (numpy, pyarrow), настройка мапперов
+    SQLAlchemy, компиляция схем списков и выгрузок и шаблонов Jinja. Затем
+    объекты переносятся в постоянное поколение сборщика мусора (gc.freeze):
+    сборки в воркерах их не обходят, и общие с мастером страницы памяти
+    не копируются. Соединения с базой здесь не открываются.
+    """
+    if app.config.get("PRELOAD_OPTIONAL_MODULES", True):
+        load_numpy()
+        load_pyarrow()
+    configure_mappers()
+    for model, schema, _ in EXPORTS.values():
+        compile_schema(schema, model)
+    compile_schema(jobs_info_schema, Job)
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    gc.collect()
+    gc.freeze()
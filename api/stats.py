@@ -0,0 +1,222 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, func, inspect, case, and_, bindparam
+from sqlalchemy.orm import Session
+
+from api.batch import UPSERTS, chunked, dialect_name
+from api.models import Record, HealthReport, DiseaseDailyStat, CaseSeries, DoctorStat, HealthStatusStat
+from api.timeseries import apply_series
+from extensions import db
+
+RECORD_FIELDS = ("date", "disease", "region", "doctor_uuid", "sum", "payment_status")
+
+
+def as_day(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+class Deltas(object):
+    """Накопленные изменения агрегатов для одного flush/пакета"""
+
+    def __init__(self):
+        self.cases = defaultdict(int)
+        # (болезнь, регион, день) -> случаи, для рядов CaseSeries
+        self.series = defaultdict(int)
+        self.doctors = defaultdict(lambda: [0, 0, 0, 0])
+        self.health = defaultdict(int)
+
+    def add_record(self, values, sign):
+        day = as_day(values["date"])
+        self.cases[(day, values["disease"])] += sign
+        self.series[(values["disease"], values.get("region") or "", day)] += sign
+        total = values["sum"] or 0
+        doctor = self.doctors[values["doctor_uuid"]]
+        doctor[0] += sign
+        doctor[1] += sign * total
+        if not values["payment_status"]:
+            doctor[2] += sign
+            doctor[3] += sign * total
+
+    def add_report(self, health_status, sign):
+        self.health[bool(health_status)] += sign
+
+    def apply(self, session):
+        with session.no_autoflush:
+            increment(session, DiseaseDailyStat, [
+                {"day": day, "disease": disease, "cases": cases}
+                for (day, disease), cases in self.cases.items() if cases])
+            apply_series(session, self.series)
+            increment(session, DoctorStat, [
+                {"doctor_uuid": key, "records": records, "revenue": revenue,
+                 "unpaid_records": unpaid_records, "unpaid": unpaid}
+                for key, (records, revenue, unpaid_records, unpaid) in self.doctors.items()
+                if records or revenue or unpaid_records or unpaid])
+            increment(session, HealthStatusStat, [
+                {"health_status": key, "reports": reports}
+                for key, reports in self.health.items() if reports])
+
+
+def increment(session, model, rows):
+    """Прибавить значения rows к строкам агрегата model, создав недостающие
+
+    Сложение делает сама база (col = col + :delta), а не Python после
+    чтения строки: pysqlite открывает транзакцию только на первой записи,
+    и одновременные писатели иначе затирали бы изменения друг друга.
+    """
+    if not rows:
+        return
+    table = model.__table__
+    keys = [column.key for column in table.primary_key]
+    counters = [column.key for column in table.columns if not column.primary_key]
+    dialect = dialect_name(session, table.insert())
+    if dialect in UPSERTS:
+        statement = UPSERTS[dialect](table)
+        statement = statement.on_conflict_do_update(
+            index_elements=keys,
+            set_={name: table.c[name] + statement.excluded[name] for name in counters})
+        session.execute(statement, rows)
+        return
+    update = table.update() \
+        .where(and_(*[table.c[key] == bindparam("key_" + key) for key in keys])) \
+        .values({name: table.c[name] + bindparam("delta_" + name) for name in counters})
+    for row in rows:
+        updated = session.execute(update, dict(
+            {"key_" + key: row[key] for key in keys},
+            **{"delta_" + name: row[name] for name in counters}))
+        if not updated.rowcount:
+            session.execute(table.insert(), row)
+
+
+def current_values(instance, fields):
+    return {field: getattr(instance, field) for field in fields}
+
+
+def previous_values(instance, fields):
+    state = inspect(instance)
+    values = {}
+    for field in fields:
+        history = state.attrs[field].history
+        values[field] = history.deleted[0] if history.deleted else getattr(instance, field)
+    return values
+
+
+def changed(instance, fields):
+    state = inspect(instance)
+    return any(state.attrs[field].history.has_changes() for field in fields)
+
+
+@event.listens_for(Session, "before_flush")
+def update_rollups(session, flush_context, instances):
+    deltas = Deltas()
+    for instance in session.new:
+        if isinstance(instance, Record):
+            deltas.add_record(current_values(instance, RECORD_FIELDS), 1)
+        elif isinstance(instance, HealthReport):
+            deltas.add_report(instance.health_status, 1)
+    for instance in session.dirty:
+        if isinstance(instance, Record) and changed(instance, RECORD_FIELDS):
+            deltas.add_record(previous_values(instance, RECORD_FIELDS), -1)
+            deltas.add_record(current_values(instance, RECORD_FIELDS), 1)
+        elif isinstance(instance, HealthReport) and changed(instance, ("health_status",)):
+            deltas.add_report(previous_values(instance, ("health_status",))["health_status"], -1)
+            deltas.add_report(instance.health_status, 1)
+    for instance in session.deleted:
+        if isinstance(instance, Record):
+            deltas.add_record(previous_values(instance, RECORD_FIELDS), -1)
+        elif isinstance(instance, HealthReport):
+            deltas.add_report(previous_values(instance, ("health_status",))["health_status"], -1)
+    deltas.apply(session)
+
+
+def record_rows(uuids):
+    """Текущие значения агрегируемых полей записей (для пакетных операций)"""
+    columns = [getattr(Record, field) for field in RECORD_FIELDS]
+    rows = {}
+    for chunk in chunked(uuids, current_app.config["BATCH_CHUNK_SIZE"]):
+        for row in db.session.query(Record.uuid, *columns).filter(Record.uuid.in_(chunk)):
+            rows[row[0]] = dict(zip(RECORD_FIELDS, row[1:]))
+    return rows
+
+
+def bulk_record_deltas(created=(), updated=(), deleted=()):
+    """Изменения агрегатов для bulk-операций, которые не вызывают before_flush
+
+    created/updated - словари значений записей (updated должны содержать uuid),
+    deleted - uuid удаляемых записей. Старые значения читаются до изменения.
+    """
+    deltas = Deltas()
+    for values in created:
+        deltas.add_record(values, 1)
+    previous = record_rows([values["uuid"] for values in updated] + list(deleted))
+    for values in updated:
+        old = previous.get(values["uuid"])
+        if old is not None:
+            deltas.add_record(old, -1)
+            deltas.add_record(dict(old, **{field: values[field] for field in RECORD_FIELDS
+                                           if field in values}), 1)
+    for uuid in deleted:
+        if uuid in previous:
+            deltas.add_record(previous[uuid], -1)
+    return deltas
+
+
+def rebuild_stats():
+    """Пересчитать все агрегаты с нуля одним GROUP BY на таблицу"""
+    for model in (DiseaseDailyStat, CaseSeries, DoctorStat, HealthStatusStat):
+        db.session.query(model).delete()
+
+    deltas = Deltas()
+    day = func.date(Record.date)
+    for day_value, disease, region, cases in db.session.query(
+            day, Record.disease, Record.region, func.count()) \
+            .group_by(day, Record.disease, Record.region):
+        day_value = datetime.strptime(day_value, "%Y-%m-%d").date() \
+            if isinstance(day_value, str) else day_value
+        deltas.cases[(day_value, disease)] += cases
+        deltas.series[(disease, region or "", day_value)] += cases
+    unpaid = Record.payment_status.is_(False)
+    for doctor_uuid, records, revenue, unpaid_records, unpaid_sum in db.session.query(
+            Record.doctor_uuid, func.count(), func.coalesce(func.sum(Record.sum), 0),
+            func.sum(case((unpaid, 1), else_=0)),
+            func.sum(case((unpaid, Record.sum), else_=0))) \
+            .group_by(Record.doctor_uuid):
+        deltas.doctors[doctor_uuid] = [records, revenue, unpaid_records, unpaid_sum]
+    for health_status, reports in db.session.query(HealthReport.health_status, func.count()) \
+            .group_by(HealthReport.health_status):
+        deltas.health[health_status] = reports
+    deltas.apply(db.session)
+    db.session.commit()
+
+
+def cases_by_period(period="day", disease=None, date_from=None, date_to=None):
+    query = db.session.query(DiseaseDailyStat.day, DiseaseDailyStat.disease,
+                             DiseaseDailyStat.cases) \
+        .filter(DiseaseDailyStat.cases > 0)
+    if disease:
+        query = query.filter(DiseaseDailyStat.disease == disease)
+    if date_from:
+        query = query.filter(DiseaseDailyStat.day >= date_from)
+    if date_to:
+        query = query.filter(DiseaseDailyStat.day <= date_to)
+
+    totals = defaultdict(int)
+    for day, disease_name, cases in query.order_by(DiseaseDailyStat.day):
+        if period == "week":
+            day = day - timedelta(days=day.weekday())
+        totals[(day, disease_name)] += cases
+    return [{"period": day.isoformat(), "disease": disease_name, "cases": cases}
+            for (day, disease_name), cases in sorted(totals.items())]
+
+
+def health_percentages():
+    counts = dict(db.session.query(HealthStatusStat.health_status, HealthStatusStat.reports))
+    total = sum(counts.values())
+    infected = counts.get(True, 0)
+    return {
+        "total": total,
+        "infected": infected,
+        "healthy": counts.get(False, 0),
+        "infected_percentage": round(100.0 * infected / total, 2) if total else 0.0,
+    }
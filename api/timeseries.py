@@ -0,0 +1,194 @@
+import sys
+from array import array
+from collections import defaultdict
+from datetime import date, timedelta
+
+from flask import request, current_app
+from flask_restful import abort
+from sqlalchemy import and_, select
+
+from api.batch import UPSERTS, dialect_name
+from api.models import CaseSeries
+from api.utils import datetime_arg, optional_module
+from extensions import db
+
+# numpy загружается при первом запросе /trends (load_numpy), а не при старте
+numpy = None
+
+DAYS = 366
+EMPTY = bytes(4 * DAYS)
+RESOLUTIONS = ("day", "week", "month")
+# Окно скользящего среднего по умолчанию, в точках ряда
+WINDOWS = {"day": 7, "week": 4, "month": 3}
+
+
+def load_numpy():
+    global numpy
+    if numpy is None:
+        numpy = optional_module("numpy")
+    return numpy
+
+
+def unpack(blob):
+    counts = array("i")
+    counts.frombytes(blob)
+    if sys.byteorder == "big":
+        counts.byteswap()
+    return counts
+
+
+def pack(counts):
+    if sys.byteorder == "big":
+        counts = array("i", counts)
+        counts.byteswap()
+    return counts.tobytes()
+
+
+def apply_series(session, changes):
+    """Прибавить изменения {(болезнь, регион, день): число} к годовым рядам
+
+    Ряд читается и пишется целиком, поэтому писатели одного ряда идут по
+    очереди: строка сначала создается (INSERT ... ON CONFLICT DO NOTHING),
+    что в SQLite берет блокировку записи до конца транзакции, а затем
+    читается с FOR UPDATE (блокировка строки в PostgreSQL).
+    """
+    slots = defaultdict(list)
+    for (disease, region, day), delta in changes.items():
+        if delta:
+            slots[(disease, region, day.year)].append((day.timetuple().tm_yday - 1, delta))
+    if not slots:
+        return
+    table = CaseSeries.__table__
+    dialect = dialect_name(session, table.insert())
+    for (disease, region, year), deltas in sorted(slots.items()):
+        key = {"disease": disease, "region": region, "year": year}
+        where = and_(table.c.disease == disease, table.c.region == region, table.c.year == year)
+        if dialect in UPSERTS:
+            session.execute(UPSERTS[dialect](table).values(counts=EMPTY, **key)
+                            .on_conflict_do_nothing(index_elements=list(key)))
+        blob = session.execute(select(table.c.counts).where(where).with_for_update()).scalar()
+        counts = unpack(blob if blob is not None else EMPTY)
+        for slot, delta in deltas:
+            counts[slot] += delta
+        if blob is None:
+            session.execute(table.insert().values(counts=pack(counts), **key))
+        else:
+            session.execute(table.update().where(where).values(counts=pack(counts)))
+
+
+def daily_counts(start, end, disease=None, region=None):
+    """Массив случаев по дням от start до end включительно (сумма подходящих рядов)"""
+    query = db.session.query(CaseSeries.year, CaseSeries.counts) \
+        .filter(CaseSeries.year.between(start.year, end.year))
+    if disease is not None:
+        query = query.filter(CaseSeries.disease == disease)
+    if region is not None:
+        query = query.filter(CaseSeries.region == region)
+    daily = numpy.zeros((end - start).days + 1, dtype=numpy.int64)
+    for year, blob in query:
+        first = date(year, 1, 1)
+        low, high = max(start, first), min(end, date(year, 12, 31))
+        counts = numpy.frombuffer(blob, dtype="<i4")
+        daily[(low - start).days:(high - start).days + 1] += \
+            counts[(low - first).days:(high - first).days + 1]
+    return daily
+
+
+def period_starts(start, end, resolution):
+    """Начала периодов (понедельник недели, первое число месяца), первое - не раньше start"""
+    if resolution == "day":
+        return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    if resolution == "week":
+        day = start - timedelta(days=start.weekday())
+        step = lambda value: value + timedelta(days=7)
+    else:
+        day = start.replace(day=1)
+        step = lambda value: date(value.year + value.month // 12, value.month % 12 + 1, 1)
+    starts = []
+    while day <= end:
+        starts.append(day)
+        day = step(day)
+    return starts
+
+
+def downsample(daily, start, end, resolution):
+    """(метки периодов, суммы по периодам); крайние периоды могут быть неполными"""
+    labels = period_starts(start, end, resolution)
+    if resolution == "day":
+        return labels, daily
+    offsets = [max(0, (label - start).days) for label in labels]
+    return labels, numpy.add.reduceat(daily, offsets)
+
+
+def moving_average(values, window):
+    """Скользящее среднее за window точек; первые window - 1 точек - NaN"""
+    result = numpy.full(len(values), numpy.nan)
+    if window <= len(values):
+        sums = numpy.cumsum(values, dtype=numpy.float64)
+        sums[window:] = sums[window:] - sums[:-window]
+        result[window - 1:] = sums[window - 1:] / window
+    return result
+
+
+def growth(values):
+    """Рост к предыдущей точке: (v[t] - v[t-1]) / v[t-1]; NaN, если v[t-1] = 0"""
+    result = numpy.full(len(values), numpy.nan)
+    previous = values[:-1].astype(numpy.float64)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        result[1:] = numpy.where(previous > 0, (values[1:] - previous) / previous, numpy.nan)
+    return result
+
+
+def as_list(values, digits=4):
+    return [None if numpy.isnan(value) else round(float(value), digits) for value in values]
+
+
+def trend():
+    """Ряд случаев по параметрам запроса /trends"""
+    if load_numpy() is None:
+        abort(501, message="trends require numpy")
+    date_to = datetime_arg("date_to")
+    end = date_to[0].date() if date_to else date.today()
+    date_from = datetime_arg("date_from")
+    start = date_from[0].date() if date_from else end - timedelta(days=364)
+    if start > end:
+        abort(400, message="date_from must not be after date_to")
+    if (end - start).days >= current_app.config["TRENDS_MAX_DAYS"]:
+        abort(400, message="The range must be shorter than {} days".format(
+            current_app.config["TRENDS_MAX_DAYS"]))
+
+    resolution = request.args.get("resolution", "auto")
+    if resolution == "auto":
+        span = (end - start).days
+        resolution = "day" if span <= 92 else "week" if span <= 731 else "month"
+    elif resolution not in RESOLUTIONS:
+        abort(400, message="resolution must be auto, day, week or month")
+    # type=int молча подставил бы окно по умолчанию вместо неверного значения
+    window = request.args.get("window", str(WINDOWS[resolution]))
+    if not window.isdigit() or int(window) < 1:
+        abort(400, message="window must be a positive integer")
+    window = int(window)
+
+    disease = request.args.get("disease")
+    region = request.args.get("region")
+    labels, cases = downsample(daily_counts(start, end, disease, region), start, end, resolution)
+    return {
+        "disease": disease,
+        "region": region,
+        "resolution": resolution,
+        "window": window,
+        "periods": [label.isoformat() for label in labels],
+        "cases": [int(value) for value in cases],
+        "moving_average": as_list(moving_average(cases, window)),
+        "growth": as_list(growth(cases)),
+    }
+
+
+def series_list():
+    """Имеющиеся ряды: болезнь, регион, первый и последний год"""
+    rows = db.session.query(CaseSeries.disease, CaseSeries.region,
+                            db.func.min(CaseSeries.year), db.func.max(CaseSeries.year)) \
+        .group_by(CaseSeries.disease, CaseSeries.region) \
+        .order_by(CaseSeries.disease, CaseSeries.region)
+    return [{"disease": disease, "region": region, "first_year": first, "last_year": last}
+            for disease, region, first, last in rows]
@@ -1,4 +1,14 @@
-from flask import jsonify, make_response as flask_make_response
+import importlib
+import os
+import shutil
+from datetime import datetime
+from uuid import uuid4
+
+from flask import jsonify, request, current_app, make_response as flask_make_response
+from flask_restful import abort
+
+from api.instrumentation import serialization_timer
+from extensions import db
 
 
 # def make_response(status_code, **kwargs):
@@ -9,9 +19,10 @@ from flask import jsonify, make_response as flask_make_response
 #     return response
 
 def make_data_response(status_code, **kwargs):
-    response = jsonify({
-            **kwargs
-        })
+    with serialization_timer():
+        response = jsonify({
+                **kwargs
+            })
     response.status_code = status_code
     return response
 
@@ -21,3 +32,103 @@ def make_empty(status_code):
     del response.headers["Content-Type"]
     del response.headers["Content-Length"]
     return response
+
+
+def pid_alive(pid):
+    """Жив ли процесс pid на этом хосте"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def optional_module(name):
+    """Импортировать необязательную зависимость при первом обращении; None, если ее нет"""
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+def get_or_404(model, uuid):
+    # Поиск по первичному ключу: сначала identity map сессии, затем индекс
+    instance = db.session.get(model, str(uuid))
+    if instance is None:
+        abort(404, message="{} with uuid={} not found"
+              .format(model.__name__, uuid))
+    return instance
+
+
+def bool_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    if value.lower() in ("1", "true", "yes"):
+        return True
+    if value.lower() in ("0", "false", "no"):
+        return False
+    abort(400, message="{} must be true or false".format(name))
+
+
+def datetime_arg(name):
+    """Вернуть (дата-время, передана ли только дата) для параметра ISO 8601"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value), len(value) == 10
+    except ValueError:
+        abort(400, message="{} must be an ISO 8601 date".format(name))
+
+
+def save_upload(prefix, extension):
+    """Сохранить тело запроса потоком в IMPORT_DIR; вернуть путь к файлу"""
+    directory = current_app.config["IMPORT_DIR"]
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "{}-{}.{}".format(prefix, uuid4().hex, extension))
+    with open(path, "wb") as output:
+        shutil.copyfileobj(request.stream, output, 1024 * 1024)
+    return path
+
+
+def upload_path(path):
+    """Настоящий путь к файлу внутри IMPORT_DIR или None, если path ведет за его пределы
+
+    Симлинки и ".." раскрываются до проверки, поэтому принимаются только
+    файлы, которые действительно лежат в каталоге загрузок.
+    """
+    directory = os.path.realpath(current_app.config["IMPORT_DIR"])
+    real_path = os.path.realpath(path)
+    if os.path.commonpath([directory, real_path]) != directory or real_path == directory:
+        return None
+    if not os.path.isfile(real_path):
+        return None
+    return real_path
+
+
+def remove_upload(path):
+    """Удалить файл загрузки; пути вне IMPORT_DIR не трогаются"""
+    real_path = upload_path(path) if isinstance(path, str) else None
+    if real_path is not None:
+        try:
+            os.remove(real_path)
+        except FileNotFoundError:
+            pass
+
+
+def float_arg(name, low, high, default=None):
+    value = request.args.get(name)
+    if value is None:
+        if default is None:
+            abort(400, message="{} is required".format(name))
+        return default
+    try:
+        value = float(value)
+    except ValueError:
+        value = None
+    if value is None or not low <= value <= high:
+        abort(400, message="{} must be a number from {} to {}".format(name, low, high))
+    return value
@@ -0,0 +1,99 @@
+from flask import request
+from flask_restful import abort
+from marshmallow import ValidationError
+from sqlalchemy import exc
+
+from api.cache import with_etag
+from api.utils import make_data_response, make_empty
+from extensions import db
+
+
+def with_version(response, version):
+    """ETag ответа - версия строки; ее PATCH ожидает в If-Match
+
+    Такие ответы не кэшируются (@cached): версия из кэша другого воркера
+    могла бы отстать от базы, и PATCH с ней получил бы 412.
+    """
+    response.set_etag(str(version))
+    return with_etag(response)
+
+
+def load_patch(schema):
+    """Провалидировать тело PATCH; вернуть (поля, ожидаемые версии, статус несовпадения)
+
+    Версии берутся из If-Match (несовпадение - 412) или из поля version
+    тела (несовпадение - 409). Без них обновление безусловное (версии None).
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400, message="Bad JSON format")
+    data = dict(data)
+    body_version = data.pop("version", None)
+    try:
+        args = schema.load(data, partial=True)
+    except ValidationError:
+        abort(400, message="Bad JSON format")
+    values = {key: value for key, value in args.items() if value is not None}
+
+    if request.if_match:
+        if request.if_match.star_tag:
+            return values, None, 412
+        # Слабые теги тоже: сжатый ответ отдает версию как W/"n"
+        versions = [int(tag) for tag in request.if_match.as_set(include_weak=True)
+                    if tag.isdigit()]
+        return values, versions, 412
+    if body_version is not None:
+        if not isinstance(body_version, int) or isinstance(body_version, bool):
+            abort(400, message="version must be an integer")
+        return values, [body_version], 409
+    return values, None, 409
+
+
+def version_conflict(model, uuid, status):
+    """Ответ на несработавший условный UPDATE: 404 или status с текущей версией"""
+    current = db.session.query(model.version).filter(model.uuid == str(uuid)).scalar()
+    if current is None:
+        abort(404, message="{} with uuid={} not found".format(model.__name__, uuid))
+    return with_version(make_data_response(status, message="Version mismatch", version=current),
+                        current)
+
+
+def patch_columns(model, uuid, values, versions, status):
+    """Записать values одним UPDATE ... WHERE uuid=? [AND version IN (...)]
+
+    Строка не читается; версия увеличивается в том же UPDATE.
+    """
+    query = db.session.query(model).filter(model.uuid == str(uuid))
+    if versions is not None:
+        query = query.filter(model.version.in_(versions))
+    try:
+        updated = query.update(dict(values, version=model.version + 1),
+                               synchronize_session=False)
+        db.session.commit()
+    except exc.SQLAlchemyError:
+        db.session.rollback()
+        return make_data_response(500, message="Database commit error")
+    if not updated:
+        return version_conflict(model, uuid, status)
+    response = make_empty(200)
+    if versions is not None and len(versions) == 1:
+        with_version(response, versions[0] + 1)
+    return response
+
+
+def claim_version(instance, versions, status):
+    """Для изменения через ORM: проверить версию загруженной строки и занять следующую
+
+    Условный UPDATE выполняется первым в транзакции, поэтому параллельный
+    PATCH той же строки не пройдет. Возвращает ответ об ошибке или None.
+    """
+    model = type(instance)
+    if versions is not None and instance.version not in versions:
+        return version_conflict(model, instance.uuid, status)
+    claimed = db.session.query(model) \
+        .filter(model.uuid == instance.uuid, model.version == instance.version) \
+        .update({"version": model.version + 1}, synchronize_session=False)
+    if not claimed:
+        db.session.rollback()
+        return version_conflict(model, instance.uuid, status)
+    return None
@@ -0,0 +1,228 @@
+import atexit
+import glob
+import json
+import os
+import threading
+from datetime import datetime
+from uuid import uuid4
+
+from sqlalchemy import exc
+
+from api.batch import chunked
+from api.cache import response_cache
+from api.models import HealthReport
+from api.stats import Deltas
+from api.utils import pid_alive
+from extensions import db
+
+
+class HealthBuffer(object):
+    """Отложенная запись отметок о здоровье (HEALTH_WRITE_BEHIND)
+
+    Принятая отметка дописывается строкой JSON в журнал процесса
+    в HEALTH_LOG_DIR и в буфер в памяти. Фоновый поток пишет буфер в базу
+    одной транзакцией вместе с агрегатами, когда в нем HEALTH_BUFFER_SIZE
+    отметок или прошло HEALTH_FLUSH_INTERVAL секунд. Журнал разбит на
+    сегменты {pid}-{token}-{номер}.log, где token новый при каждом запуске:
+    процесс с тем же pid, что у упавшего (обычно в контейнерах), не допишет
+    в чужой сегмент. Сегмент удаляется, когда его отметки зафиксированы.
+    Сегменты процессов, которые завершились не сбросив буфер, дописываются
+    в базу до открытия первого своего сегмента (recover_log); отметки, уже
+    попавшие в базу, при этом пропускаются по uuid. При выходе процесса
+    буфер сбрасывается (atexit).
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get("HEALTH_WRITE_BEHIND", False)
+        if not self.enabled:
+            return
+        self.app = app
+        self.size = config.get("HEALTH_BUFFER_SIZE", 500)
+        self.interval = config.get("HEALTH_FLUSH_INTERVAL", 0.5)
+        self.directory = config.get("HEALTH_LOG_DIR", "health-log")
+        self.fsync = config.get("HEALTH_LOG_FSYNC", False)
+        self.lock = threading.Lock()
+        # Процесс, которому принадлежат буфер и поток: после fork начинаем заново
+        self.pid = None
+        atexit.register(self.close)
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.pid = os.getpid()
+        self.token = uuid4().hex[:12]
+        # В отдельном потоке: у него своя сессия, и транзакция запроса не затрагивается
+        recovery = threading.Thread(target=self.recover, name="health-recover")
+        recovery.start()
+        recovery.join()
+        self.items = []
+        self.sequence = 0
+        # Сегменты, отметки которых еще не зафиксированы
+        self.pending = []
+        self.log = None
+        self.open_segment()
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.thread = threading.Thread(target=self.run, name="health-write-behind", daemon=True)
+        self.thread.start()
+
+    def recover(self):
+        with self.app.app_context():
+            recover_log(self.directory, self.token)
+            db.session.remove()
+
+    def open_segment(self):
+        self.sequence += 1
+        self.path = os.path.join(self.directory, "{}-{}-{}.log".format(
+            self.pid, self.token, self.sequence))
+        # "x": сегмент всегда новый, в существующий файл процесс не пишет
+        self.log = open(self.path, "xb")
+
+    def submit(self, values):
+        """Принять отметку; вернуть ее uuid (в базе она появится при сбросе)"""
+        item = {"uuid": str(uuid4()), "address": values["address"],
+                "health_status": bool(values["health_status"]),
+                "created": datetime.utcnow().isoformat()}
+        line = (json.dumps(item, separators=(",", ":")) + "\n").encode("utf-8")
+        with self.lock:
+            if self.pid != os.getpid():
+                self.start()
+            self.log.write(line)
+            self.log.flush()
+            if self.fsync:
+                os.fsync(self.log.fileno())
+            self.items.append(item)
+            full = len(self.items) >= self.size
+        if full:
+            self.wakeup.set()
+        return item["uuid"]
+
+    def run(self):
+        with self.app.app_context():
+            while not self.stopping:
+                self.wakeup.wait(self.interval)
+                self.wakeup.clear()
+                self.flush()
+                db.session.remove()
+
+    def flush(self):
+        """Записать буфер в базу; при ошибке отметки останутся до следующей попытки"""
+        with self.lock:
+            if not self.items:
+                return 0
+            items, self.items = self.items, []
+            self.log.close()
+            self.pending.append(self.path)
+            # Отметки буфера - ровно отметки этих сегментов (с возвращенными после ошибок)
+            segments = list(self.pending)
+            self.open_segment()
+        if not write_reports(items):
+            with self.lock:
+                self.items[:0] = items
+            return 0
+        with self.lock:
+            self.pending = [path for path in self.pending if path not in segments]
+        for path in segments:
+            os.remove(path)
+        return len(items)
+
+    def close(self):
+        if self.pid != os.getpid():
+            return
+        self.stopping = True
+        self.wakeup.set()
+        self.thread.join(timeout=self.interval + 5)
+        with self.app.app_context():
+            self.flush()
+            db.session.remove()
+        with self.lock:
+            self.log.close()
+            if not self.items and os.path.exists(self.path) and not os.path.getsize(self.path):
+                os.remove(self.path)
+
+
+def write_reports(items, skip_existing=False):
+    """Вставить отметки одним executemany и обновить агрегаты в той же транзакции"""
+    try:
+        if skip_existing:
+            existing = set()
+            for chunk in chunked([item["uuid"] for item in items], 500):
+                existing.update(uuid for uuid, in db.session.query(HealthReport.uuid)
+                                .filter(HealthReport.uuid.in_(chunk)))
+            items = [item for item in items if item["uuid"] not in existing]
+        if items:
+            db.session.execute(HealthReport.__table__.insert(), [
+                dict(item, created=datetime.fromisoformat(item["created"])) for item in items])
+            deltas = Deltas()
+            for item in items:
+                deltas.add_report(item["health_status"], 1)
+            deltas.apply(db.session)
+        db.session.commit()
+    except exc.SQLAlchemyError:
+        db.session.rollback()
+        return False
+    if items:
+        response_cache.invalidate("stats")
+    return True
+
+
+def segment_owner(path):
+    """(pid, token) процесса, который пишет или восстанавливает сегмент"""
+    name, _, recovering = path.partition(".recovering-")
+    if recovering:
+        pid, _, token = recovering.partition("-")
+        return int(pid), token or None
+    parts = os.path.basename(name)[:-len(".log")].split("-")
+    # Сегменты старого вида {pid}-{номер}.log - без token
+    return int(parts[0]), parts[1] if len(parts) > 2 else None
+
+
+def recover_log(directory, token=None):
+    """Дописать в базу сегменты завершившихся процессов; вернуть число отметок
+
+    token - метка текущего запуска: свои сегменты пропускаются, а сегмент
+    с тем же pid, но другой меткой остался от прежнего процесса с этим pid.
+    Без token пропускаются все сегменты текущего pid.
+    """
+    recovered = 0
+    for path in sorted(glob.glob(os.path.join(directory, "*.log*"))):
+        name = path.partition(".recovering-")[0]
+        pid, owner = segment_owner(path)
+        if pid == os.getpid():
+            # Без token свои сегменты не отличить от оставшихся с прошлого запуска
+            if token is None or owner == token:
+                continue
+        elif pid_alive(pid):
+            continue
+        # Переименование забирает сегмент только одному процессу
+        claimed = "{}.recovering-{}-{}".format(name, os.getpid(), token or "")
+        try:
+            os.rename(path, claimed)
+        except OSError:
+            continue
+        recovered += recover_segment(claimed)
+    return recovered
+
+
+def recover_segment(path):
+    items = []
+    with open(path, "rb") as segment:
+        for line in segment:
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                # Последняя строка могла оборваться при падении процесса
+                continue
+    if not write_reports(items, skip_existing=True):
+        os.rename(path, path.split(".recovering-")[0])
+        return 0
+    os.remove(path)
+    return len(items)
+
+
+health_buffer = HealthBuffer()
@@ -1,12 +1,13 @@
 from flask import Flask, send_from_directory
 import os
 # from flask_swagger_ui import get_swaggerui_blueprint
-from api import UserLogIn
 
 SECRET_KEY = os.urandom(32)
 CONFIG_NAME_MAPPER = {
     "testing": "config.TestingConfig",
     "production": "config.ProductionConfig",
+    "benchmark": "config.BenchmarkConfig",
+    "replicated": "config.ReplicatedConfig",
 }
 
 
@@ -34,14 +35,37 @@ def create_app(config_name=None):
 
     app.config.from_object(CONFIG_NAME_MAPPER[config_name])
     app.config['SECRET_KEY'] = SECRET_KEY
+    # Нужно процессам-воркерам фоновых задач, чтобы создать такое же приложение
+    app.config['CONFIG_NAME'] = config_name
 
     # Register extensions
-    from extensions import db, cors, ma, login_manager
+    from extensions import db, cors, ma, login_manager, init_sqlite_pragmas, init_replicas
     db.init_app(app)
+    init_replicas(app)
+    init_sqlite_pragmas(app)
     cors.init_app(app)
     ma.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'api.userlogin'
+    from api.cache import response_cache
+    response_cache.init_app(app)
+    from api.instrumentation import instrumentation
+    instrumentation.init_app(app)
+    from api.compression import compression
+    compression.init_app(app)
+    # После compression: after_request выполняются в обратном порядке, и
+    # для повтора по Idempotency-Key сохраняется еще не сжатое тело
+    from api.admission import write_admission
+    write_admission.init_app(app)
+    from api.writebehind import health_buffer
+    health_buffer.init_app(app)
+    from api.geo import location_index
+    location_index.init_app(app)
+
+    @app.cli.command("init-db")
+    def init_db():
+        """Создать таблицы базы данных (один раз перед запуском воркеров)"""
+        db.create_all()
 
     # Register Blueprints
     from api import api_bp
@@ -0,0 +1,139 @@
+"""Нагрузочный прогон REST API
+
+    python -m bench run --records 100000 --output before.json
+    python -m bench run --url http://localhost:8889 --output after.json
+    python -m bench compare before.json after.json
+    python -m bench serialization --rows 1000
+    python -m bench neighbours --points 1000000 --radius 1000
+    python -m bench startup --runs 5 --budget 1000
+"""
+import argparse
+import json
+import sys
+
+from bench import runner
+
+
+def run(args):
+    from api.cache import response_cache
+    from app import create_app
+    from bench.seed import seed
+
+    app = create_app("benchmark")
+    response_cache.enabled = args.cache
+    with app.app_context():
+        ids = seed(patients=args.patients, doctors=args.doctors, services=args.services,
+                   records=args.records, reports=args.reports, spare=args.requests * 11)
+        results = runner.run(app, ids, requests=args.requests, concurrency=args.concurrency,
+                             url=args.url, include=args.include)
+    settings = {key: value for key, value in vars(args).items() if key != "func"}
+    report = {"settings": settings, "results": results}
+    dump(report, args.output)
+
+
+def serialization(args):
+    from app import create_app
+    from bench import serialization as serialization_bench
+    from bench.seed import seed
+
+    app = create_app("benchmark")
+    with app.app_context():
+        seed(records=args.rows, patients=args.rows, doctors=args.rows, services=args.rows,
+             reports=0, spare=0)
+        results = serialization_bench.run(app, rows=args.rows, repeat=args.repeat)
+    dump(results, args.output)
+
+
+def neighbours(args):
+    from bench import geo
+
+    dump(geo.run(points=args.points, queries=args.queries, radius=args.radius,
+                 cell_degrees=args.cell_degrees, check=args.check), args.output)
+
+
+def startup(args):
+    from bench import startup as startup_bench
+
+    report = startup_bench.run(config=args.config, path=args.path, runs=args.runs,
+                               top=args.top, budget=args.budget)
+    dump(report, args.output)
+    return 0 if report.get("within_budget", True) else 1
+
+
+def compare(args):
+    with open(args.old) as old, open(args.new) as new:
+        rows = runner.compare(json.load(old)["results"], json.load(new)["results"])
+    dump(rows, args.output)
+
+
+def dump(data, path):
+    text = json.dumps(data, indent=2, sort_keys=True)
+    if path:
+        with open(path, "w") as output:
+            output.write(text + "\n")
+    else:
+        print(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    run_parser = commands.add_parser("run", help="засеять базу и прогнать все маршруты /api/v1")
+    run_parser.add_argument("--patients", type=int, default=1000)
+    run_parser.add_argument("--doctors", type=int, default=50)
+    run_parser.add_argument("--services", type=int, default=30)
+    run_parser.add_argument("--records", type=int, default=10000)
+    run_parser.add_argument("--reports", type=int, default=1000)
+    run_parser.add_argument("--requests", type=int, default=200, help="запросов на маршрут")
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--url", help="адрес запущенного сервера вместо test client")
+    run_parser.add_argument("--include", action="append",
+                            help='подстрока "METHOD /path" для выбора маршрутов')
+    run_parser.add_argument("--cache", action="store_true", help="включить кэш ответов")
+    run_parser.add_argument("--output")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="сравнить два отчета")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--output")
+    compare_parser.set_defaults(func=compare)
+
+    serialization_parser = commands.add_parser(
+        "serialization", help="сравнить marshmallow и компилированную сериализацию списков")
+    serialization_parser.add_argument("--rows", type=int, default=1000)
+    serialization_parser.add_argument("--repeat", type=int, default=5)
+    serialization_parser.add_argument("--output")
+    serialization_parser.set_defaults(func=serialization)
+
+    neighbours_parser = commands.add_parser(
+        "neighbours", help="скорость поиска больных соседей по сетке в памяти")
+    neighbours_parser.add_argument("--points", type=int, default=1000000)
+    neighbours_parser.add_argument("--queries", type=int, default=1000)
+    neighbours_parser.add_argument("--radius", type=float, default=1000, help="метры")
+    neighbours_parser.add_argument("--cell-degrees", type=float, default=0.001)
+    neighbours_parser.add_argument("--check", type=int, default=5,
+                                   help="сколько запросов сверить с перебором")
+    neighbours_parser.add_argument("--output")
+    neighbours_parser.set_defaults(func=neighbours)
+
+    startup_parser = commands.add_parser(
+        "startup", help="время холодного старта и самые долгие импорты")
+    startup_parser.add_argument("--config", default="testing")
+    startup_parser.add_argument("--path", default="/api/v1/stats/health",
+                                help="первый запрос после старта")
+    startup_parser.add_argument("--runs", type=int, default=5)
+    startup_parser.add_argument("--top", type=int, default=15, help="сколько импортов показать")
+    startup_parser.add_argument("--budget", type=float,
+                                help="предел import + create_app в мс; сверх - код выхода 1")
+    startup_parser.add_argument("--output")
+    startup_parser.set_defaults(func=startup)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import math
+import random
+import time
+
+from api.geo import GridIndex, METERS_PER_DEGREE, longitude_delta
+
+# Прямоугольник, в котором разбрасываются точки (примерно Москва)
+AREA = (55.55, 55.95, 37.35, 37.85)
+
+
+def scan(points, latitude, longitude, radius):
+    """Перебор всех точек - эталон и базовая скорость"""
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+    reach2 = (radius / METERS_PER_DEGREE) ** 2
+    total = infected = 0
+    for point_latitude, point_longitude, point_infected in points:
+        dy = point_latitude - latitude
+        dx = longitude_delta(point_longitude, longitude) * cos_lat
+        if dx * dx + dy * dy <= reach2:
+            total += 1
+            infected += point_infected
+    return total, infected
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def run(points=1000000, queries=1000, radius=1000, cell_degrees=0.001, infected=0.05,
+        check=5, seed=1):
+    """Построить GridIndex на points случайных точках и измерить запросы по кругу
+
+    Половина точек равномерна по AREA, половина - в 50 плотных районах.
+    Первые check запросов сверяются с перебором всех точек.
+    """
+    rng = random.Random(seed)
+    south, north, west, east = AREA
+    centers = [(rng.uniform(south, north), rng.uniform(west, east)) for _ in range(50)]
+    data = []
+    for number in range(points):
+        if number % 2:
+            latitude, longitude = rng.uniform(south, north), rng.uniform(west, east)
+        else:
+            center = rng.choice(centers)
+            latitude, longitude = rng.gauss(center[0], 0.01), rng.gauss(center[1], 0.015)
+        data.append((latitude, longitude, rng.random() < infected))
+
+    index = GridIndex(cell_degrees)
+    started = time.perf_counter()
+    index.load((number, latitude, longitude, sick)
+               for number, (latitude, longitude, sick) in enumerate(data))
+    build = time.perf_counter() - started
+
+    targets = [(rng.uniform(south, north), rng.uniform(west, east)) for _ in range(queries)]
+    timings = []
+    matched = found = 0
+    for latitude, longitude in targets:
+        started = time.perf_counter()
+        total, _ = index.count(latitude, longitude, radius)
+        timings.append(time.perf_counter() - started)
+        found += total
+
+    scan_ms = None
+    for latitude, longitude in targets[:check]:
+        started = time.perf_counter()
+        expected = scan(data, latitude, longitude, radius)
+        scan_ms = (time.perf_counter() - started) * 1000
+        matched += index.count(latitude, longitude, radius) == expected
+
+    started = time.perf_counter()
+    for number in range(min(points, 100000)):
+        latitude, longitude, sick = data[number]
+        index.upsert(number, latitude + 0.001, longitude, not sick)
+    update = (time.perf_counter() - started) / min(points, 100000)
+
+    timings.sort()
+    return {
+        "points": points,
+        "cells": index.cell_count(),
+        "radius_m": radius,
+        "build_s": round(build, 2),
+        "update_us": round(update * 1e6, 2),
+        "query_mean_us": round(sum(timings) / len(timings) * 1e6, 1),
+        "query_p50_us": round(percentile(timings, 0.5) * 1e6, 1),
+        "query_p99_us": round(percentile(timings, 0.99) * 1e6, 1),
+        "mean_neighbours": round(found / len(timings), 1),
+        "scan_ms": scan_ms and round(scan_ms, 1),
+        "checked": check,
+        "matched": matched,
+    }
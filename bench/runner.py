@@ -0,0 +1,242 @@
+import http.client
+import json
+import math
+import random
+import re
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+from bench.seed import DISEASES, CITIES
+
+ARGUMENT = re.compile(r"<(?:\w+:)?(\w+)>")
+SKIPPED_METHODS = {"HEAD", "OPTIONS"}
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100.0 * len(ordered)) - 1)]
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Payloads(object):
+    """Тела и параметры запросов для сценариев по засеянным uuid"""
+
+    def __init__(self, ids, rng):
+        self.ids = ids
+        self.rng = rng
+        self.lock = threading.Lock()
+
+    def pick(self, name):
+        if name.startswith("spare_"):
+            with self.lock:
+                return self.ids[name].pop() if self.ids.get(name) else None
+        return self.rng.choice(self.ids[name]) if self.ids.get(name) else None
+
+    def patient(self):
+        return {"name": "Bench", "phone": "900000000", "birthday": "1990-01-01"}
+
+    def doctor(self):
+        return {"name": "Bench", "phone": "800000000", "speciality": "therapist",
+                "qualification": "MD"}
+
+    def service(self):
+        return {"name": "Bench service", "price": self.rng.randrange(100, 5000)}
+
+    def record(self, patient=False):
+        payload = {"doctor_uuid": self.pick("doctor"),
+                   "date": (datetime(2020, 3, 1) + timedelta(days=self.rng.randrange(700)))
+                   .isoformat(),
+                   "used_services": ",".join(self.rng.sample(self.ids["service"], 2)),
+                   "disease": self.rng.choice(DISEASES), "discharge": "Bench discharge",
+                   "payment_status": False}
+        if patient:
+            payload["patient_uuid"] = self.pick("patient")
+        return payload
+
+    def health(self):
+        return {"address": self.rng.choice(CITIES), "health_status": self.rng.random() < 0.1}
+
+
+RESOURCES = ("patient", "doctor", "service", "record")
+
+
+def resource_name(rule):
+    """patients, doctors, services, records по правилу маршрута"""
+    for name in RESOURCES:
+        if "/{}s".format(name) in rule:
+            return name
+    return None
+
+
+def request_factory(rule, method, payloads):
+    """Функция, возвращающая (путь, json) для очередного запроса, или None"""
+    name = resource_name(rule)
+    arguments = ARGUMENT.findall(rule)
+    is_batch = rule.endswith(":batch")
+
+    def path(values):
+        return ARGUMENT.sub(lambda match: str(values[match.group(1)]), rule)
+
+    def build():
+        values = {}
+        for argument in arguments:
+            kind = argument.split("_")[0]
+            if method == "DELETE":
+                kind = "spare_" + kind
+            values[argument] = payloads.pick(kind)
+            if values[argument] is None:
+                return None
+        body = None
+        if method == "POST" and is_batch:
+            body = [payloads.record(patient=True) if name == "record"
+                    else getattr(payloads, name)() for _ in range(10)]
+        elif method == "POST" and rule.endswith("/health"):
+            body = payloads.health()
+        elif method == "POST" and rule.endswith("/signup"):
+            body = {"username": "bench{}".format(payloads.rng.random()), "password": "bench"}
+        elif method == "POST" and arguments:
+            body = payloads.record()
+        elif method == "POST" and name:
+            body = getattr(payloads, name)()
+        elif method == "PATCH":
+            change = {"payment_status": True} if name == "record" else {"name": "Bench patched"}
+            body = change
+            if is_batch:
+                body = [dict(change, uuid=payloads.pick(name)) for _ in range(10)]
+        elif method == "DELETE" and is_batch:
+            body = [payloads.pick("spare_" + name) for _ in range(10)]
+            if None in body:
+                return None
+        return path(values), body
+
+    return build
+
+
+def scenarios(app, ids, rng, prefix="/api/v1", include=None):
+    payloads = Payloads(ids, rng)
+    found = []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+        if not rule.rule.startswith(prefix) or rule.endpoint.endswith("static"):
+            continue
+        for method in sorted(rule.methods - SKIPPED_METHODS):
+            name = "{} {}".format(method, rule.rule)
+            if include and not any(pattern in name for pattern in include):
+                continue
+            found.append((name, method, request_factory(rule.rule, method, payloads)))
+    return found
+
+
+class TestClientTransport(object):
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def __call__(self, method, path, body):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body)
+        response.get_data()
+        return response.status_code
+
+
+class HTTPTransport(object):
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.local = threading.local()
+
+    def __call__(self, method, path, body):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection(self.host, self.port)
+        data = None if body is None else json.dumps(body)
+        headers = {} if body is None else {"Content-Type": "application/json"}
+        try:
+            connection.request(method, path, body=data, headers=headers)
+            response = connection.getresponse()
+            response.read()
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            self.local.connection = None
+            raise
+        return response.status
+
+
+def run_scenario(transport, method, build, requests, concurrency):
+    latencies, statuses, errors = [], {}, 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal errors
+        prepared = build()
+        if prepared is None:
+            return
+        path, body = prepared
+        started = time.perf_counter()
+        try:
+            status = transport(method, path, body)
+        except Exception:
+            with lock:
+                errors += 1
+            return
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    rss_before = peak_rss_kb()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(requests)))
+    wall = time.perf_counter() - started
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 3)
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": statuses,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "throughput_rps": round(len(latencies) / wall, 1) if wall else None,
+        "peak_rss_kb": peak_rss_kb(),
+        "rss_growth_kb": peak_rss_kb() - rss_before,
+    }
+
+
+def run(app, ids, requests=200, concurrency=8, url=None, include=None, random_seed=0):
+    rng = random.Random(random_seed)
+    transport = HTTPTransport(url) if url else TestClientTransport(app)
+    results = {}
+    for name, method, build in scenarios(app, ids, rng, include=include):
+        results[name] = run_scenario(transport, method, build, requests, concurrency)
+        if url:
+            # Память сервера из клиента не видна
+            results[name]["peak_rss_kb"] = results[name]["rss_growth_kb"] = None
+    return results
+
+
+def compare(old, new):
+    """Изменение p50/p95/p99 и пропускной способности между двумя прогонами"""
+    rows = []
+    for name in sorted(set(old) & set(new)):
+        row = {"endpoint": name}
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            before, after = old[name].get(metric), new[name].get(metric)
+            row[metric] = [before, after,
+                           round(100.0 * (after - before) / before, 1) if before and after is not None
+                           else None]
+        rows.append(row)
+    return rows
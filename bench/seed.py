@@ -0,0 +1,74 @@
+import random
+from datetime import date, datetime, timedelta
+from uuid import uuid4
+
+from sqlalchemy import Table
+
+from api.batch import chunked
+from api.models import Patient, Doctor, Service, Record, HealthReport, record_services
+from api.stats import rebuild_stats
+from extensions import db
+
+DISEASES = ["covid-19", "influenza", "pneumonia", "bronchitis", "cold"]
+SPECIALITIES = ["therapist", "pulmonologist", "infectionist", "cardiologist"]
+CITIES = ["Moscow", "Kazan", "Tashkent", "Istanbul", "Saint Petersburg"]
+
+
+def insert(model_or_table, rows, chunk_size):
+    for chunk in chunked(rows, chunk_size):
+        if isinstance(model_or_table, Table):
+            db.session.execute(model_or_table.insert(), chunk)
+        else:
+            db.session.bulk_insert_mappings(model_or_table, chunk)
+
+
+def seed(patients=1000, doctors=50, services=30, records=10000, reports=1000,
+         spare=200, chunk_size=5000, random_seed=0):
+    """Пересоздать схему и заполнить ее случайными данными
+
+    Возвращает словарь списков uuid по ресурсам; строки spare_* предназначены
+    для сценариев удаления.
+    """
+    rng = random.Random(random_seed)
+    db.drop_all()
+    db.create_all()
+
+    def uuids(count):
+        return [str(uuid4()) for _ in range(count)]
+
+    ids = {
+        "patient": uuids(patients), "doctor": uuids(doctors), "service": uuids(services),
+        "record": uuids(records), "spare_patient": uuids(spare), "spare_doctor": uuids(spare),
+        "spare_service": uuids(spare), "spare_record": uuids(spare),
+    }
+    insert(Patient, [{"uuid": uuid, "name": "Patient {}".format(i), "phone": "9{:08d}".format(i),
+                      "birthday": date(1940, 1, 1) + timedelta(days=rng.randrange(25000))}
+                     for i, uuid in enumerate(ids["patient"] + ids["spare_patient"])], chunk_size)
+    insert(Doctor, [{"uuid": uuid, "name": "Doctor {}".format(i), "phone": "8{:08d}".format(i),
+                     "speciality": rng.choice(SPECIALITIES), "qualification": "MD"}
+                    for i, uuid in enumerate(ids["doctor"] + ids["spare_doctor"])], chunk_size)
+    prices = {uuid: rng.randrange(100, 5000) for uuid in ids["service"] + ids["spare_service"]}
+    insert(Service, [{"uuid": uuid, "name": "Service {}".format(i), "price": prices[uuid]}
+                     for i, uuid in enumerate(prices)], chunk_size)
+
+    start = datetime(2020, 3, 1)
+    rows, links = [], []
+    for uuid in ids["record"] + ids["spare_record"]:
+        used = rng.sample(ids["service"], min(len(ids["service"]), rng.randint(1, 3)))
+        rows.append({"uuid": uuid, "patient_uuid": rng.choice(ids["patient"]),
+                     "doctor_uuid": rng.choice(ids["doctor"]),
+                     "date": start + timedelta(minutes=rng.randrange(2 * 365 * 24 * 60)),
+                     "used_services": ",".join(used), "disease": rng.choice(DISEASES),
+                     "discharge": "Discharge note " * rng.randint(1, 20),
+                     "payment_status": rng.random() < 0.7,
+                     "sum": sum(prices[service] for service in used)})
+        links.extend({"record_uuid": uuid, "service_uuid": service} for service in used)
+    insert(Record, rows, chunk_size)
+    insert(record_services, links, chunk_size)
+    insert(HealthReport, [{"uuid": str(uuid4()), "address": rng.choice(CITIES),
+                           "health_status": rng.random() < 0.1,
+                           "created": start + timedelta(minutes=rng.randrange(365 * 24 * 60))}
+                          for _ in range(reports)], chunk_size)
+    db.session.commit()
+    rebuild_stats()
+    return ids
@@ -0,0 +1,54 @@
+import time
+
+from flask import jsonify
+
+from api.fields import PatientInfoSchema, DoctorInfoSchema, ServiceInfoSchema, RecordInfoSchema
+from api.models import Patient, Doctor, Service, Record
+from api.serializers import compile_schema, encode_json
+from extensions import db
+
+CASES = (("patients", Patient, PatientInfoSchema), ("doctors", Doctor, DoctorInfoSchema),
+         ("services", Service, ServiceInfoSchema), ("records", Record, RecordInfoSchema))
+
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return body, best
+
+
+def run(app, rows=1000, repeat=5):
+    """Сравнить ORM + marshmallow + jsonify с кортежами колонок + encode_json
+
+    Для каждого ресурса берется страница из rows строк; тела ответов обоих
+    путей должны совпадать побайтно.
+    """
+    results = {}
+    with app.test_request_context():
+        for name, model, schema_class in CASES:
+            schema = schema_class(many=True)
+            compiled = compile_schema(schema, model)
+
+            def marshmallow_path():
+                db.session.expunge_all()
+                items = db.session.query(model).order_by(model.uuid).limit(rows).all()
+                return jsonify(**{name: schema.dump(items)}).get_data()
+
+            def compiled_path():
+                items = db.session.query(*compiled.columns).order_by(model.uuid).limit(rows).all()
+                return encode_json({name: compiled.dump_rows(items)}) + b"\n"
+
+            before, before_time = timed(marshmallow_path, repeat)
+            after, after_time = timed(compiled_path, repeat)
+            results[name] = {
+                "rows": rows,
+                "marshmallow_ms": round(before_time * 1000, 3),
+                "compiled_ms": round(after_time * 1000, 3),
+                "speedup": round(before_time / after_time, 2) if after_time else None,
+                "identical": before == after,
+            }
+    return results
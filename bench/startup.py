@@ -0,0 +1,73 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+# Выполняется в новом интерпретаторе: импорт, create_app и первый запрос
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app(sys.argv[1])
+created = time.perf_counter()
+from extensions import db
+with app.app_context():
+    db.create_all()
+ready = time.perf_counter()
+response = app.test_client().get(sys.argv[2])
+done = time.perf_counter()
+print(json.dumps({"import": imported - start, "create_app": created - imported,
+                  "first_request": done - ready, "status": response.status_code}))
+"""
+
+# "import time:  self [us] | cumulative | imported package" из python -X importtime
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+\d+ \| *(\S+)$")
+
+
+def median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2]
+
+
+def probe(config, path):
+    """Время старта в новом процессе и собственное время импорта по пакетам верхнего уровня"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE, config, path],
+                            cwd=root, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    imports = defaultdict(float)
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            # Собственное время без вложенных импортов: sqlalchemy.orm идет в sqlalchemy
+            imports[match.group(2).split(".")[0]] += int(match.group(1)) / 1000.0
+    return json.loads(result.stdout.strip().splitlines()[-1]), imports
+
+
+def run(config="testing", path="/api/v1/stats/health", runs=5, top=15, budget=None):
+    """Медианы по runs холодным запускам; budget - предел import + create_app, мс"""
+    timings = defaultdict(list)
+    imports = defaultdict(list)
+    status = None
+    for _ in range(runs):
+        timing, modules = probe(config, path)
+        status = timing.pop("status")
+        for key, seconds in timing.items():
+            timings[key].append(seconds * 1000)
+        for name, ms in modules.items():
+            imports[name].append(ms)
+
+    report = {key: round(median(values), 1) for key, values in timings.items()}
+    report["startup"] = round(median([load + create for load, create in
+                                      zip(timings["import"], timings["create_app"])]), 1)
+    report["first_request_status"] = status
+    slowest = sorted(((median(values), name) for name, values in imports.items()), reverse=True)
+    report["slowest_imports"] = [{"module": name, "ms": round(ms, 1)} for ms, name in slowest[:top]]
+    if budget is not None:
+        report["budget"] = budget
+        report["within_budget"] = report["startup"] <= budget
+    return report
@@ -1,14 +1,139 @@
+import os
+
+from sqlalchemy.pool import QueuePool
+
+
 class BaseConfig(object):
     DEBUG = False
     TESTING = False
     SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # PRAGMA, выполняемые на каждом новом соединении с SQLite
+    SQLITE_PRAGMAS = {}
+    # Реплики только для чтения: GET-запросы читают с них (см. extensions.init_replicas)
+    SQLALCHEMY_REPLICA_URIS = []
+    REPLICA_STICKY_SECONDS = 5
+    REPLICA_STICKY_COOKIE = "db_primary_until"
+    # Дополнительные PRAGMA для реплик на SQLite
+    REPLICA_SQLITE_PRAGMAS = {"query_only": 1}
     ERROR_404_HELP = True
+    # Компактный JSON: без отступов и пробелов после разделителей
+    JSONIFY_PRETTYPRINT_REGULAR = False
+    COMPRESSION_ENABLED = True
+    COMPRESSION_MIN_SIZE = 1024
+    COMPRESSION_LEVEL = 6
+    PAGE_SIZE = 100
+    # Метод и соль werkzeug.security.generate_password_hash
+    PASSWORD_HASH_METHOD = "pbkdf2:sha256:260000"
+    PASSWORD_SALT_LENGTH = 16
+    # Время жизни пользователя в кэше user_loader, 0 - без кэша
+    USER_CACHE_TTL = 30
+    MAX_PAGE_SIZE = 1000
+    STREAM_CHUNK_SIZE = 1000
+    BATCH_CHUNK_SIZE = 500
+    BATCH_MAX_ITEMS = 10000
+    RESPONSE_CACHE_ENABLED = False
+    RESPONSE_CACHE_TTL = 60
+    RESPONSE_CACHE_MAX_ENTRIES = 1024
+    RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    # Фабрика общего кэша: "module.factory", вызывается с приложением
+    RESPONSE_CACHE_BACKEND = None
+    INSTRUMENTATION_ENABLED = False
+    METRICS_URL = "/metrics"
+    SLOW_QUERY_COUNT = 10
+    PROFILE_SAMPLE_RATE = 0.0
+    PROFILE_ON_DEMAND = False
+    PROFILE_DIR = "profiles"
+    # Защита записи (api/admission.py): лимит запросов на клиента,
+    # Idempotency-Key и число одновременных записей в процессе (0 - без предела)
+    RATE_LIMIT_ENABLED = False
+    RATE_LIMIT_RATE = 5.0
+    RATE_LIMIT_BURST = 20
+    IDEMPOTENCY_TTL = 24 * 3600
+    IDEMPOTENCY_MAX_ENTRIES = 100000
+    WRITE_CONCURRENCY = 0
+    WRITE_QUEUE_TIMEOUT = 2.0
+    # Отложенная запись POST /health (api/writebehind.py): буфер сбрасывается
+    # в базу при HEALTH_BUFFER_SIZE отметках или раз в HEALTH_FLUSH_INTERVAL секунд
+    HEALTH_WRITE_BEHIND = False
+    HEALTH_BUFFER_SIZE = 500
+    HEALTH_FLUSH_INTERVAL = 0.5
+    HEALTH_LOG_DIR = "health-log"
+    # fsync журнала на каждую отметку: переживает и отключение питания, но медленнее
+    HEALTH_LOG_FSYNC = False
+    # Наибольший диапазон /trends в днях
+    TRENDS_MAX_DAYS = 366 * 30
+    # Фоновые задачи (flask api jobs-worker)
+    JOBS_WORKERS = 2
+    JOBS_POLL_INTERVAL = 1.0
+    # Каталог файлов, которые пишет задача export
+    EXPORT_DIR = "exports"
+    # Загрузка CSV/NDJSON (flask api import, POST /import/<resource>)
+    IMPORT_CHUNK_SIZE = 5000
+    IMPORT_MAX_REJECTED = 1000
+    IMPORT_DIR = "imports"
+    # Поиск соседей (api/geo.py): размер ячейки сетки в градусах, как часто
+    # догонять изменения из базы, радиус по умолчанию и наибольший, в метрах
+    GEO_CELL_DEGREES = 0.001
+    GEO_REFRESH_SECONDS = 1.0
+    GEO_REFRESH_MARGIN = 5
+    GEO_DEFAULT_RADIUS = 1000
+    GEO_MAX_RADIUS = 50000
+    # Фабрика геокодера: "module.factory", вызывается с приложением и
+    # возвращает функцию адрес -> (широта, долгота) или None
+    GEOCODER = None
+    # Загружать numpy и pyarrow в мастере gunicorn до fork (api/startup.py);
+    # иначе - при первом запросе /trends или выгрузке parquet в каждом воркере
+    PRELOAD_OPTIONAL_MODULES = True
 
 
 class TestingConfig(BaseConfig):
     TESTING = True
+    PASSWORD_HASH_METHOD = "pbkdf2:sha256:1000"
 
 
 class ProductionConfig(BaseConfig):
-    SQLALCHEMY_DATABASE_URI = "sqlite:///production_database.sqlite"
\ No newline at end of file
+    SQLALCHEMY_DATABASE_URI = "sqlite:///production_database.sqlite"
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "poolclass": QueuePool,
+        "pool_size": 10,
+        "max_overflow": 10,
+        "pool_timeout": 30,
+        "connect_args": {"timeout": 30, "check_same_thread": False},
+    }
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,
+        "busy_timeout": 30000,
+        "temp_store": "MEMORY",
+    }
+    # Кэш в памяти процесса у каждого воркера gunicorn свой, и после записи
+    # другие воркеры отдавали бы старое тело и ETag; без общего кэша он выключен
+    RESPONSE_CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND")
+    RESPONSE_CACHE_ENABLED = bool(RESPONSE_CACHE_BACKEND)
+    RATE_LIMIT_ENABLED = True
+    WRITE_CONCURRENCY = 4
+
+
+class BenchmarkConfig(ProductionConfig):
+    SQLALCHEMY_DATABASE_URI = "sqlite:///bench_database.sqlite"
+    # Нагрузка идет от одного клиента
+    RATE_LIMIT_ENABLED = False
+
+
+class ReplicatedConfig(ProductionConfig):
+    """Основная база и реплики из DATABASE_URL и DATABASE_REPLICA_URLS (через запятую)
+
+    Без DATABASE_REPLICA_URLS реплика - второе подключение к основной базе;
+    для SQLite - тот же файл с PRAGMA query_only, так что запись через нее - ошибка.
+    """
+    SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL",
+                                             ProductionConfig.SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_REPLICA_URIS = [
+        uri for uri in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if uri
+    ] or [SQLALCHEMY_DATABASE_URI]
+    if not SQLALCHEMY_DATABASE_URI.startswith("sqlite"):
+        SQLALCHEMY_ENGINE_OPTIONS = {"pool_size": 10, "max_overflow": 10, "pool_timeout": 30,
+                                     "pool_pre_ping": True}
@@ -1,10 +1,100 @@
+import random
+import time
+
+from flask import g, request, has_request_context
 from flask_login import LoginManager
-from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 from flask_cors import CORS
 from flask_marshmallow import Marshmallow
+from sqlalchemy import event, orm
+
+
+class RoutingSession(SignallingSession):
+    """Сессия, которая читает с реплики, выбранной для запроса (g.db_replica)
+
+    flush и DML-выражения (query.update/delete) всегда идут в основную базу.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        if not self._flushing and not getattr(clause, "is_dml", False) \
+                and has_request_context():
+            replica = g.get("db_replica")
+            if replica is not None:
+                return db.get_engine(self.app, bind=replica)
+        return SignallingSession.get_bind(self, mapper, clause)
 
 
-db = SQLAlchemy()
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy()
 cors = CORS(resource={r"/api/v1/*": {"origins": "*"}})
 ma = Marshmallow()
-login_manager = LoginManager()
\ No newline at end of file
+login_manager = LoginManager()
+
+
+def init_sqlite_pragmas(app):
+    """Выполнять SQLITE_PRAGMAS на каждом новом соединении с SQLite (и с репликами)"""
+    pragmas = app.config.get("SQLITE_PRAGMAS") or {}
+    replica_pragmas = dict(pragmas, **(app.config.get("REPLICA_SQLITE_PRAGMAS") or {}))
+    for bind in [None] + app.extensions.get("db_replicas", []):
+        engine = db.get_engine(app, bind=bind)
+        selected = pragmas if bind is None else replica_pragmas
+        if selected and engine.dialect.name == "sqlite":
+            event.listen(engine, "connect", make_pragmas_listener(selected))
+
+
+def make_pragmas_listener(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute("PRAGMA {}={}".format(name, value))
+        cursor.close()
+    return set_pragmas
+
+
+def dispose_engines(app):
+    """Закрыть пулы соединений основной базы и реплик (после fork)"""
+    for bind in [None] + app.extensions.get("db_replicas", []):
+        db.get_engine(app, bind=bind).dispose()
+
+
+def init_replicas(app):
+    """Подключить SQLALCHEMY_REPLICA_URIS как binds и направлять на них GET-запросы
+
+    Клиент, который только что писал, REPLICA_STICKY_SECONDS читает с
+    основной базы (cookie REPLICA_STICKY_COOKIE) и видит свои изменения,
+    даже если реплики отстают.
+    """
+    uris = app.config.get("SQLALCHEMY_REPLICA_URIS") or []
+    binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+    replicas = []
+    for index, uri in enumerate(uris):
+        replicas.append("replica{}".format(index))
+        binds[replicas[-1]] = uri
+    app.config["SQLALCHEMY_BINDS"] = binds or None
+    app.extensions["db_replicas"] = replicas
+    if not replicas:
+        return
+    cookie = app.config["REPLICA_STICKY_COOKIE"]
+    sticky_seconds = app.config["REPLICA_STICKY_SECONDS"]
+
+    @app.before_request
+    def choose_replica():
+        if request.method not in ("GET", "HEAD"):
+            return
+        try:
+            primary_until = float(request.cookies.get(cookie, 0))
+        except ValueError:
+            primary_until = 0
+        if primary_until < time.time():
+            g.db_replica = random.choice(replicas)
+
+    @app.after_request
+    def stick_to_primary(response):
+        if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+            response.set_cookie(cookie, "{:.3f}".format(time.time() + sticky_seconds),
+                                max_age=sticky_seconds, httponly=True)
+        return response
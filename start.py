@@ -1,12 +1,54 @@
-from app import create_app
-from extensions import db
+from multiprocessing import cpu_count
 from os import getenv
 
+from gunicorn.app.base import BaseApplication
 
-app = create_app(getenv("FLASK_ENV", "production"))
+from extensions import dispose_engines
 
-with app.app_context():
-    db.create_all()
 
+def post_fork(server, worker):
+    # Соединения, открытые до fork, нельзя делить между процессами
+    from wsgi import app
+    with app.app_context():
+        dispose_engines(app)
 
-app.run(host="0.0.0.0", port=8889)
+
+class Server(BaseApplication):
+    """gunicorn с предзагрузкой приложения в мастер-процессе
+
+    Перезапуск воркеров без простоя: kill -HUP <pid мастера>.
+    """
+
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from api.startup import warm_up
+        from wsgi import app
+        # С preload_app вызывается один раз в мастере, до fork воркеров
+        warm_up(app)
+        return app
+
+
+def options():
+    return {
+        "bind": getenv("BIND", "0.0.0.0:8889"),
+        "workers": int(getenv("WEB_CONCURRENCY", cpu_count() * 2 + 1)),
+        "worker_class": "gthread",
+        "threads": int(getenv("THREADS", 4)),
+        "preload_app": True,
+        "timeout": int(getenv("TIMEOUT", 60)),
+        "graceful_timeout": int(getenv("GRACEFUL_TIMEOUT", 30)),
+        "max_requests": int(getenv("MAX_REQUESTS", 10000)),
+        "max_requests_jitter": int(getenv("MAX_REQUESTS_JITTER", 1000)),
+        "post_fork": post_fork,
+    }
+
+
+if __name__ == "__main__":
+    Server(options()).run()
@@ -0,0 +1,56 @@
+import pytest
+
+import app as app_module
+import config
+from api.models import user_cache
+from extensions import db, dispose_engines
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """Фабрика приложений на временной базе SQLite; аргументы - настройки поверх TestingConfig"""
+    apps = []
+
+    def make(**settings):
+        settings.setdefault("SQLALCHEMY_DATABASE_URI",
+                            "sqlite:///{}".format(tmp_path / "db-{}.sqlite".format(len(apps))))
+        settings.setdefault("IMPORT_DIR", str(tmp_path / "imports"))
+        settings.setdefault("EXPORT_DIR", str(tmp_path / "exports"))
+        settings.setdefault("HEALTH_LOG_DIR", str(tmp_path / "health-log"))
+        name = "pytest-{}".format(len(apps))
+        monkeypatch.setitem(app_module.CONFIG_NAME_MAPPER, name,
+                            type("PytestConfig", (config.TestingConfig,), settings))
+        application = app_module.create_app(name)
+        with application.app_context():
+            db.create_all()
+        apps.append(application)
+        return application
+
+    # Кэш пользователей - на процесс, а id в каждой новой базе начинаются с 1
+    user_cache.clear()
+    yield make
+    user_cache.clear()
+    for application in apps:
+        with application.app_context():
+            db.session.remove()
+            dispose_engines(application)
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def user_client(client):
+    """Клиент с вошедшим пользователем; форма входа не нужна, пользователь пишется в сессию"""
+    client.post("/api/v1/signup", json={"username": "tester", "password": "secret"})
+    with client.session_transaction() as session:
+        session["_user_id"] = "1"
+        session["_fresh"] = True
+    return client
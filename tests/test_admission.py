@@ -0,0 +1,71 @@
+from api.admission import WriteAdmission
+
+PATIENT = {"name": "p", "phone": "1", "birthday": "1990-01-01"}
+
+
+def count(client):
+    return len(client.get("/api/v1/patients").get_json()["patients"])
+
+
+def test_retry_is_replayed(client):
+    first = client.post("/api/v1/patients", json=PATIENT, headers={"Idempotency-Key": "k1"})
+    assert first.status_code == 201
+    retry = client.post("/api/v1/patients", json=PATIENT, headers={"Idempotency-Key": "k1"})
+    assert retry.status_code == 201
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.headers["Location"] == first.headers["Location"]
+    assert retry.get_data() == first.get_data()
+    assert count(client) == 1
+    # Без ключа или с другим ключом запрос выполняется снова
+    client.post("/api/v1/patients", json=PATIENT)
+    client.post("/api/v1/patients", json=PATIENT, headers={"Idempotency-Key": "k2"})
+    assert count(client) == 3
+
+
+def test_key_reuse_and_bad_keys(client):
+    client.post("/api/v1/patients", json=PATIENT, headers={"Idempotency-Key": "k"})
+    other = dict(PATIENT, name="q")
+    assert client.post("/api/v1/patients", json=other,
+                       headers={"Idempotency-Key": "k"}).status_code == 422
+    assert client.post("/api/v1/patients", json=PATIENT,
+                       headers={"Idempotency-Key": "x" * 256}).status_code == 400
+    assert count(client) == 1
+
+
+def test_key_in_progress_is_409(app, client):
+    with app.test_request_context("/api/v1/patients", method="POST", json=PATIENT):
+        fingerprint = WriteAdmission.fingerprint()
+    # Первый запрос с ключом еще выполняется
+    app.extensions["write_admission"].local.add("idem:ip:127.0.0.1:k", (fingerprint, None))
+    response = client.post("/api/v1/patients", json=PATIENT, headers={"Idempotency-Key": "k"})
+    assert response.status_code == 409
+    assert response.headers["Retry-After"] == "1"
+    assert count(client) == 0
+
+
+def test_rate_limit(make_app):
+    client = make_app(RATE_LIMIT_ENABLED=True, RATE_LIMIT_RATE=0.01,
+                      RATE_LIMIT_BURST=2).test_client()
+    assert [client.post("/api/v1/patients", json=PATIENT).status_code
+            for _ in range(3)] == [201, 201, 429]
+    response = client.post("/api/v1/patients", json=PATIENT)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    # Чтение не ограничивается
+    assert count(client) == 2
+
+
+def test_write_queue_timeout(make_app):
+    app = make_app(WRITE_CONCURRENCY=1, WRITE_QUEUE_TIMEOUT=0.01)
+    client = app.test_client()
+    slots = app.extensions["write_admission"].slots
+    slots.acquire()
+    try:
+        response = client.post("/api/v1/patients", json=PATIENT, headers={"Idempotency-Key": "k"})
+        assert response.status_code == 429
+    finally:
+        slots.release()
+    # Отказ по очереди не занимает ключ: повтор выполняется
+    assert client.post("/api/v1/patients", json=PATIENT,
+                       headers={"Idempotency-Key": "k"}).status_code == 201
+    assert count(client) == 1
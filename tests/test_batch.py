@@ -0,0 +1,72 @@
+import pytest
+
+from api.models import Patient
+from extensions import db
+
+
+@pytest.fixture
+def batch_app(make_app):
+    # Маленький чанк, чтобы пакет шел несколькими запросами
+    return make_app(BATCH_CHUNK_SIZE=2, BATCH_MAX_ITEMS=5)
+
+
+@pytest.fixture
+def batch_client(batch_app):
+    return batch_app.test_client()
+
+
+def patient(number):
+    return {"name": "p{}".format(number), "phone": str(number), "birthday": "1990-01-01"}
+
+
+def statuses(response):
+    return [result["status"] for result in response.get_json()["results"]]
+
+
+def test_create_reports_every_item(batch_client):
+    response = batch_client.post("/api/v1/patients:batch",
+                                 json=[patient(0), {"name": "no phone"}, patient(2), patient(3)])
+    assert response.status_code == 200
+    assert statuses(response) == [201, 400, 201, 201]
+    assert "phone" in response.get_json()["results"][1]["errors"]
+    assert len(batch_client.get("/api/v1/patients").get_json()["patients"]) == 3
+
+
+def test_update_and_delete(batch_app, batch_client):
+    created = batch_client.post("/api/v1/patients:batch",
+                                json=[patient(number) for number in range(3)]).get_json()["results"]
+    uuids = [result["uuid"] for result in created]
+    response = batch_client.patch("/api/v1/patients:batch", json=[
+        {"uuid": uuids[0], "phone": "100"}, {"uuid": uuids[1], "name": "renamed"},
+        {"uuid": "missing", "phone": "1"}, {"uuid": uuids[2], "birthday": "not a date"}])
+    assert statuses(response) == [200, 200, 404, 400]
+    first = batch_client.get("/api/v1/patients/" + uuids[0])
+    assert first.get_json()["phone"] == "100"
+    assert first.headers["ETag"] == '"2"'
+    assert batch_client.get("/api/v1/patients/" + uuids[2]).headers["ETag"] == '"1"'
+
+    response = batch_client.delete("/api/v1/patients:batch", json=[uuids[0], "missing", uuids[2]])
+    assert statuses(response) == [200, 404, 200]
+    with batch_app.app_context():
+        assert [row.uuid for row in db.session.query(Patient)] == [uuids[1]]
+
+
+@pytest.mark.parametrize("body", [{"name": "p"}, [patient(number) for number in range(6)]])
+def test_bad_batch_is_400(batch_client, body):
+    assert batch_client.post("/api/v1/patients:batch", json=body).status_code == 400
+    assert batch_client.get("/api/v1/patients").get_json()["patients"] == []
+
+
+def test_records_check_references(client):
+    doctor = client.post("/api/v1/doctors", json={"name": "d", "phone": "2", "speciality": "s",
+                                                  "qualification": "q"}).headers["Location"]
+    patient_uuid = client.post("/api/v1/patients", json=patient(0)).headers["Location"] \
+        .rsplit("/", 1)[1]
+    client.post("/api/v1/services", json={"name": "visit", "price": 10})
+    record = {"doctor_uuid": doctor.rsplit("/", 1)[1], "date": "2021-01-01T10:00:00",
+              "used_services": "visit", "disease": "flu", "discharge": "ok", "payment_status": False}
+    response = client.post("/api/v1/records:batch", json=[
+        dict(record, patient_uuid=patient_uuid), dict(record, patient_uuid="missing")])
+    assert statuses(response) == [201, 404]
+    assert response.get_json()["results"][1]["errors"] == {"patient_uuid": ["Not found"]}
+    assert len(client.get("/api/v1/records").get_json()["records"]) == 1
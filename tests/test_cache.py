@@ -0,0 +1,104 @@
+import pytest
+
+import config
+from api.cache import LRUCache
+from api.models import Patient
+from extensions import db
+
+SHARED = {}
+
+
+class SharedBackend(object):
+    """Общий кэш тестов: словарь модуля, один на все приложения, как memcached у воркеров"""
+
+    def __init__(self, app):
+        self.items = SHARED
+
+    def get(self, key):
+        return self.items.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.items[key] = value
+
+    def add(self, key, value, ttl=None):
+        return self.items.setdefault(key, value) is value
+
+    def delete(self, key):
+        self.items.pop(key, None)
+
+
+@pytest.fixture
+def shared_client(make_app):
+    SHARED.clear()
+    yield make_app(RESPONSE_CACHE_ENABLED=True,
+                   RESPONSE_CACHE_BACKEND="test_cache.SharedBackend").test_client()
+    SHARED.clear()
+
+
+def add_patient(client, name="p"):
+    return client.post("/api/v1/patients", json={"name": name, "phone": "1",
+                                                 "birthday": "1990-01-01"}).headers["Location"]
+
+
+def test_list_etag_and_invalidation(make_app):
+    client = make_app(RESPONSE_CACHE_ENABLED=True).test_client()
+    add_patient(client)
+    first = client.get("/api/v1/patients")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert client.get("/api/v1/patients", headers={"If-None-Match": etag}).status_code == 304
+    add_patient(client, "q")
+    second = client.get("/api/v1/patients", headers={"If-None-Match": etag})
+    assert second.status_code == 200
+    assert len(second.get_json()["patients"]) == 2
+
+
+def test_shared_backend_holds_generations_and_bodies(shared_client):
+    add_patient(shared_client)
+    assert len(shared_client.get("/api/v1/patients").get_json()["patients"]) == 1
+    generation = SHARED["gen:patients"]
+    assert any(key.startswith("resp:" + generation) for key in SHARED)
+    add_patient(shared_client, "q")
+    assert SHARED["gen:patients"] != generation
+    assert len(shared_client.get("/api/v1/patients").get_json()["patients"]) == 2
+
+
+def test_detail_is_not_cached(make_app):
+    app = make_app(RESPONSE_CACHE_ENABLED=True)
+    client = app.test_client()
+    location = add_patient(client)
+    etag = client.get(location).headers["ETag"]
+    assert client.get(location, headers={"If-None-Match": etag}).status_code == 304
+    # Запись другого воркера: кэш этого процесса о ней не знает
+    with app.app_context():
+        db.session.query(Patient).update({"phone": "2", "version": Patient.version + 1})
+        db.session.commit()
+    fresh = client.get(location)
+    assert fresh.headers["ETag"] != etag
+    assert fresh.get_json()["phone"] == "2"
+    assert client.patch(location, json={"phone": "3"},
+                        headers={"If-Match": fresh.headers["ETag"]}).status_code == 200
+    assert client.patch(location, json={"phone": "4"}, headers={"If-Match": etag}).status_code == 412
+
+
+def test_production_cache_needs_shared_backend():
+    if config.ProductionConfig.RESPONSE_CACHE_BACKEND:
+        pytest.skip("RESPONSE_CACHE_BACKEND is set in the environment")
+    assert not config.ProductionConfig.RESPONSE_CACHE_ENABLED
+
+
+def test_lru_cache_limits():
+    cache = LRUCache(max_entries=2, max_bytes=10, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    cache.set("big", 4, size=11)
+    assert cache.get("big") is None
+    cache.set("d", 5, size=9)
+    assert cache.get("a") is None and cache.size <= 10
+    assert cache.add("d", 6) is False
+    cache.set("e", 7, ttl=-1)
+    assert cache.get("e") is None
+    assert cache.add("e", 8) is True and cache.get("e") == 8
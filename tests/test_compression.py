@@ -0,0 +1,56 @@
+import gzip
+import zlib
+
+import pytest
+
+
+@pytest.fixture
+def patients(client):
+    client.post("/api/v1/patients:batch", json=[
+        {"name": "patient {}".format(number), "phone": str(number), "birthday": "1990-01-01"}
+        for number in range(50)])
+    return client
+
+
+def test_gzip_list(patients):
+    plain = patients.get("/api/v1/patients")
+    assert "Content-Encoding" not in plain.headers
+    assert "Accept-Encoding" in plain.headers["Vary"]
+    response = patients.get("/api/v1/patients", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.get_data()) == plain.get_data()
+    assert len(response.get_data()) < len(plain.get_data()) / 3
+    # Сжатый ответ несет слабый ETag, и он подходит для If-None-Match
+    assert response.headers["ETag"] == "W/" + plain.headers["ETag"]
+    assert patients.get("/api/v1/patients", headers={
+        "Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]}).status_code == 304
+
+
+def test_brotli_is_preferred(patients):
+    brotli = pytest.importorskip("brotli")
+    plain = patients.get("/api/v1/patients")
+    response = patients.get("/api/v1/patients", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert brotli.decompress(response.get_data()) == plain.get_data()
+
+
+def test_streamed_export_is_compressed(patients):
+    plain = patients.get("/api/v1/export/patients").get_data()
+    response = patients.get("/api/v1/export/patients", headers={"Accept-Encoding": "gzip"})
+    assert response.is_streamed
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert zlib.decompress(response.get_data(), zlib.MAX_WBITS | 16) == plain
+    assert plain.count(b"\n") == 51
+
+
+def test_small_and_disabled(make_app, client):
+    response = client.get("/api/v1/patients", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    disabled = make_app(COMPRESSION_ENABLED=False).test_client()
+    disabled.post("/api/v1/patients:batch", json=[
+        {"name": "patient {}".format(number), "phone": str(number), "birthday": "1990-01-01"}
+        for number in range(50)])
+    response = disabled.get("/api/v1/patients", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert len(response.get_json()["patients"]) == 50
@@ -0,0 +1,70 @@
+import pytest
+
+
+@pytest.fixture
+def records(client):
+    """Четыре записи двух пациентов у двух врачей, по одной в день с 1 по 4 января 2021"""
+    client.post("/api/v1/services", json={"name": "visit", "price": 10})
+    client.post("/api/v1/services", json={"name": "xray", "price": 25})
+    services = {row["name"]: row["uuid"]
+                for row in client.get("/api/v1/services").get_json()["service"]}
+    doctors = [client.post("/api/v1/doctors", json={
+        "name": name, "phone": "2", "speciality": "s", "qualification": "q"})
+        .headers["Location"].rsplit("/", 1)[1] for name in ("d0", "d1")]
+    patients = [client.post("/api/v1/patients", json={
+        "name": name, "phone": "1", "birthday": "1990-01-01"})
+        .headers["Location"].rsplit("/", 1)[1] for name in ("p0", "p1")]
+    for patient, doctor, date, used, paid in (
+            (0, 0, "2021-01-01T09:00:00", "visit", True),
+            (0, 1, "2021-01-02T23:30:00", "xray", False),
+            (1, 0, "2021-01-03T10:00:00", "visit, xray", False),
+            (1, 1, "2021-01-04T10:00:00", "visit", True)):
+        client.post("/api/v1/patients/" + patients[patient], json={
+            "doctor_uuid": doctors[doctor], "date": date, "used_services": used,
+            "disease": "flu", "discharge": "ok", "payment_status": paid})
+    return {"client": client, "services": services, "doctors": doctors, "patients": patients}
+
+
+def days(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    return [record["date"][:10] for record in response.get_json()["records"]]
+
+
+def test_filters(records):
+    client, patients, doctors = records["client"], records["patients"], records["doctors"]
+    assert days(client, "/api/v1/records") == ["2021-01-01", "2021-01-02", "2021-01-03",
+                                               "2021-01-04"]
+    assert days(client, "/api/v1/records?patient=" + patients[0]) == ["2021-01-01", "2021-01-02"]
+    assert days(client, "/api/v1/records?doctor=" + doctors[1]) == ["2021-01-02", "2021-01-04"]
+    assert days(client, "/api/v1/records?service=" + records["services"]["xray"]) == \
+        ["2021-01-02", "2021-01-03"]
+    assert days(client, "/api/v1/records?paid=true") == ["2021-01-01", "2021-01-04"]
+    assert days(client, "/api/v1/records?paid=0&doctor=" + doctors[0]) == ["2021-01-03"]
+
+
+def test_date_range(records):
+    client = records["client"]
+    # date_to без времени включает весь день, с временем - до этого момента
+    assert days(client, "/api/v1/records?date_from=2021-01-02&date_to=2021-01-03") == \
+        ["2021-01-02", "2021-01-03"]
+    assert days(client, "/api/v1/records?date_to=2021-01-02T12:00:00") == ["2021-01-01"]
+    assert days(client, "/api/v1/records?date_from=2021-01-03T10:00:00") == \
+        ["2021-01-03", "2021-01-04"]
+
+
+def test_nested_lists_apply_filters(records):
+    client, patients, doctors = records["client"], records["patients"], records["doctors"]
+    assert days(client, "/api/v1/patients/{}/records?paid=false".format(patients[1])) == \
+        ["2021-01-03"]
+    assert days(client, "/api/v1/doctors/{}/records?date_from=2021-01-03".format(doctors[0])) == \
+        ["2021-01-03"]
+    missing = "00000000-0000-0000-0000-000000000000"
+    assert client.get("/api/v1/patients/{}/records".format(missing)).status_code == 404
+
+
+@pytest.mark.parametrize("query", ["paid=maybe", "date_from=yesterday", "date_to=2021-13-01"])
+def test_bad_filter_is_400(records, query):
+    response = records["client"].get("/api/v1/records?" + query)
+    assert response.status_code == 400
+    assert response.get_json()["message"]
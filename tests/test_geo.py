@@ -0,0 +1,137 @@
+import math
+import random
+
+import pytest
+
+from api.geo import GridIndex, METERS_PER_DEGREE
+
+
+def brute_force(points, latitude, longitude, radius):
+    """Та же метрика, что у индекса, перебором всех точек"""
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+    reach = radius / METERS_PER_DEGREE
+    total = infected = 0
+    for point_latitude, point_longitude, point_infected in points.values():
+        dx = ((point_longitude - longitude + 180) % 360 - 180) * cos_lat
+        dy = point_latitude - latitude
+        if dx * dx + dy * dy <= reach * reach:
+            total += 1
+            infected += point_infected
+    return total, infected
+
+
+def random_points(rng, count):
+    """Точки у полюсов, у 180-го меридиана и по всему шару"""
+    points = {}
+    for number in range(count):
+        kind = number % 4
+        if kind == 0:
+            latitude, longitude = rng.uniform(89.5, 90), rng.uniform(-180, 180)
+        elif kind == 1:
+            latitude, longitude = rng.uniform(-90, -89.5), rng.uniform(-180, 180)
+        elif kind == 2:
+            latitude = rng.uniform(-1, 1)
+            longitude = rng.choice([rng.uniform(179.5, 180), rng.uniform(-180, -179.5)])
+        else:
+            latitude, longitude = rng.uniform(-90, 90), rng.uniform(-180, 180)
+        points[number] = (latitude, longitude, rng.random() < 0.3)
+    return points
+
+
+QUERIES = [(90, 0, 50000), (-90, 10, 50000), (89.99, 0, 20000), (89.9, 179.9, 50000),
+           (0, 180, 30000), (0, -180, 30000), (0.5, 179.99, 5000), (0.5, -179.99, 100000),
+           (45, 0, 50000), (0, 0, 0)]
+
+
+@pytest.fixture(params=[0.001, 0.01, 0.5])
+def index(request):
+    rng = random.Random(7)
+    points = random_points(rng, 4000)
+    grid = GridIndex(request.param)
+    grid.load((uuid,) + point for uuid, point in points.items())
+    queries = QUERIES + [(rng.uniform(-90, 90), rng.uniform(-180, 180), rng.uniform(10, 50000))
+                         for _ in range(40)]
+    queries += [(rng.uniform(89, 90) * rng.choice([1, -1]), rng.uniform(-180, 180),
+                 rng.uniform(10, 50000)) for _ in range(40)]
+    queries += [(rng.uniform(-1, 1), rng.choice([180, -180, 179.999, -179.999]),
+                 rng.uniform(10, 50000)) for _ in range(40)]
+    return grid, points, queries, rng
+
+
+def test_count_matches_brute_force(index):
+    grid, points, queries, _ = index
+    assert len(grid) == len(points)
+    for query in queries:
+        assert grid.count(*query) == brute_force(points, *query), query
+
+
+def test_count_after_moves_and_removals(index):
+    grid, points, queries, rng = index
+    for uuid in list(points)[::5]:
+        latitude, longitude, infected = points[uuid]
+        points[uuid] = (-latitude, rng.uniform(-180, 180), not infected)
+        grid.upsert(uuid, *points[uuid])
+    for uuid in list(points)[1::7]:
+        del points[uuid]
+        grid.remove(uuid)
+    assert len(grid) == len(points)
+    for query in queries:
+        assert grid.count(*query) == brute_force(points, *query), query
+
+
+def test_empty_cells_are_dropped(index):
+    grid, points, _, _ = index
+    for uuid in list(points):
+        grid.remove(uuid)
+    assert grid.cell_count() == 0
+    assert grid.count(90, 0, 50000) == (0, 0)
+
+
+ADDRESSES = {"Red Square": (55.7539, 37.6208), "Tverskaya 1": (55.7575, 37.6131)}
+
+
+def geocoder(app):
+    """GEOCODER тестов: адреса из ADDRESSES, прочие неизвестны"""
+    return ADDRESSES.get
+
+
+@pytest.fixture
+def geo_client(make_app):
+    return make_app(GEOCODER="test_geo.geocoder", GEO_REFRESH_SECONDS=0).test_client()
+
+
+def neighbours(client, latitude, longitude, radius):
+    return client.get("/api/v1/neighbours?lat={}&lon={}&radius={}".format(
+        latitude, longitude, radius)).get_json()
+
+
+def test_locations_by_address_and_neighbours(geo_client):
+    sick = geo_client.post("/api/v1/locations", json={"address": "Red Square",
+                                                       "health_status": True})
+    assert sick.status_code == 201
+    assert (sick.get_json()["latitude"], sick.get_json()["longitude"]) == ADDRESSES["Red Square"]
+    geo_client.post("/api/v1/locations", json={"latitude": 55.7540, "longitude": 37.6210,
+                                                "health_status": False})
+    geo_client.post("/api/v1/locations", json={"address": "Tverskaya 1", "health_status": False})
+    nearby = neighbours(geo_client, 55.7539, 37.6208, 100)
+    assert (nearby["total"], nearby["infected"], nearby["percentage"]) == (2, 1, 50.0)
+    assert neighbours(geo_client, 55.7539, 37.6208, 1000)["total"] == 3
+
+    location = sick.headers["Location"]
+    assert geo_client.patch(location, json={"address": "Tverskaya 1"}).status_code == 200
+    assert neighbours(geo_client, 55.7539, 37.6208, 100)["infected"] == 0
+    assert geo_client.delete(location).status_code == 204
+    assert neighbours(geo_client, 55.7575, 37.6131, 100)["total"] == 1
+    assert geo_client.get(location).status_code == 404
+
+
+def test_unknown_address_is_rejected(geo_client):
+    response = geo_client.post("/api/v1/locations", json={"address": "Nowhere",
+                                                           "health_status": True})
+    assert response.status_code == 400
+
+
+def test_address_needs_geocoder(client):
+    response = client.post("/api/v1/locations", json={"address": "Red Square",
+                                                       "health_status": True})
+    assert response.status_code == 400
@@ -0,0 +1,69 @@
+import pytest
+
+
+@pytest.fixture
+def patients(client):
+    for number in range(25):
+        client.post("/api/v1/patients", json={"name": "patient {}".format(number),
+                                              "phone": str(number),
+                                              "birthday": "1990-01-{:02d}".format(number % 28 + 1)})
+    return client.get("/api/v1/patients?limit=1000").get_json()["patients"]
+
+
+@pytest.mark.parametrize("url", ["/api/v1/patients", "/api/v1/patients?fields=name"])
+def test_cursor_walks_every_row_once(client, patients, url):
+    seen = []
+    cursor = None
+    while True:
+        query = "&" if "?" in url else "?"
+        page = client.get(url + query + "limit=7" + ("&after=" + cursor if cursor else ""))
+        assert page.status_code == 200
+        body = page.get_json()
+        assert len(body["patients"]) <= 7
+        seen.extend(body["patients"])
+        cursor = body["next"]
+        if cursor is None:
+            break
+    assert len(seen) == len(patients) == 25
+    assert [row["name"] for row in seen] == [row["name"] for row in patients]
+
+
+def test_cursor_orders_records_by_date_then_uuid(client):
+    """Записи с одной датой не теряются на границе страниц"""
+    patient = client.post("/api/v1/patients", json={"name": "p", "phone": "1",
+                                                    "birthday": "1990-01-01"}).headers["Location"]
+    doctor = client.post("/api/v1/doctors", json={"name": "d", "phone": "2", "speciality": "s",
+                                                  "qualification": "q"}).headers["Location"]
+    for number in range(18):
+        client.post(patient, json={"doctor_uuid": doctor.rsplit("/", 1)[1],
+                                   "date": "2021-01-0{}T10:00:00".format(number % 3 + 1),
+                                   "used_services": "", "disease": "flu", "discharge": "ok",
+                                   "payment_status": False})
+    seen = []
+    cursor = ""
+    while cursor is not None:
+        body = client.get("/api/v1/records?limit=4&after=" + cursor).get_json()
+        seen.extend((row["date"], row["uuid"]) for row in body["records"])
+        cursor = body["next"]
+    assert len(seen) == len(set(seen)) == 18
+    assert seen == sorted(seen)
+
+
+def test_last_full_page_has_no_cursor(client, patients):
+    body = client.get("/api/v1/patients?limit=25").get_json()
+    assert len(body["patients"]) == 25
+    assert body["next"] is None
+
+
+def test_cursor_skips_rows_created_before_it(client, patients):
+    first = client.get("/api/v1/patients?limit=10").get_json()
+    rest = client.get("/api/v1/patients?limit=100&after=" + first["next"]).get_json()
+    assert not {row["uuid"] for row in first["patients"]} & {row["uuid"] for row in rest["patients"]}
+    assert len(first["patients"]) + len(rest["patients"]) == 25
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", "WzEsIDJd", "eyJhIjogMX0"])
+def test_bad_cursor(client, patients, cursor):
+    response = client.get("/api/v1/patients?after=" + cursor)
+    assert response.status_code == 400
+    assert response.get_json()["message"] == "Bad cursor"
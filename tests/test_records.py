@@ -0,0 +1,97 @@
+import pytest
+
+from api.models import Record, DoctorStat, record_services
+from extensions import db
+
+
+@pytest.fixture
+def ids(client):
+    services = {}
+    for name, price in (("visit", 10), ("xray", 25)):
+        client.post("/api/v1/services", json={"name": name, "price": price})
+    for row in client.get("/api/v1/services").get_json()["service"]:
+        services[row["name"]] = row["uuid"]
+    patient = client.post("/api/v1/patients", json={"name": "p", "phone": "1",
+                                                    "birthday": "1990-01-01"}).headers["Location"]
+    doctor = client.post("/api/v1/doctors", json={"name": "d", "phone": "2", "speciality": "s",
+                                                  "qualification": "q"}).headers["Location"]
+    return {"patient": patient.rsplit("/", 1)[1], "doctor": doctor.rsplit("/", 1)[1],
+            "services": services}
+
+
+def record_body(ids, **values):
+    body = {"doctor_uuid": ids["doctor"], "date": "2021-01-01T10:00:00", "used_services": "visit",
+            "disease": "flu", "discharge": "ok", "payment_status": False}
+    body.update(values)
+    return body
+
+
+def create(client, ids, **values):
+    location = client.post("/api/v1/patients/" + ids["patient"],
+                           json=record_body(ids, **values)).headers["Location"]
+    return location.rsplit("/", 1)[1]
+
+
+def revenue(client):
+    return client.get("/api/v1/stats/revenue").get_json()["revenue"][0]["revenue"]
+
+
+def test_sum_is_computed_from_services(client, ids):
+    uuid = create(client, ids, used_services="visit, XRAY", sum=1)
+    record = client.get("/api/v1/records/" + uuid).get_json()
+    assert record["sum"] == 35
+    assert record["used_services"] == "{},{}".format(ids["services"]["visit"],
+                                                    ids["services"]["xray"])
+    assert revenue(client) == 35
+
+
+def test_unknown_service_is_400(client, ids):
+    response = client.post("/api/v1/patients/" + ids["patient"],
+                           json=record_body(ids, used_services="visit, nope"))
+    assert response.status_code == 400
+    assert "nope" in response.get_json()["message"]
+
+
+def test_patch_ignores_client_sum(client, ids):
+    uuid = create(client, ids)
+    assert client.patch("/api/v1/records/" + uuid, json={"sum": 12345}).status_code == 200
+    assert client.patch("/api/v1/records/" + uuid,
+                        json={"sum": 12345, "payment_status": True}).status_code == 200
+    assert client.get("/api/v1/records/" + uuid).get_json()["sum"] == 10
+    assert revenue(client) == 10
+
+
+def test_patch_services_recomputes_sum(client, ids):
+    uuid = create(client, ids)
+    client.patch("/api/v1/records/" + uuid, json={"used_services": ["xray"], "sum": 1})
+    assert client.get("/api/v1/records/" + uuid).get_json()["sum"] == 25
+    assert revenue(client) == 25
+    assert client.get("/api/v1/records?service=" + ids["services"]["xray"]) \
+        .get_json()["records"][0]["uuid"] == uuid
+
+
+def test_batch_ignores_client_sum(app, client, ids):
+    response = client.post("/api/v1/records:batch", json=[
+        dict(record_body(ids, sum=777), patient_uuid=ids["patient"]),
+        dict(record_body(ids, used_services="nope"), patient_uuid=ids["patient"])])
+    results = response.get_json()["results"]
+    assert [result["status"] for result in results] == [201, 400]
+    uuid = results[0]["uuid"]
+    client.patch("/api/v1/records:batch", json=[{"uuid": uuid, "sum": 777}])
+    assert client.get("/api/v1/records/" + uuid).get_json()["sum"] == 10
+    client.patch("/api/v1/records:batch", json=[{"uuid": uuid, "used_services": "visit,xray"}])
+    assert client.get("/api/v1/records/" + uuid).get_json()["sum"] == 35
+    with app.app_context():
+        assert db.session.get(DoctorStat, ids["doctor"]).revenue == 35
+        assert db.session.query(record_services).count() == 2
+
+
+def test_import_ignores_client_sum(app, client, ids):
+    body = "doctor_uuid,patient_uuid,date,used_services,disease,discharge,payment_status,sum\n" \
+           "{},{},2021-01-01T10:00:00,xray,flu,ok,false,999\n".format(ids["doctor"], ids["patient"])
+    report = client.post("/api/v1/import/records", data=body.encode(),
+                         content_type="text/csv").get_json()
+    assert report["imported"] == 1
+    with app.app_context():
+        assert db.session.query(Record.sum).scalar() == 25
+    assert revenue(client) == 25
@@ -0,0 +1,96 @@
+import importlib
+import shutil
+
+import pytest
+from sqlalchemy import exc, text
+from sqlalchemy.pool import QueuePool
+
+import config
+from extensions import db, dispose_engines
+
+PATIENT = {"name": "p", "phone": "1", "birthday": "1990-01-01"}
+
+
+@pytest.fixture
+def replicated(make_app, tmp_path):
+    """Приложение с репликой - копией основной базы, которая отстает, пока ее не скопировать"""
+    primary, replica = tmp_path / "primary.sqlite", tmp_path / "replica.sqlite"
+    # Пул соединений, как в production: для файлов SQLite по умолчанию NullPool
+    app = make_app(SQLALCHEMY_DATABASE_URI="sqlite:///{}".format(primary),
+                   SQLALCHEMY_REPLICA_URIS=["sqlite:///{}".format(replica)],
+                   SQLALCHEMY_ENGINE_OPTIONS={"poolclass": QueuePool})
+
+    def sync():
+        with app.app_context():
+            dispose_engines(app)
+        shutil.copyfile(primary, replica)
+
+    sync()
+    return app, sync
+
+
+def count(client):
+    return len(client.get("/api/v1/patients").get_json()["patients"])
+
+
+def test_reads_go_to_replica_until_sticky_cookie(replicated):
+    app, sync = replicated
+    writer, reader = app.test_client(), app.test_client()
+    response = writer.post("/api/v1/patients", json=PATIENT)
+    assert response.status_code == 201
+    assert "db_primary_until=" in response.headers["Set-Cookie"]
+    # Писавший клиент читает с основной базы, остальные - с отставшей реплики
+    assert count(writer) == 1
+    assert count(reader) == 0
+    assert reader.get(response.headers["Location"]).status_code == 404
+    sync()
+    assert count(reader) == 1
+
+
+def test_writes_never_use_replica(replicated):
+    app, sync = replicated
+    client = app.test_client()
+    location = client.post("/api/v1/patients", json=PATIENT).headers["Location"]
+    sync()
+    other = app.test_client()
+    assert other.patch(location, json={"phone": "2"}).status_code == 200
+    assert other.delete("/api/v1/patients:batch", json=[location.rsplit("/", 1)[1]]) \
+        .status_code == 200
+    with app.app_context():
+        assert db.session.execute(text("SELECT count(*) FROM patient")).scalar() == 0
+
+
+def test_replica_is_read_only(replicated):
+    app, _ = replicated
+    with app.app_context():
+        engine = db.get_engine(app, bind="replica0")
+        with pytest.raises(exc.OperationalError):
+            with engine.begin() as connection:
+                connection.execute(text("DELETE FROM patient"))
+
+
+def test_dispose_engines_closes_every_pool(replicated):
+    app, _ = replicated
+    with app.app_context():
+        engines = [db.get_engine(app, bind=bind) for bind in (None, "replica0")]
+        for engine in engines:
+            engine.connect().close()
+        assert [engine.pool.checkedin() for engine in engines] == [1, 1]
+        dispose_engines(app)
+        assert [engine.pool.checkedin() for engine in engines] == [0, 0]
+
+
+def test_replicated_config_falls_back_to_primary(monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", "postgresql://user@host/monicovid")
+    monkeypatch.delenv("DATABASE_REPLICA_URLS", raising=False)
+    try:
+        reloaded = importlib.reload(config)
+        assert reloaded.ReplicatedConfig.SQLALCHEMY_REPLICA_URIS == \
+            ["postgresql://user@host/monicovid"]
+        monkeypatch.setenv("DATABASE_REPLICA_URLS", "postgresql://r1/m,postgresql://r2/m")
+        reloaded = importlib.reload(config)
+        assert reloaded.ReplicatedConfig.SQLALCHEMY_REPLICA_URIS == \
+            ["postgresql://r1/m", "postgresql://r2/m"]
+    finally:
+        monkeypatch.undo()
+        importlib.reload(config)
@@ -0,0 +1,72 @@
+import pytest
+from sqlalchemy import text
+
+from extensions import db
+
+
+@pytest.fixture
+def people(client):
+    doctor = client.post("/api/v1/doctors", json={
+        "name": "Anna Fever", "phone": "2", "speciality": "pulmonology",
+        "qualification": "q"}).headers["Location"].rsplit("/", 1)[1]
+    client.post("/api/v1/services", json={"name": "visit", "price": 10})
+    uuids = {"doctor": doctor}
+    for name, disease in (("Ivan Coughlin", "dry cough"), ("Olga Petrova", "fever and cough"),
+                          ("Petr Ivanov", "broken arm")):
+        location = client.post("/api/v1/patients", json={"name": name, "phone": "1",
+                                                         "birthday": "1990-01-01"})
+        uuids[name] = location.headers["Location"].rsplit("/", 1)[1]
+        record = client.post(location.headers["Location"], json={
+            "doctor_uuid": doctor, "date": "2021-01-01T10:00:00", "used_services": "visit",
+            "disease": disease, "discharge": "home", "payment_status": False})
+        uuids[disease] = record.headers["Location"].rsplit("/", 1)[1]
+    return uuids
+
+
+def found(client, query):
+    response = client.get("/api/v1/search?" + query)
+    assert response.status_code == 200
+    return {(row["type"], row["uuid"]) for row in response.get_json()["results"]}
+
+
+def test_prefix_words_across_resources(client, people):
+    assert found(client, "q=cough") == {("records", people["dry cough"]),
+                                        ("records", people["fever and cough"]),
+                                        ("patients", people["Ivan Coughlin"])}
+    assert found(client, "q=fev cou") == {("records", people["fever and cough"])}
+    assert found(client, "q=fever&in=doctors,patients") == {("doctors", people["doctor"])}
+    results = client.get("/api/v1/search?q=arm").get_json()["results"]
+    assert results[0]["snippet"] == "broken [arm]"
+    assert results[0]["score"] > 0
+
+
+def test_index_follows_writes(client, people):
+    client.patch("/api/v1/patients/" + people["Petr Ivanov"], json={"name": "Petr Coughman"})
+    assert ("patients", people["Petr Ivanov"]) in found(client, "q=cough&in=patients")
+    client.delete("/api/v1/patients/" + people["Ivan Coughlin"])
+    assert found(client, "q=cough&in=patients") == {("patients", people["Petr Ivanov"])}
+
+
+def test_pages(client, people):
+    page = client.get("/api/v1/search?q=cough&limit=2").get_json()
+    assert len(page["results"]) == 2
+    rest = client.get("/api/v1/search?q=cough&limit=2&after=" + page["next"]).get_json()
+    assert len(rest["results"]) == 1 and rest["next"] is None
+    seen = {row["uuid"] for row in page["results"] + rest["results"]}
+    assert len(seen) == 3
+
+
+def test_like_fallback_without_fts(app, client, people):
+    with app.app_context():
+        db.session.execute(text("DROP TABLE patient_fts"))
+        db.session.commit()
+    assert found(client, "q=cough") == {("records", people["dry cough"]),
+                                        ("records", people["fever and cough"]),
+                                        ("patients", people["Ivan Coughlin"])}
+    assert found(client, "q=petr&in=patients") == {("patients", people["Olga Petrova"]),
+                                                   ("patients", people["Petr Ivanov"])}
+
+
+@pytest.mark.parametrize("query", ["q=", "q=%2B%2B", "q=a&in=users", "q=a&after=bad"])
+def test_bad_search_is_400(client, query):
+    assert client.get("/api/v1/search?" + query).status_code == 400
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from api.fields import patients_info_schema, doctors_info_schema, services_info_schema, \
+    records_info_schema
+from api.models import Patient, Doctor, Service, Record
+from extensions import db
+
+# Адрес списка, ключ в ответе, модель, схема
+LISTS = [("patients", "patients", Patient, patients_info_schema),
+         ("doctors", "doctor", Doctor, doctors_info_schema),
+         ("services", "service", Service, services_info_schema),
+         ("records", "records", Record, records_info_schema)]
+
+
+@pytest.fixture
+def seeded(client):
+    client.post("/api/v1/services", json={"name": "visit", "price": 10})
+    patient = client.post("/api/v1/patients", json={"name": "Анна \"A\"", "phone": "1",
+                                                    "birthday": "1990-01-01"}).headers["Location"]
+    doctor = client.post("/api/v1/doctors", json={"name": "d", "phone": "2", "speciality": "s",
+                                                  "qualification": "q"}).headers["Location"]
+    client.post(patient, json={"doctor_uuid": doctor.rsplit("/", 1)[1],
+                               "date": "2021-01-01T10:00:00", "used_services": "visit",
+                               "disease": "flu", "discharge": "ok", "payment_status": False})
+    return client
+
+
+@pytest.mark.parametrize("url, name, model, schema", LISTS)
+def test_list_matches_marshmallow_dump(app, seeded, url, name, model, schema):
+    response = seeded.get("/api/v1/" + url)
+    assert response.status_code == 200
+    assert response.mimetype == "application/json"
+    with app.app_context():
+        expected = json.loads(json.dumps(schema.dump(db.session.query(model).all())))
+    assert response.get_json()[name] == expected
+
+
+def test_sparse_fields_and_unknown_field(seeded):
+    rows = seeded.get("/api/v1/patients?fields=name,phone").get_json()["patients"]
+    assert rows == [{"name": "Анна \"A\"", "phone": "1"}]
+    assert seeded.get("/api/v1/patients?fields=nope").status_code == 400
+
+
+def test_ndjson_stream(seeded):
+    response = seeded.get("/api/v1/patients?format=ndjson")
+    assert response.mimetype == "application/x-ndjson"
+    assert [json.loads(line)["name"] for line in response.data.splitlines()] == ["Анна \"A\""]
@@ -0,0 +1,118 @@
+import threading
+
+import pytest
+from sqlalchemy import func
+
+from api.models import Record, HealthReport, DiseaseDailyStat, CaseSeries, DoctorStat, \
+    HealthStatusStat
+from api.timeseries import unpack
+from extensions import db
+
+THREADS = 6
+WRITES = 15
+
+
+@pytest.fixture
+def app(make_app):
+    # Файл в WAL с ожиданием блокировки, как в ProductionConfig: писатели идут параллельно
+    return make_app(SQLITE_PRAGMAS={"journal_mode": "WAL", "busy_timeout": 30000},
+                    SQLALCHEMY_ENGINE_OPTIONS={"connect_args": {"timeout": 30,
+                                                                "check_same_thread": False}})
+
+
+def run_threads(target):
+    errors = []
+
+    def work(number):
+        try:
+            target(number)
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=work, args=(number,)) for number in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+
+def test_rollups_match_count_after_concurrent_writes(app, client):
+    client.post("/api/v1/services", json={"name": "visit", "price": 10})
+    patient = client.post("/api/v1/patients", json={"name": "p", "phone": "1",
+                                                    "birthday": "1990-01-01"}).headers["Location"]
+    doctors = [client.post("/api/v1/doctors", json={"name": "d", "phone": str(number),
+                                                    "speciality": "s", "qualification": "q"})
+               .headers["Location"].rsplit("/", 1)[1] for number in range(2)]
+
+    def write(number):
+        worker = app.test_client()
+        for step in range(WRITES):
+            response = worker.post(patient, json={
+                "doctor_uuid": doctors[step % 2], "date": "2021-01-0{}T10:00:00".format(step % 3 + 1),
+                "used_services": "visit", "disease": ("flu", "cold")[number % 2],
+                "discharge": "ok", "payment_status": step % 4 == 0, "region": "north"})
+            assert response.status_code == 201
+            worker.post("/api/v1/health", json={"address": "a", "health_status": step % 3 == 0})
+
+    run_threads(write)
+
+    with app.app_context():
+        assert db.session.query(Record).count() == THREADS * WRITES
+        for doctor in doctors:
+            records = db.session.query(Record).filter(Record.doctor_uuid == doctor)
+            unpaid = records.filter(Record.payment_status.is_(False))
+            stat = db.session.get(DoctorStat, doctor)
+            assert stat.records == records.count()
+            assert stat.revenue == records.with_entities(func.sum(Record.sum)).scalar()
+            assert stat.unpaid_records == unpaid.count()
+            assert stat.unpaid == unpaid.with_entities(func.sum(Record.sum)).scalar()
+
+        daily = dict(((day, disease), cases) for day, disease, cases in
+                     db.session.query(DiseaseDailyStat.day, DiseaseDailyStat.disease,
+                                      DiseaseDailyStat.cases))
+        counted = db.session.query(func.date(Record.date), Record.disease, func.count()) \
+            .group_by(func.date(Record.date), Record.disease).all()
+        assert {(str(day), disease): cases for (day, disease), cases in daily.items()} == \
+            {(day, disease): cases for day, disease, cases in counted}
+
+        series = {disease: sum(unpack(counts)) for disease, counts in
+                  db.session.query(CaseSeries.disease, CaseSeries.counts)}
+        assert series == dict(db.session.query(Record.disease, func.count())
+                              .group_by(Record.disease).all())
+
+        assert dict(db.session.query(HealthStatusStat.health_status, HealthStatusStat.reports)) == \
+            dict(db.session.query(HealthReport.health_status, func.count())
+                 .group_by(HealthReport.health_status).all())
+
+
+def test_rollups_follow_concurrent_updates_and_deletes(app, client):
+    patient = client.post("/api/v1/patients", json={"name": "p", "phone": "1",
+                                                    "birthday": "1990-01-01"}).headers["Location"]
+    doctor = client.post("/api/v1/doctors", json={"name": "d", "phone": "2", "speciality": "s",
+                                                  "qualification": "q"}).headers["Location"]
+    doctor = doctor.rsplit("/", 1)[1]
+    for step in range(THREADS * 4):
+        client.post(patient, json={"doctor_uuid": doctor, "date": "2021-01-01T10:00:00",
+                                   "used_services": "", "disease": "flu",
+                                   "discharge": "ok", "payment_status": False})
+    uuids = [row["uuid"] for row in client.get("/api/v1/records?limit=1000").get_json()["records"]]
+
+    def change(number):
+        worker = app.test_client()
+        for uuid in uuids[number * 4:number * 4 + 4]:
+            if number % 2:
+                assert worker.delete("/api/v1/records/" + uuid).status_code == 200
+            else:
+                assert worker.patch("/api/v1/records/" + uuid,
+                                    json={"payment_status": True}).status_code == 200
+
+    run_threads(change)
+
+    with app.app_context():
+        stat = db.session.get(DoctorStat, doctor)
+        assert stat.records == db.session.query(Record).count() == THREADS * 2
+        assert stat.unpaid_records == \
+            db.session.query(Record).filter(Record.payment_status.is_(False)).count() == 0
+        assert stat.revenue == db.session.query(func.coalesce(func.sum(Record.sum), 0)).scalar()
+        assert db.session.query(func.sum(DiseaseDailyStat.cases)).scalar() == THREADS * 2
@@ -0,0 +1,173 @@
+import json
+import os
+
+import pytest
+
+from api.jobs import claim, run_job
+from api.models import Job
+from extensions import db
+
+RESOURCES = ("services", "doctors", "patients", "records")
+
+
+@pytest.fixture
+def seeded(client):
+    for number in range(3):
+        client.post("/api/v1/services", json={"name": "service {}".format(number),
+                                              "price": 10 * (number + 1)})
+    doctor = client.post("/api/v1/doctors", json={"name": "d", "phone": "2", "speciality": "s",
+                                                  "qualification": "q"}).headers["Location"]
+    for number in range(5):
+        patient = client.post("/api/v1/patients", json={
+            "name": "patient, \"{}\"".format(number), "phone": str(number),
+            "birthday": "1990-01-0{}".format(number + 1)}).headers["Location"]
+        client.post(patient, json={"doctor_uuid": doctor.rsplit("/", 1)[1],
+                                   "date": "2021-01-0{}T10:00:00".format(number + 1),
+                                   "used_services": "service 0, service {}".format(number % 3),
+                                   "disease": "flu", "discharge": "ok",
+                                   "payment_status": number % 2 == 0, "region": "north"})
+    return client
+
+
+def export_all(client, name):
+    exported = {}
+    for resource in RESOURCES:
+        response = client.get("/api/v1/export/{}?format={}".format(resource, name))
+        assert response.status_code == 200
+        exported[resource] = response.data
+    return exported
+
+
+@pytest.mark.parametrize("name", ["csv", "columns"])
+def test_export_import_round_trip(make_app, seeded, name):
+    exported = export_all(seeded, name)
+    target = make_app().test_client()
+    for resource in RESOURCES:
+        if name == "columns":
+            # Выгрузка по колонкам - {колонка: [значения]}, загрузка - строка на объект
+            body = b"".join(json.dumps(dict(zip(chunk, row))).encode("utf-8") + b"\n"
+                            for chunk in map(json.loads, exported[resource].splitlines())
+                            for row in zip(*chunk.values()))
+            response = target.post("/api/v1/import/" + resource, data=body,
+                                   content_type="application/x-ndjson")
+        else:
+            response = target.post("/api/v1/import/" + resource, data=exported[resource],
+                                   content_type="text/csv")
+        report = response.get_json()
+        assert response.status_code == 200
+        assert report["rejected"] == 0, report["rejected_rows"]
+        assert report["imported"] == report["read"] > 0
+    assert export_all(target, name) == exported
+    assert target.get("/api/v1/stats/revenue").get_json() == \
+        seeded.get("/api/v1/stats/revenue").get_json()
+
+
+def test_reimport_rejects_existing_uuids(seeded):
+    exported = seeded.get("/api/v1/export/patients").data
+    report = seeded.post("/api/v1/import/patients", data=exported,
+                         content_type="text/csv").get_json()
+    assert report["imported"] == 0
+    assert report["rejected"] == report["read"] == 5
+    assert {row["status"] for row in report["rejected_rows"]} == {409}
+
+
+def test_rejected_rows_do_not_echo_content(client):
+    report = client.post("/api/v1/import/patients", data=b"name,phone,birthday\nsecret,,\n",
+                         content_type="text/csv").get_json()
+    assert report["rejected"] == 1
+    assert "secret" not in json.dumps(report)
+
+
+def test_background_import_and_export(app, seeded, user_client):
+    response = user_client.post("/api/v1/import/patients?background=true",
+                                data=b"name,phone,birthday\nnew,7,2000-01-01\n",
+                                content_type="text/csv")
+    assert response.status_code == 202
+    export = user_client.post("/api/v1/jobs", json={"kind": "export",
+                                                    "params": {"resource": "patients"}})
+    assert export.status_code == 202
+    with app.app_context():
+        for _ in range(2):
+            run_job(claim("pytest"))
+    result = seeded.get(response.headers["Location"] + "/result").get_json()["result"]
+    assert result["imported"] == 1
+    path = seeded.get(export.headers["Location"] + "/result").get_json()["result"]["path"]
+    assert os.path.dirname(os.path.realpath(path)) == os.path.realpath(app.config["EXPORT_DIR"])
+    with open(path, "rb") as exported:
+        assert exported.read().count(b"\n") == 7
+    assert os.listdir(app.config["IMPORT_DIR"]) == []
+
+
+def test_background_import_requires_login(app, client):
+    response = client.post("/api/v1/import/patients?background=true",
+                           data=b"name,phone,birthday\nnew,7,2000-01-01\n", content_type="text/csv")
+    assert response.status_code in (302, 401)
+    imports = app.config["IMPORT_DIR"]
+    assert not os.path.isdir(imports) or os.listdir(imports) == []
+    with app.app_context():
+        assert db.session.query(Job).count() == 0
+
+
+def test_cancel_requires_login_and_removes_upload(app, user_client):
+    response = user_client.post("/api/v1/import/patients?background=true",
+                                data=b"name,phone,birthday\nnew,7,2000-01-01\n",
+                                content_type="text/csv")
+    location = response.headers["Location"]
+    assert len(os.listdir(app.config["IMPORT_DIR"])) == 1
+    with user_client.session_transaction() as session:
+        session.clear()
+    assert user_client.delete(location).status_code in (302, 401)
+    assert len(os.listdir(app.config["IMPORT_DIR"])) == 1
+    with user_client.session_transaction() as session:
+        session["_user_id"] = "1"
+        session["_fresh"] = True
+    assert user_client.delete(location).status_code == 202
+    assert user_client.get(location).get_json()["status"] == "cancelled"
+    assert os.listdir(app.config["IMPORT_DIR"]) == []
+
+
+def test_failed_import_job_removes_upload(app):
+    imports = app.config["IMPORT_DIR"]
+    os.makedirs(imports, exist_ok=True)
+    path = os.path.join(imports, "upload.bin")
+    with open(path, "wb") as upload:
+        upload.write(b"name,phone\n")
+    with app.app_context():
+        job = Job(kind="import", params=json.dumps({"resource": "patients", "path": path}))
+        db.session.add(job)
+        db.session.commit()
+        run_job(claim("pytest"))
+        assert db.session.get(Job, job.uuid).status == "failed"
+    assert os.listdir(imports) == []
+
+
+def test_jobs_require_login(client):
+    response = client.post("/api/v1/jobs", json={"kind": "rebuild-stats"})
+    assert response.status_code in (302, 401)
+
+
+@pytest.mark.parametrize("path", ["/etc/passwd", "{imports}/../db-0.sqlite", "{imports}",
+                                  "{imports}/missing.csv", "{imports}/link.csv", 17])
+def test_import_job_is_confined_to_import_dir(app, user_client, path):
+    imports = app.config["IMPORT_DIR"]
+    os.makedirs(imports, exist_ok=True)
+    os.symlink("/etc/passwd", os.path.join(imports, "link.csv"))
+    if isinstance(path, str):
+        path = path.format(imports=imports)
+    response = user_client.post("/api/v1/jobs", json={
+        "kind": "import", "params": {"resource": "patients", "path": path, "format": "csv"}})
+    assert response.status_code == 400
+    assert "IMPORT_DIR" in response.get_json()["message"]
+
+
+def test_queued_import_outside_import_dir_fails(app):
+    """Задача в очереди в обход проверки при создании все равно не читает чужой файл"""
+    with app.app_context():
+        job = Job(kind="import", params=json.dumps({"resource": "patients",
+                                                    "path": "/etc/passwd", "format": "csv"}))
+        db.session.add(job)
+        db.session.commit()
+        run_job(claim("pytest"))
+        job = db.session.get(Job, job.uuid)
+        assert job.status == "failed"
+        assert "IMPORT_DIR" in job.error
@@ -0,0 +1,73 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+# (дата, болезнь, регион) записей; 2020 - високосный, ряд на стыке лет
+CASES = [("2020-12-30", "flu", "north"), ("2020-12-31", "flu", "north"),
+         ("2020-12-31", "flu", "south"), ("2021-01-01", "flu", "north"),
+         ("2021-01-01", "cold", "north"), ("2021-01-04", "flu", "north"),
+         ("2021-02-01", "flu", "north")]
+
+
+@pytest.fixture
+def cases(client):
+    client.post("/api/v1/services", json={"name": "visit", "price": 10})
+    doctor = client.post("/api/v1/doctors", json={"name": "d", "phone": "2", "speciality": "s",
+                                                  "qualification": "q"}).headers["Location"]
+    patient = client.post("/api/v1/patients", json={"name": "p", "phone": "1",
+                                                    "birthday": "1990-01-01"}).headers["Location"]
+    records = []
+    for day, disease, region in CASES:
+        records.append(client.post(patient, json={
+            "doctor_uuid": doctor.rsplit("/", 1)[1], "date": day + "T10:00:00",
+            "used_services": "visit", "disease": disease, "discharge": "ok",
+            "payment_status": False, "region": region}).headers["Location"])
+    return records
+
+
+def trends(client, query):
+    response = client.get("/api/v1/trends?" + query)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_daily_counts_across_years(client, cases):
+    result = trends(client, "date_from=2020-12-29&date_to=2021-01-04&window=2")
+    assert result["resolution"] == "day"
+    assert result["periods"][0] == "2020-12-29" and result["periods"][-1] == "2021-01-04"
+    assert result["cases"] == [0, 1, 2, 2, 0, 0, 1]
+    assert result["moving_average"] == [None, 0.5, 1.5, 2.0, 1.0, 0.0, 0.5]
+    assert result["growth"] == [None, None, 1.0, 0.0, -1.0, None, None]
+
+
+def test_filters_and_resolutions(client, cases):
+    query = "date_from=2020-12-28&date_to=2021-02-28"
+    assert trends(client, query + "&disease=flu&region=north&resolution=day")["cases"][2:5] == \
+        [1, 1, 1]
+    weekly = trends(client, query + "&disease=flu&resolution=week")
+    # Недели с понедельника: 28.12, 04.01, ...
+    assert weekly["periods"][:2] == ["2020-12-28", "2021-01-04"]
+    assert weekly["cases"][:2] == [4, 1]
+    assert sum(weekly["cases"]) == 6
+    monthly = trends(client, query + "&resolution=month")
+    assert monthly["periods"] == ["2020-12-01", "2021-01-01", "2021-02-01"]
+    assert monthly["cases"] == [3, 3, 1]
+    assert monthly["window"] == 3
+
+
+def test_series_follow_record_writes(client, cases):
+    query = "date_from=2020-12-30&date_to=2021-01-01&disease=cold"
+    assert trends(client, query)["cases"] == [0, 0, 1]
+    client.patch(cases[4], json={"date": "2020-12-30T10:00:00"})
+    assert trends(client, query)["cases"] == [1, 0, 0]
+    client.delete(cases[4])
+    assert trends(client, query)["cases"] == [0, 0, 0]
+    series = client.get("/api/v1/trends/series").get_json()["series"]
+    assert {"disease": "flu", "region": "north", "first_year": 2020, "last_year": 2021} in series
+
+
+@pytest.mark.parametrize("query", ["date_from=2021-02-01&date_to=2021-01-01",
+                                   "date_from=1900-01-01&date_to=2021-01-01",
+                                   "resolution=year", "window=0", "window=x"])
+def test_bad_trends_query_is_400(client, query):
+    assert client.get("/api/v1/trends?" + query).status_code == 400
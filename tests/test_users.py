@@ -0,0 +1,75 @@
+import pytest
+from sqlalchemy import event
+from werkzeug.security import check_password_hash
+
+from api.models import User, user_cache
+from extensions import db
+
+
+def logged_in(client):
+    """Пускает ли API клиента к @login_required: неизвестная задача - 400, аноним - 302"""
+    status = client.post("/api/v1/jobs", json={"kind": "unknown"}).status_code
+    assert status in (302, 400)
+    return status == 400
+
+
+@pytest.fixture
+def user_queries(app):
+    """Список SELECT из таблицы users, выполненных приложением"""
+    queries = []
+
+    def remember(connection, cursor, statement, parameters, context, executemany):
+        if statement.startswith("SELECT") and "FROM users" in statement:
+            queries.append(statement)
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", remember)
+    yield queries
+    with app.app_context():
+        event.remove(db.engine, "before_cursor_execute", remember)
+
+
+def test_session_user_is_cached(user_client, user_queries):
+    for _ in range(3):
+        assert logged_in(user_client)
+    assert len(user_queries) == 1
+    assert user_cache.get("1").username == "tester"
+
+
+def test_logout_forgets_user(user_client, user_queries):
+    logged_in(user_client)
+    assert user_client.get("/api/v1/logout").status_code == 302
+    assert user_cache.get("1") is None
+    assert not logged_in(user_client)
+
+
+def test_cache_can_be_disabled(make_app):
+    app = make_app(USER_CACHE_TTL=0)
+    client = app.test_client()
+    client.post("/api/v1/signup", json={"username": "tester", "password": "secret"})
+    with client.session_transaction() as session:
+        session["_user_id"] = "1"
+    assert logged_in(client)
+    assert user_cache.get("1") is None
+
+
+def test_password_change_forgets_user(app, user_client):
+    logged_in(user_client)
+    assert user_cache.get("1") is not None
+    with app.app_context():
+        user = db.session.get(User, 1)
+        user.set_password("changed")
+        db.session.commit()
+        assert user_cache.get("1") is None
+        assert user.check_password("changed") and not user.check_password("secret")
+
+
+def test_signup_hashes_with_configured_method(app, client):
+    assert client.post("/api/v1/signup", json={"username": "u", "password": "pw"}) \
+        .status_code == 201
+    assert client.post("/api/v1/signup", json={"username": "u", "password": "other"}) \
+        .status_code == 409
+    with app.app_context():
+        stored = db.session.query(User.password).filter(User.username == "u").scalar()
+    assert stored.startswith(app.config["PASSWORD_HASH_METHOD"] + "$")
+    assert check_password_hash(stored, "pw")
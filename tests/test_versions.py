@@ -0,0 +1,70 @@
+import pytest
+
+
+@pytest.fixture
+def patient(client):
+    return client.post("/api/v1/patients", json={"name": "a", "phone": "1",
+                                                 "birthday": "1990-01-01"}).headers["Location"]
+
+
+@pytest.fixture
+def record(client, patient):
+    doctor = client.post("/api/v1/doctors", json={"name": "d", "phone": "2", "speciality": "s",
+                                                  "qualification": "q"}).headers["Location"]
+    client.post(patient, json={"doctor_uuid": doctor.rsplit("/", 1)[1],
+                               "date": "2021-01-01T10:00:00", "used_services": "",
+                               "disease": "flu", "discharge": "ok", "payment_status": False})
+    return "/api/v1/records/" + client.get("/api/v1/records").get_json()["records"][0]["uuid"]
+
+
+def test_etag_is_the_row_version(client, patient):
+    assert client.get(patient).headers["ETag"] == '"1"'
+    response = client.patch(patient, json={"name": "b"}, headers={"If-Match": '"1"'})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"2"'
+    assert client.get(patient).headers["ETag"] == '"2"'
+    assert client.get(patient).get_json()["name"] == "b"
+
+
+def test_stale_if_match_is_412(client, patient):
+    client.patch(patient, json={"name": "b"}, headers={"If-Match": '"1"'})
+    response = client.patch(patient, json={"name": "c"}, headers={"If-Match": '"1"'})
+    assert response.status_code == 412
+    assert response.get_json()["version"] == 2
+    assert response.headers["ETag"] == '"2"'
+    assert client.get(patient).get_json()["name"] == "b"
+
+
+def test_stale_body_version_is_409(client, patient):
+    assert client.patch(patient, json={"name": "b", "version": 1}).status_code == 200
+    response = client.patch(patient, json={"name": "c", "version": 1})
+    assert response.status_code == 409
+    assert response.get_json()["version"] == 2
+    assert client.get(patient).get_json()["name"] == "b"
+
+
+def test_weak_etag_and_star(client, patient):
+    assert client.patch(patient, json={"name": "b"}, headers={"If-Match": 'W/"1"'}).status_code == 200
+    # "*" совпадает с любой версией существующей строки
+    assert client.patch(patient, json={"name": "c"}, headers={"If-Match": "*"}).status_code == 200
+
+
+def test_unconditional_patch_bumps_version(client, patient):
+    assert client.patch(patient, json={"name": "b"}).status_code == 200
+    assert client.get(patient).headers["ETag"] == '"2"'
+
+
+def test_missing_row_is_404(client, patient):
+    missing = patient[:-12] + "000000000000"
+    assert client.patch(missing, json={"name": "b"}, headers={"If-Match": '"1"'}).status_code == 404
+
+
+def test_record_orm_patch_checks_version(client, record):
+    """Поля агрегатов меняются через ORM (claim_version), а не одним UPDATE"""
+    assert client.patch(record, json={"payment_status": True},
+                        headers={"If-Match": '"1"'}).status_code == 200
+    response = client.patch(record, json={"payment_status": False}, headers={"If-Match": '"1"'})
+    assert response.status_code == 412
+    assert response.get_json()["version"] == 2
+    assert client.get(record).get_json()["payment_status"] is True
+    assert client.get("/api/v1/stats/unpaid").get_json()["records"] == 0
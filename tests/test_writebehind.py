@@ -0,0 +1,104 @@
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func
+
+from api.models import HealthReport, HealthStatusStat
+from api.writebehind import health_buffer
+from extensions import db
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Процесс принимает отметки и падает, не сбросив буфер
+CRASH = """
+import os, sys
+import app as app_module, config
+app_module.CONFIG_NAME_MAPPER["crash"] = type("CrashConfig", (config.TestingConfig,), {
+    "SQLALCHEMY_DATABASE_URI": sys.argv[1], "HEALTH_LOG_DIR": sys.argv[2],
+    "HEALTH_WRITE_BEHIND": True, "HEALTH_FLUSH_INTERVAL": 3600})
+client = app_module.create_app("crash").test_client()
+for number in range(int(sys.argv[3])):
+    assert client.post("/api/v1/health", json={"address": "a",
+                                               "health_status": number % 2 == 0}).status_code == 202
+os._exit(1)
+"""
+
+
+@pytest.fixture
+def app(make_app):
+    application = make_app(HEALTH_WRITE_BEHIND=True, HEALTH_FLUSH_INTERVAL=3600)
+    os.makedirs(application.config["HEALTH_LOG_DIR"])
+    yield application
+    if health_buffer.pid == os.getpid():
+        health_buffer.close()
+    health_buffer.pid = None
+
+
+def report(uuid, health_status=True):
+    return json.dumps({"uuid": uuid, "address": "a", "health_status": health_status,
+                       "created": datetime(2026, 1, 1).isoformat()}) + "\n"
+
+
+def write_segment(app, name, *lines):
+    with open(os.path.join(app.config["HEALTH_LOG_DIR"], name), "w") as segment:
+        segment.write("".join(lines))
+
+
+def stored(app):
+    with app.app_context():
+        reports = dict(db.session.query(HealthReport.health_status, func.count())
+                       .group_by(HealthReport.health_status).all())
+        assert dict(db.session.query(HealthStatusStat.health_status,
+                                     HealthStatusStat.reports)) == reports
+        return sum(reports.values())
+
+
+def test_reports_of_a_crashed_process_are_recovered_on_restart(app, client):
+    result = subprocess.run([sys.executable, "-c", CRASH, app.config["SQLALCHEMY_DATABASE_URI"],
+                             app.config["HEALTH_LOG_DIR"], "5"], cwd=ROOT, capture_output=True)
+    assert result.returncode == 1, result.stderr.decode()
+    assert stored(app) == 0
+    assert len(os.listdir(app.config["HEALTH_LOG_DIR"])) == 1
+
+    assert client.post("/api/v1/health", json={"address": "b", "health_status": False}) \
+        .status_code == 202
+    assert stored(app) == 5
+    with app.app_context():
+        assert health_buffer.flush() == 1
+    assert stored(app) == 6
+    assert os.listdir(app.config["HEALTH_LOG_DIR"]) == [os.path.basename(health_buffer.path)]
+
+
+def test_segments_of_a_previous_process_with_the_same_pid(app, client):
+    """В контейнере перезапущенный процесс часто получает тот же pid"""
+    pid = os.getpid()
+    write_segment(app, "{}-deadbeef0000-1.log".format(pid), report("u1"), report("u2", False),
+                  '{"uuid": "u3", "addr')
+    write_segment(app, "{}-1.log".format(pid), report("u4"))
+    with app.app_context():
+        # Отметка, которую прежний процесс успел записать в базу
+        db.session.add(HealthReport(uuid="u1", address="a", health_status=True,
+                                    created=datetime(2026, 1, 1)))
+        db.session.commit()
+
+    client.post("/api/v1/health", json={"address": "b", "health_status": True})
+    with app.app_context():
+        uuids = {uuid for uuid, in db.session.query(HealthReport.uuid)}
+    assert {"u1", "u2", "u4"} <= uuids
+    assert len(uuids) == 3
+    assert os.listdir(app.config["HEALTH_LOG_DIR"]) == [os.path.basename(health_buffer.path)]
+
+
+def test_segments_of_live_processes_are_left_alone(app, client):
+    live = "{}-cafe00000000-1.log".format(os.getppid())
+    write_segment(app, live, report("u1"))
+    client.post("/api/v1/health", json={"address": "b", "health_status": True})
+    with app.app_context():
+        assert health_buffer.flush() == 1
+    assert stored(app) == 1
+    assert sorted(os.listdir(app.config["HEALTH_LOG_DIR"])) == \
+        sorted([live, os.path.basename(health_buffer.path)])
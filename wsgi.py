@@ -0,0 +1,8 @@
+from os import getenv
+
+from app import create_app
+
+
+# Точка входа для WSGI-серверов: gunicorn wsgi:app
+# Схема базы создается отдельно: FLASK_APP=wsgi flask init-db
+app = create_app(getenv("FLASK_ENV", "production"))